@@ -299,6 +299,15 @@ export async function exportSalesReportCSV(filters){
   return r.blob()
 }
 
+export async function exportReceiptsZip(payload){
+  const r = await fetch(`${BASE}/admin/orders/receipts.zip`, { method:'POST', headers: authHeaders({ 'Accept':'application/zip, application/json' }), body: JSON.stringify(payload || {}) })
+  if(r.status === 401) throw new Error('No autorizado')
+  if(r.status === 403) throw new Error('Solo administradores')
+  if(r.status === 400){ const j = await r.json().catch(()=>({})); throw new Error(j?.detail || 'Filtros invalidos') }
+  if(!r.ok) throw new Error('No se pudo exportar los comprobantes')
+  return r.blob()
+}
+
 export async function downloadSalesReportBlob(id){
   const r = await fetch(`${BASE}/admin/reports/sales/${id}/download`, { headers: authHeaders({ 'Accept':'*/*' }) })
   if(r.status === 401) throw new Error('No autorizado')
@@ -376,8 +385,9 @@ export async function adminAdjustStock(id, amount){
 }
 
 // --- Admin ML / Estadsticas ---
-export async function adminMLTrain(scope='total'){
-  const r = await fetch(`${BASE}/admin/ml/train`, { method:'POST', headers: authHeaders(), body: JSON.stringify({ scope }) })
+// async: encola el reentrenamiento (202) si ya hay modelo; el backend solo entrena en linea la primera vez
+export async function adminMLTrain(scope='total', { async = true } = {}){
+  const r = await fetch(`${BASE}/admin/ml/train`, { method:'POST', headers: authHeaders(), body: JSON.stringify({ scope, async }) })
   if(r.status === 401) throw new Error('No autorizado')
   if(r.status === 403) throw new Error('Solo administradores')
   if(!r.ok) throw new Error('No se pudo entrenar el modelo')
@@ -396,6 +406,16 @@ export async function adminMLPredict({ scope='total', months=6, category_id=null
   return r.json()
 }
 
+export async function adminMLPredictBatch({ scope='category', category_ids=[], months=6, horizons=null, interval=0.8 }={}){
+  const body = { scope, category_ids, months, interval }
+  if(horizons) body.horizons = horizons
+  const r = await fetch(`${BASE}/admin/ml/predict/batch`, { method:'POST', headers: authHeaders(), body: JSON.stringify(body) })
+  if(r.status === 401) throw new Error('No autorizado')
+  if(r.status === 403) throw new Error('Solo administradores')
+  if(!r.ok) throw new Error('No se pudo predecir')
+  return r.json()
+}
+
 export async function adminHistorical(group='monthly', start='', end='', extra={}){
   const qs = new URLSearchParams()
   if(group) qs.set('group', group)
@@ -1,7 +1,7 @@
 import React, { useEffect, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { isAdmin } from '../utils/auth'
-import { listBrands, listCategories, listSalesReports, generateSalesReport, listAuditReports, generateAuditReport, exportSalesReportCSV, downloadSalesReportBlob, downloadAuditReportBlob } from '../api/api'
+import { listBrands, listCategories, listSalesReports, generateSalesReport, listAuditReports, generateAuditReport, exportSalesReportCSV, exportReceiptsZip, downloadSalesReportBlob, downloadAuditReportBlob } from '../api/api'
 
 export default function AdminReports(){
   const nav = useNavigate()
@@ -14,6 +14,7 @@ export default function AdminReports(){
   const [auditReports, setAuditReports] = useState([])
   const [generatingAudit, setGeneratingAudit] = useState(false)
   const [exportingCSV, setExportingCSV] = useState(false)
+  const [exportingZip, setExportingZip] = useState(false)
 
   useEffect(()=>{ if(!isAdmin()) nav('/') }, [])
 
@@ -46,6 +47,15 @@ export default function AdminReports(){
     } catch(e){ alert(e.message) }
     finally{ setExportingCSV(false) }
   }
+  const exportZip = async () => {
+    setExportingZip(true)
+    try{
+      const blob = await exportReceiptsZip({ date_from: salesFilters.date_from, date_to: salesFilters.date_to, include_report: true })
+      const url = URL.createObjectURL(blob)
+      const a = document.createElement('a'); a.href = url; a.download = 'comprobantes.zip'; document.body.appendChild(a); a.click(); a.remove(); URL.revokeObjectURL(url)
+    } catch(e){ alert(e.message) }
+    finally{ setExportingZip(false) }
+  }
   const genAudit = async () => {
     setGeneratingAudit(true)
     try{ const rep = await generateAuditReport(auditFilters); setAuditReports(r=>[rep, ...r]) } catch(e){ alert(e.message) }
@@ -65,6 +75,7 @@ export default function AdminReports(){
           <input type="number" placeholder="Max precio" value={salesFilters.max_price} onChange={e=>setSalesFilters(f=>({...f, max_price:e.target.value}))} className="rounded-lg border dark:border-neutral-700 px-3 py-2 text-sm" />
           <div className="md:col-span-6 flex justify-end gap-2">
             <button className="btn" disabled={exportingCSV} onClick={exportCSV}>{exportingCSV?'Exportando…':'Exportar CSV'}</button>
+            <button className="btn" disabled={exportingZip || (!salesFilters.date_from && !salesFilters.date_to)} onClick={exportZip} title="Comprobantes de las ordenes pagadas del intervalo + reporte PDF">{exportingZip?'Exportando…':'Comprobantes ZIP'}</button>
             <button className="btn btn-primary" disabled={generatingSales} onClick={genSales}>{generatingSales?'Generando…':'Generar PDF'}</button>
           </div>
         </div>
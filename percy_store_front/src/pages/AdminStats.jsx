@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom'
 import { isAdmin } from '../utils/auth'
 import {
   adminMLPredict,
+  adminMLPredictBatch,
   adminMLTrain,
   adminHistorical,
   adminPromptReport,
@@ -123,6 +124,8 @@ export default function AdminStats() {
   const categoryChartRef = useRef(null)
   const topCanvasRef = useRef(null)
   const topChartRef = useRef(null)
+  // pronosticos de todas las categorias, pedidos en un solo request
+  const categoryForecastRef = useRef(null)
   const [categoryShare, setCategoryShare] = useState([])
   const [topProducts, setTopProducts] = useState([])
   const [reportPrompt, setReportPrompt] = useState('')
@@ -188,12 +191,19 @@ export default function AdminStats() {
     }
     setLoading(true); setError('')
     try {
-      await adminMLTrain('category').catch(() => {})
       const h = await adminHistorical('monthly', '', '', { category_id: id })
       const histData = Array.isArray(h?.results) ? h.results : []
       setHist(histData)
-      const p = await adminMLPredict({ scope: 'category', months: 6, category_id: id })
-      const predData = Array.isArray(p?.results) ? p.results : []
+      if (!categoryForecastRef.current) {
+        await adminMLTrain('category').catch(() => {})
+        const ids = categories.map(c => c.id)
+        if (!ids.includes(Number(id))) ids.push(Number(id))
+        const batch = await adminMLPredictBatch({ scope: 'category', category_ids: ids, months: 6 })
+        const byCategory = {}
+        for (const row of (Array.isArray(batch?.results) ? batch.results : [])) byCategory[row.category_id] = row.forecast || []
+        categoryForecastRef.current = byCategory
+      }
+      const predData = categoryForecastRef.current[Number(id)] || []
       setPred(predData.length ? predData : buildFallbackPredictions(histData))
     } catch (e) {
       setError(e?.message || 'No se pudo cargar categoria')
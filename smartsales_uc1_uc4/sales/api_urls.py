@@ -10,10 +10,11 @@ from .views import (order_receipt_pdf2 as order_receipt_pdf,
     AdminProductListCreateView, AdminProductDetailView, AdminProductAdjustStockView,
     AdminUserListCreateView, AdminUserDetailView,
     ChangeEmailView, ChangePhoneView,
-    AdminSalesReportList, AdminSalesReportCreate, AdminSalesReportDownload, AdminSalesReportExportCSV,
-    AdminAuditReportList, AdminAuditReportCreate, AdminAuditReportDownload,
+    AdminSalesReportList, AdminSalesReportCreate, AdminSalesReportDownload, AdminSalesReportExportCSV, AdminSalesReportExportColumnar,
+    AdminAuditReportList, AdminAuditReportCreate, AdminAuditReportDownload, AdminAuditLogList,
+    AdminReportJobListCreate, AdminReportJobDetail, AdminReportJobDownload,
     PaymentStartQRView, StripeWebhookView, MercadoPagoWebhookView, CucuWebhookView, BNBWebhookView, AdminPendingPaymentsList, AdminCreateLocalSale,
-    AdminMLTrain, AdminMLPredict, AdminHistoricalSales, AdminPromptReportView, AdminAIAdvisorView, CatalogAIAdvisorView, AdminOrderCustomerInfoView,
+    AdminMLTrain, AdminMLTrainJobList, AdminMLTrainJobDetail, AdminMLPredict, AdminMLPredictBatch, AdminHistoricalSales, AdminPromptReportView, AdminAIAdvisorView, CatalogAIAdvisorView, AdminOrderCustomerInfoView, AdminOrderReceiptsZip,
     OrderDetailOwnerView,
 )
 from rest_framework_simplejwt.views import TokenRefreshView
@@ -46,10 +47,16 @@ urlpatterns = [
     path('admin/reports/sales/generate', AdminSalesReportCreate.as_view(), name='admin-sales-generate'),
     path('admin/reports/sales/<int:pk>/download', AdminSalesReportDownload.as_view(), name='admin-sales-download'),
     path('admin/reports/sales/export-csv', AdminSalesReportExportCSV.as_view(), name='admin-sales-export-csv'),
+    path('admin/reports/sales/export-columnar', AdminSalesReportExportColumnar.as_view(), name='admin-sales-export-columnar'),
     # Reportes auditorÃƒÂ­a
     path('admin/reports/audit', AdminAuditReportList.as_view(), name='admin-audit-reports'),
     path('admin/reports/audit/generate', AdminAuditReportCreate.as_view(), name='admin-audit-generate'),
     path('admin/reports/audit/<int:pk>/download', AdminAuditReportDownload.as_view(), name='admin-audit-download'),
+    path('admin/audit/logs', AdminAuditLogList.as_view(), name='admin-audit-logs'),
+    # Cola de reportes (asincrono)
+    path('admin/reports/jobs', AdminReportJobListCreate.as_view(), name='admin-report-jobs'),
+    path('admin/reports/jobs/<int:pk>', AdminReportJobDetail.as_view(), name='admin-report-jobs-detail'),
+    path('admin/reports/jobs/<int:pk>/download', AdminReportJobDownload.as_view(), name='admin-report-jobs-download'),
     path('cart', CartView.as_view(), name='cart-get'),
     path('cart/add', CartAddItemView.as_view(), name='cart-add'),
     path('cart/items/<int:item_id>', CartItemUpdateView.as_view(), name='cart-item'),
@@ -71,9 +78,13 @@ urlpatterns = [
     path('admin/payments/pending', AdminPendingPaymentsList.as_view(), name='admin-payments-pending'),
     path('admin/sales/create-local', AdminCreateLocalSale.as_view(), name='admin-create-local-sale'),
     path('admin/orders/<int:pk>/customer-info', AdminOrderCustomerInfoView.as_view(), name='admin-orders-customer-info'),
+    path('admin/orders/receipts.zip', AdminOrderReceiptsZip.as_view(), name='admin-orders-receipts-zip'),
     # Admin stats & ML
     path('admin/ml/train', AdminMLTrain.as_view(), name='admin-ml-train'),
+    path('admin/ml/train/jobs', AdminMLTrainJobList.as_view(), name='admin-ml-train-jobs'),
+    path('admin/ml/train/jobs/<int:pk>', AdminMLTrainJobDetail.as_view(), name='admin-ml-train-jobs-detail'),
     path('admin/ml/predict', AdminMLPredict.as_view(), name='admin-ml-predict'),
+    path('admin/ml/predict/batch', AdminMLPredictBatch.as_view(), name='admin-ml-predict-batch'),
     path('admin/ml/historical', AdminHistoricalSales.as_view(), name='admin-ml-historical'),
     path('admin/reports/prompt', AdminPromptReportView.as_view(), name='admin-reports-prompt'),
     path('admin/ai/advisor', AdminAIAdvisorView.as_view(), name='admin-ai-advisor'),
@@ -3,4 +3,7 @@ class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
     def ready(self):
-        from . import signals  # noqa
\ No newline at end of file
+        from . import signals  # noqa
+        from . import audit  # noqa  (flush de la bitacora en request_finished)
+        # los modelos de prediccion los precarga solo el servidor web (smartsales/wsgi.py,
+        # asgi.py); los comandos de manage.py los cargan del disco al usarlos
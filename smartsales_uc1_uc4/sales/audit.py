@@ -0,0 +1,166 @@
+# sales/audit.py
+"""
+Bitacora de admin (AdminAuditLog) fuera del camino critico del request.
+
+- snapshot(obj): campos concretos editables del modelo (como model_to_dict, sin
+  consultas de m2m y sin campos sensibles como `password`). Se toma ANTES de
+  modificar el objeto, asi no hace falta releerlo de la base.
+- En UPDATE se guardan solo los campos que cambiaron (before_data/after_data con
+  las mismas claves); CREATE guarda el estado final y DELETE el estado previo.
+- record() encola la entrada con transaction.on_commit (si la transaccion se
+  revierte, no se registra nada). El buffer del proceso se escribe con un solo
+  bulk_create al terminar el request (request_finished, ya enviada la respuesta),
+  cuando junta AUDIT_BUFFER_SIZE entradas o cada AUDIT_FLUSH_INTERVAL segundos.
+  Con AUDIT_LOG_ASYNC=False se escribe al confirmar la transaccion.
+- Si el bulk_create falla se reintenta de a una entrada; las que vuelven a fallar
+  regresan al buffer (hasta AUDIT_MAX_RETRIES veces y AUDIT_MAX_PENDING entradas).
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger('sales.audit')
+
+AUDIT_LOG_ASYNC = getattr(settings, 'AUDIT_LOG_ASYNC', True)
+AUDIT_BUFFER_SIZE = getattr(settings, 'AUDIT_BUFFER_SIZE', 200)
+AUDIT_FLUSH_INTERVAL = getattr(settings, 'AUDIT_FLUSH_INTERVAL', 5)
+AUDIT_MAX_PENDING = getattr(settings, 'AUDIT_MAX_PENDING', AUDIT_BUFFER_SIZE * 10)
+AUDIT_MAX_RETRIES = 3
+SENSITIVE_FIELDS = frozenset({'password'})
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if hasattr(value, 'name') and hasattr(value, 'storage'):
+        return value.name or None  # FieldFile
+    return str(value)
+
+
+def snapshot(obj):
+    """Dict serializable con los campos editables de `obj` (acepta un dict ya tomado)."""
+    if obj is None or isinstance(obj, dict):
+        return obj
+    try:
+        return {
+            f.name: _json_value(f.value_from_object(obj))
+            for f in obj._meta.concrete_fields
+            if f.editable and f.name not in SENSITIVE_FIELDS
+        }
+    except Exception:
+        return {}
+
+
+def diff(before, after):
+    """(antes, despues) solo con los campos que cambiaron."""
+    keys = [k for k in {**before, **after} if before.get(k) != after.get(k)]
+    return {k: before.get(k) for k in keys}, {k: after.get(k) for k in keys}
+
+
+class AuditBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []
+        self._thread = None
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            full = len(self._entries) >= AUDIT_BUFFER_SIZE
+        if full or not AUDIT_LOG_ASYNC:
+            self.flush()
+        else:
+            self._ensure_timer()
+
+    def flush(self):
+        with self._lock:
+            entries, self._entries = self._entries, []
+        if not entries:
+            return 0
+        from .models import AdminAuditLog
+        try:
+            AdminAuditLog.objects.bulk_create([_audit_row(e) for e in entries], batch_size=500)
+            return len(entries)
+        except Exception:
+            logger.warning('Fallo el bulk_create de %s entradas de auditoria; se guardan de a una', len(entries), exc_info=True)
+        saved, failed = 0, []
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    _audit_row(entry).save()
+                saved += 1
+            except Exception:
+                logger.exception('No se pudo guardar la entrada de auditoria %s %s#%s', entry['action'], entry['model_name'], entry['object_id'])
+                failed.append(dict(entry, _retries=entry.get('_retries', 0) + 1))
+        if failed:
+            self._requeue(failed)
+        return saved
+
+    def _requeue(self, failed):
+        """Devuelve al buffer las entradas que fallaron, sin pasar de AUDIT_MAX_PENDING."""
+        retry = [e for e in failed if e['_retries'] < AUDIT_MAX_RETRIES]
+        with self._lock:
+            keep = retry[:max(AUDIT_MAX_PENDING - len(self._entries), 0)]
+            self._entries[:0] = keep
+        dropped = len(failed) - len(keep)
+        if dropped:
+            logger.error('Se descartan %s entradas de auditoria tras reintentos o por buffer lleno', dropped)
+        if keep and AUDIT_LOG_ASYNC:
+            self._ensure_timer()
+
+    def _ensure_timer(self):
+        if AUDIT_FLUSH_INTERVAL <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, name='audit-flush', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(AUDIT_FLUSH_INTERVAL)
+            close_old_connections()
+            self.flush()
+
+
+def _audit_row(entry):
+    from .models import AdminAuditLog
+    return AdminAuditLog(**{k: v for k, v in entry.items() if k != '_retries'})
+
+
+buffer = AuditBuffer()
+
+
+def record(user, action, model_name, object_id, before=None, after=None):
+    """Registra una accion; `before`/`after` son instancias o snapshots tomados con snapshot()."""
+    before, after = snapshot(before), snapshot(after)
+    if before is not None and after is not None:
+        before, after = diff(before, after)
+    entry = {
+        'user_id': getattr(user, 'pk', None),
+        'action': action,
+        'model_name': model_name,
+        'object_id': str(object_id),
+        'before_data': before,
+        'after_data': after,
+        'created_at': timezone.now(),
+    }
+    transaction.on_commit(lambda: buffer.add(entry))
+
+
+def flush_audit_log(**kwargs):
+    return buffer.flush()
+
+
+request_finished.connect(flush_audit_log, dispatch_uid='sales.audit.flush')
+atexit.register(flush_audit_log)
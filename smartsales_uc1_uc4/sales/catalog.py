@@ -0,0 +1,71 @@
+# sales/catalog.py
+"""
+Cache del listado publico de productos (ProductListView).
+
+Cada respuesta se guarda bajo una clave que combina los parametros normalizados
+con un contador de version del catalogo. Cualquier cambio de Product/Brand/Category
+(signals) o de stock (reserve_stock/release_stock) incrementa la version y deja
+huerfanas las entradas anteriores, que expiran solas por TTL.
+Con varios procesos web conviene un cache compartido (Redis/Memcached) en CACHES.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TTL = getattr(settings, 'CATALOG_CACHE_TTL', 300)
+
+TRUTHY = ('1', 'true', 'yes', 'si')
+CATALOG_SORTS = ('price_asc', 'price_desc', 'newest')
+# parametros que cambian la respuesta de ProductListView; el resto se ignora en la clave
+_VALUE_PARAMS = ('q', 'brand', 'brand_id', 'category', 'category_id', 'min', 'max', 'page')
+_FLAG_PARAMS = ('in_stock', 'featured', 'on_sale')
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY) or 1
+    return version
+
+
+def _bump():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # clave inexistente (cache reiniciado): cualquier valor nuevo invalida igual
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def bump_catalog_version():
+    """Invalida el listado cacheado; si hay transaccion abierta, al confirmar."""
+    transaction.on_commit(_bump)
+
+
+def normalize_catalog_params(params):
+    out = {}
+    for key in _VALUE_PARAMS:
+        value = params.get(key)
+        if value:
+            out[key] = value
+    for key in _FLAG_PARAMS:
+        if str(params.get(key) or '').lower() in TRUTHY:
+            out[key] = '1'
+    sort = params.get('sort')
+    # sin sort, una busqueda se ordena por relevancia: no es lo mismo que sort=name
+    out['sort'] = (sort if sort in CATALOG_SORTS else 'name') if sort else ''
+    if out.get('page') == '1':
+        del out['page']
+    return out
+
+
+def catalog_cache_key(request):
+    params = normalize_catalog_params(request.query_params)
+    # el host entra en la clave porque los links next/previous son absolutos
+    raw = json.dumps([request.get_host(), params], sort_keys=True)
+    digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    return f"catalog:v{get_catalog_version()}:{digest}"
@@ -0,0 +1,252 @@
+# sales/catalog_index.py
+"""
+Indice en memoria del catalogo para el asesor (answer_product_question).
+
+Por producto se precalcula lo que antes se recomputaba en cada mensaje del chatbot:
+buckets de KEYWORD_BUCKETS que aparecen en nombre/descripcion (filtro de candidatos)
+y en el texto completo con marca/categoria (puntaje), flags compacto / eficiencia,
+precio final y gama. Las consultas son intersecciones de sets y el puntaje se
+calcula solo sobre los candidatos.
+
+El indice es por proceso. Se refresca de forma incremental cuando cambia la version
+del catalogo (sales.catalog) o pasa CATALOG_INDEX_MAX_AGE: se releen solo los
+productos con updated_at nuevo y el stock/estado de todos (consulta angosta).
+
+Las estructuras de trabajo solo se modifican con el lock tomado; al terminar cada
+cambio se publica una CatalogSnapshot inmutable que reemplaza a la anterior en una
+sola asignacion. Las consultas usan siempre una snapshot, asi que los hilos del
+servidor nunca ven un indice a medio actualizar.
+"""
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .catalog import get_catalog_version
+
+CATALOG_INDEX_MAX_AGE = getattr(settings, 'CATALOG_INDEX_MAX_AGE', 60)
+
+COMPACT_TERMS = ('compact',)
+ENERGY_TERMS = ('eficiencia', 'ahorro', 'inverter')
+PREMIUM_PRICE = 2500
+
+IndexedProduct = namedtuple('IndexedProduct', [
+    'id', 'name', 'image_url', 'category_id', 'category_name', 'brand_name',
+    'price', 'warranty_months', 'is_featured', 'updated_at',
+    'match_buckets', 'text_buckets', 'compact', 'energy', 'premium',
+])
+
+
+def _buckets_in(text):
+    from .services import KEYWORD_BUCKETS
+    return frozenset(key for key, terms in KEYWORD_BUCKETS.items() if any(term in text for term in terms))
+
+
+class CatalogSnapshot:
+    """Vista inmutable del indice; la devuelve get_catalog_index()."""
+
+    def __init__(self, products=None, stock=None, active=(), by_bucket=None, by_category=None, featured=()):
+        self.products = products or {}
+        self.stock = stock or {}
+        self.active = frozenset(active)
+        self.by_bucket = {key: frozenset(ids) for key, ids in (by_bucket or {}).items()}
+        self.by_category = {key: frozenset(ids) for key, ids in (by_category or {}).items()}
+        self.featured = frozenset(featured)
+
+    def candidates(self, category_ids=None, keyword_key=None, featured_only=False):
+        """Ids en stock y activos, con el mismo filtro que hacia answer_product_question en SQL."""
+        if category_ids:
+            base = set().union(*(self.by_category.get(cid, ()) for cid in category_ids))
+        elif keyword_key:
+            base = self.by_bucket.get(keyword_key, ())
+        else:
+            base = self.active
+        ids = {pid for pid in base if pid in self.active and self.stock.get(pid, 0) > 0}
+        if featured_only and ids & self.featured:
+            ids &= self.featured
+        return ids
+
+    def ordered(self, ids, general=False):
+        if general:
+            # -is_featured, -stock, -updated_at (orden del listado "general" original)
+            return sorted(ids, key=lambda pid: (
+                not self.products[pid].is_featured,
+                -self.stock[pid],
+                -(self.products[pid].updated_at.timestamp() if self.products[pid].updated_at else 0),
+            ))
+        return sorted(ids)
+
+    def score(self, ids, keyword_key=None, value_focus=False, premium_focus=False, small_space=False, energy_focus=False):
+        recommendations = []
+        for pid in ids:
+            p = self.products[pid]
+            stock = self.stock[pid]
+            score = 0.1
+            reasons = []
+            if keyword_key and keyword_key in p.text_buckets:
+                score += 3
+                reasons.append(f"Coincide con la categoria {keyword_key}")
+            if value_focus:
+                score += max(0, 4 - (p.price / 1000))
+                reasons.append('Buena relacion precio/prestaciones')
+            if premium_focus and p.premium:
+                score += 2
+                reasons.append('Producto de gama alta')
+            if small_space and p.compact:
+                score += 2
+                reasons.append('Formato compacto para espacios reducidos')
+            if energy_focus and p.energy:
+                score += 2
+                reasons.append('Incluye atributos de eficiencia energetica')
+            if (p.warranty_months or 0) >= 24:
+                score += 0.5
+            score += min(stock, 20) * 0.02
+            recommendations.append({'product': p, 'stock': stock, 'score': score, 'price': p.price, 'reasons': reasons})
+        return recommendations
+
+
+class CatalogIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        self.snapshot = CatalogSnapshot()
+
+    def _publish(self):
+        self.snapshot = CatalogSnapshot(
+            products=dict(self.products), stock=dict(self.stock), active=self.active,
+            by_bucket=self.by_bucket, by_category=self.by_category, featured=self.featured,
+        )
+
+    def _reset(self):
+        self.products = {}
+        self.stock = {}
+        self.active = set()
+        self.by_bucket = {}
+        self.by_category = {}
+        self.featured = set()
+        self.names = {}
+        self.version = None
+        self.built_at = 0.0
+        self.max_updated_at = None
+
+    # -- construccion --
+    def _index_rows(self, products):
+        for p in products:
+            self._drop(p.id)
+            name_desc = f"{p.name or ''}\n{p.description or ''}".lower()
+            base_text = " ".join(filter(None, [
+                p.name or '',
+                p.description or '',
+                p.category.name if p.category else '',
+                p.brand.name if p.brand else '',
+            ])).lower()
+            price = float(p.get_final_price() or p.price or 0)
+            entry = IndexedProduct(
+                id=p.id, name=p.name, image_url=p.image_url,
+                category_id=p.category_id,
+                category_name=p.category.name if p.category else '',
+                brand_name=p.brand.name if p.brand else '',
+                price=price, warranty_months=p.warranty_months,
+                is_featured=p.is_featured, updated_at=p.updated_at,
+                match_buckets=_buckets_in(name_desc),
+                text_buckets=_buckets_in(base_text),
+                compact=any(term in base_text for term in COMPACT_TERMS),
+                energy=any(term in base_text for term in ENERGY_TERMS),
+                premium=price > PREMIUM_PRICE,
+            )
+            self.products[p.id] = entry
+            self.stock[p.id] = p.stock or 0
+            if p.is_active:
+                self.active.add(p.id)
+            for key in entry.match_buckets:
+                self.by_bucket.setdefault(key, set()).add(p.id)
+            self.by_category.setdefault(p.category_id, set()).add(p.id)
+            if p.is_featured:
+                self.featured.add(p.id)
+            if self.max_updated_at is None or (p.updated_at and p.updated_at > self.max_updated_at):
+                self.max_updated_at = p.updated_at
+
+    def _drop(self, pid):
+        entry = self.products.pop(pid, None)
+        self.stock.pop(pid, None)
+        self.active.discard(pid)
+        self.featured.discard(pid)
+        if entry is None:
+            return
+        for key in entry.match_buckets:
+            self.by_bucket.get(key, set()).discard(pid)
+        self.by_category.get(entry.category_id, set()).discard(pid)
+
+    def _label_names(self):
+        from .models import Brand, Category
+        return (
+            dict(Brand.objects.values_list('id', 'name')),
+            dict(Category.objects.values_list('id', 'name')),
+        )
+
+    def _rebuild(self):
+        from .models import Product
+        self._reset()
+        self.names = self._label_names()
+        self._index_rows(Product.objects.select_related('brand', 'category'))
+
+    def _refresh(self):
+        from .models import Product
+        names = self._label_names()
+        if names != self.names or self.max_updated_at is None:
+            # renombrar marca/categoria cambia el texto de todos sus productos
+            self._rebuild()
+            return
+        self._index_rows(Product.objects.select_related('brand', 'category').filter(updated_at__gt=self.max_updated_at))
+        # stock y activo cambian con UPDATE masivos (reserve_stock) sin tocar updated_at
+        seen = set()
+        for pid, stock, is_active in Product.objects.values_list('id', 'stock', 'is_active'):
+            seen.add(pid)
+            if pid not in self.products:
+                continue
+            self.stock[pid] = stock or 0
+            if is_active:
+                self.active.add(pid)
+            else:
+                self.active.discard(pid)
+        for pid in set(self.products) - seen:
+            self._drop(pid)
+
+    def ensure_fresh(self):
+        version = get_catalog_version()
+        if version == self.version and time.monotonic() - self.built_at < CATALOG_INDEX_MAX_AGE:
+            return self.snapshot
+        with self._lock:
+            if version != self.version or time.monotonic() - self.built_at >= CATALOG_INDEX_MAX_AGE:
+                if self.version is None:
+                    self._rebuild()
+                else:
+                    self._refresh()
+                self._publish()
+                self.version = version
+                self.built_at = time.monotonic()
+        return self.snapshot
+
+    def refresh_products(self, ids):
+        """Reindexa ya mismo (en este proceso) los productos dados; lo llaman los signals."""
+        from .models import Product
+        if self.version is None:
+            return
+        with self._lock:
+            ids = set(ids)
+            rows = list(Product.objects.select_related('brand', 'category').filter(pk__in=ids))
+            for pid in ids - {p.id for p in rows}:
+                self._drop(pid)
+            self._index_rows(rows)
+            self._publish()
+
+_index = CatalogIndex()
+
+
+def get_catalog_index():
+    return _index.ensure_fresh()
+
+
+def refresh_catalog_index(ids):
+    _index.refresh_products(ids)
@@ -0,0 +1,194 @@
+# sales/columnar.py
+"""
+Export columnar del detalle de ventas (OrderItem + orden, producto, marca, categoria)
+para los notebooks de BI: Apache Parquet (por defecto) o Feather v2 (Arrow IPC).
+
+- Mismos filtros que el reporte de ventas (sales_report_lines). Se lee con
+  values_list().iterator() y se arma un RecordBatch cada COLUMNAR_BATCH_ROWS filas, que
+  se escribe y se envia enseguida: la memoria depende del lote, no del total.
+- Tipos conservados: importes decimal128, fechas timestamp[us, UTC], ids int64. En
+  Parquet marca, categoria, estado y metodo de pago van como dictionary<int32, string>
+  (pandas los lee como `category`); el diccionario se arma antes de exportar y crece si
+  aparece un valor nuevo a mitad del export. El archivo IPC de Feather no admite
+  reemplazar el diccionario entre lotes, asi que en Feather esas columnas van como
+  string: una venta o un renombre concurrente no pueden romper la descarga ya iniciada.
+- pyarrow es opcional: sin el paquete la vista responde 501.
+"""
+from django.conf import settings
+
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'feather': ('feather', 'application/vnd.apache.arrow.file'),
+}
+COLUMNAR_BATCH_ROWS = getattr(settings, 'COLUMNAR_BATCH_ROWS', 50_000)
+COLUMNAR_COMPRESSION = getattr(settings, 'COLUMNAR_COMPRESSION', 'zstd')
+
+# (campo de values_list, columna, tipo); los tipos 'dict' se codifican con diccionario
+SALES_LINE_COLUMNS = (
+    ('order_id', 'order_id', 'int64'),
+    ('order__transaction_number', 'transaction_number', 'string'),
+    ('order__created_at', 'created_at', 'timestamp'),
+    ('order__paid_at', 'paid_at', 'timestamp'),
+    ('order__status', 'status', 'dict'),
+    ('order__payment_method', 'payment_method', 'dict'),
+    ('order__user_id', 'user_id', 'int64'),
+    ('product_id', 'product_id', 'int64'),
+    ('name_snapshot', 'product', 'string'),
+    ('product__brand__name', 'brand', 'dict'),
+    ('product__category__name', 'category', 'dict'),
+    ('qty', 'qty', 'int32'),
+    ('unit_price', 'unit_price', 'money'),
+    ('discount', 'discount', 'money'),
+    ('tax_rate', 'tax_rate', 'rate'),
+    ('line_total', 'line_total', 'money'),
+)
+
+
+def columnar_available():
+    try:
+        import pyarrow  # noqa: F401  # type: ignore
+        import pyarrow.parquet  # noqa: F401  # type: ignore
+    except ImportError:
+        return False
+    return True
+
+
+def _arrow_type(kind):
+    import pyarrow as pa  # type: ignore
+    return {
+        'int64': pa.int64(),
+        'int32': pa.int32(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'dict': pa.dictionary(pa.int32(), pa.string()),
+        'money': pa.decimal128(12, 2),
+        'rate': pa.decimal128(5, 2),
+    }[kind]
+
+
+def _column_kind(kind, fmt):
+    return 'string' if kind == 'dict' and fmt == 'feather' else kind
+
+
+def sales_line_schema(fmt='parquet'):
+    import pyarrow as pa  # type: ignore
+    return pa.schema([pa.field(name, _arrow_type(_column_kind(kind, fmt))) for _field, name, kind in SALES_LINE_COLUMNS])
+
+
+def _dictionaries(lines):
+    """Valores posibles de cada columna con diccionario, leidos una vez antes de exportar."""
+    from .models import Order
+    values = {
+        'status': [key for key, _label in Order.STATUS_CHOICES],
+        'payment_method': [key for key, _label in Order.PAYMENT_METHODS],
+    }
+    for field, name in (('product__brand__name', 'brand'), ('product__category__name', 'category')):
+        values[name] = sorted(v for v in lines.order_by().values_list(field, flat=True).distinct() if v is not None)
+    return values
+
+
+class _Dictionary:
+    def __init__(self, values):
+        self.values = list(values)
+        self.index = {value: i for i, value in enumerate(self.values)}
+
+    def encode(self, column):
+        import pyarrow as pa  # type: ignore
+        codes = []
+        for value in column:
+            if value is None:
+                codes.append(None)
+                continue
+            code = self.index.get(value)
+            if code is None:
+                # valor nuevo durante el export: Parquet admite que el diccionario crezca
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+            codes.append(code)
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32()), pa.array(self.values, type=pa.string()))
+
+
+def iter_sales_line_batches(filters, batch_rows=None, chunk_size=5000, fmt='parquet'):
+    """RecordBatch de a `batch_rows` lineas con el esquema de sales_line_schema(fmt)."""
+    import pyarrow as pa  # type: ignore
+    from .services import sales_report_lines
+    batch_rows = batch_rows or COLUMNAR_BATCH_ROWS
+    lines = sales_report_lines(filters)
+    schema = sales_line_schema(fmt)
+    if fmt == 'feather':
+        dictionaries = {}
+    else:
+        dictionaries = {name: _Dictionary(values) for name, values in _dictionaries(lines).items()}
+    fields = [field for field, _name, _kind in SALES_LINE_COLUMNS]
+    rows = lines.order_by('order_id', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+    def to_batch(chunk):
+        arrays = []
+        for (_field, name, kind), column in zip(SALES_LINE_COLUMNS, zip(*chunk)):
+            if name in dictionaries:
+                arrays.append(dictionaries[name].encode(column))
+            else:
+                arrays.append(pa.array(column, type=_arrow_type(_column_kind(kind, fmt))))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch_rows:
+            yield to_batch(chunk)
+            chunk = []
+    if chunk:
+        yield to_batch(chunk)
+
+
+class _StreamSink:
+    """Archivo de solo escritura para pyarrow: guarda lo escrito hasta que se entrega."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_sales_columnar(filters, fmt='parquet', batch_rows=None):
+    """Bytes del archivo `fmt` (parquet/feather) a medida que se escribe cada lote."""
+    import pyarrow as pa  # type: ignore
+    import pyarrow.ipc  # noqa: F401  # type: ignore
+    import pyarrow.parquet as pq  # type: ignore
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Formato no soportado: {fmt} (opciones: {', '.join(COLUMNAR_FORMATS)})")
+    sink = _StreamSink()
+    out = pa.PythonFile(sink, mode='w')
+    schema = sales_line_schema(fmt)
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(out, schema, compression=COLUMNAR_COMPRESSION)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)
+        writer = pa.ipc.new_file(out, schema, options=options)
+    with writer:
+        for batch in iter_sales_line_batches(filters, batch_rows=batch_rows, fmt=fmt):
+            writer.write_batch(batch)
+            data = sink.take()
+            if data:
+                yield data
+    yield sink.take()  # footer
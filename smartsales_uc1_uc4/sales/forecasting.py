@@ -0,0 +1,331 @@
+# sales/forecasting.py
+"""
+Pronostico de series mensuales de ventas (total o por categoria).
+
+- Features por mes: tendencia, mes codificado en seno/coseno, feriados de Bolivia
+  (fijos + moviles segun Pascua: carnaval, viernes santo, corpus christi), lags
+  1/2/3/12 y medias/desvio moviles de los meses previos. Todo se calcula con NumPy
+  sobre la serie completa (sumas acumuladas), sin bucles por fila.
+- Estimadores intercambiables (FORECAST_ESTIMATORS): el RandomForest actual,
+  gradient boosting (HistGradientBoosting) y un seasonal-naive vectorizado que no
+  necesita entrenamiento. Se entrena un modelo global con las filas de todas las series.
+- El horizonte se predice en forma recursiva: cada mes predicho pasa a ser historia
+  del siguiente; en cada paso hay un solo predict para todas las series.
+- Con menos de MIN_FIT_PERIODS meses no hay filas de entrenamiento (la fila 0 no tiene
+  historia): cualquier estimador cae a seasonal-naive.
+- fitted() memoriza el modelo entrenado por estimador y datos (lo usa el asesor, que
+  pronostica en cada consulta).
+- backtest(): validacion rolling-origin con MAPE y tiempos de fit/predict por modelo
+  (comando `backtest_forecast`).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+
+import numpy as np  # type: ignore
+from dateutil.easter import easter  # type: ignore
+from dateutil.relativedelta import relativedelta  # type: ignore
+
+LAGS = (1, 2, 3, 12)
+ROLLING_WINDOWS = (3, 6)
+FEATURES = (
+    'trend', 'month_sin', 'month_cos', 'holidays', 'carnival',
+    'lag_1', 'lag_2', 'lag_3', 'lag_12', 'has_lag_12',
+    'roll_mean_3', 'roll_mean_6', 'roll_std_3', 'level',
+)
+_COL = {name: i for i, name in enumerate(FEATURES)}
+MIN_FIT_PERIODS = 2
+FIT_CACHE_SIZE = 32
+
+# Feriados nacionales: (mes, dia) fijos y desplazamientos en dias desde el domingo de Pascua
+BOLIVIA_FIXED_HOLIDAYS = (
+    (1, 1),    # Año Nuevo
+    (1, 22),   # Estado Plurinacional
+    (5, 1),    # Dia del Trabajo
+    (6, 21),   # Año Nuevo Andino Amazonico
+    (8, 6),    # Independencia
+    (11, 2),   # Todos Santos
+    (12, 25),  # Navidad
+)
+BOLIVIA_EASTER_OFFSETS = (-48, -47, -2, 60)  # carnaval (lunes, martes), viernes santo, corpus christi
+
+
+@lru_cache(maxsize=64)
+def bolivia_holidays(year):
+    days = {date(year, m, d) for m, d in BOLIVIA_FIXED_HOLIDAYS}
+    sunday = easter(year)
+    days.update(sunday + relativedelta(days=offset) for offset in BOLIVIA_EASTER_OFFSETS)
+    return tuple(sorted(days))
+
+
+def _calendar_features(periods):
+    """(holidays, carnival, month_sin, month_cos) para una lista de primeros de mes."""
+    months = np.array([p.month for p in periods], dtype=float)
+    holidays = np.array([sum(1 for h in bolivia_holidays(p.year) if h.month == p.month) for p in periods], dtype=float)
+    carnival = np.array([(easter(p.year) + relativedelta(days=-48)).month == p.month for p in periods], dtype=float)
+    angle = 2 * np.pi * (months - 1) / 12
+    return holidays, carnival, np.sin(angle), np.cos(angle)
+
+
+def _window_stats(values, length, window):
+    """Media y desvio de values[t-window:t] para t en 0..length-1 (solo meses con dato)."""
+    padded = np.full(length, np.nan)
+    padded[:len(values)] = values
+    valid = ~np.isnan(padded)
+    x = np.where(valid, padded, 0.0)
+    cs = np.concatenate(([0.0], np.cumsum(x)))
+    cs2 = np.concatenate(([0.0], np.cumsum(x * x)))
+    cnt = np.concatenate(([0.0], np.cumsum(valid)))
+    t = np.arange(length)
+    start = np.zeros(length, dtype=int) if window is None else np.maximum(t - window, 0)
+    n = cnt[t] - cnt[start]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (cs[t] - cs[start]) / n
+        var = (cs2[t] - cs2[start]) / n - mean * mean
+    return mean, np.sqrt(np.maximum(var, 0.0))
+
+
+def feature_matrix(values, periods):
+    """
+    Matriz (len(periods) x FEATURES): la fila t usa solo values[:t]. periods puede tener
+    mas meses que values (los que se van a predecir). Los lags sin historia se imputan
+    con la media de los meses previos; la fila 0 no tiene historia y queda en NaN.
+    """
+    values = np.asarray(values, dtype=float)
+    length = len(periods)
+    padded = np.full(length, np.nan)
+    padded[:len(values)] = values
+    level, _ = _window_stats(values, length, None)
+    X = np.empty((length, len(FEATURES)))
+    X[:, _COL['trend']] = np.arange(length)
+    holidays, carnival, msin, mcos = _calendar_features(periods)
+    X[:, _COL['holidays']] = holidays
+    X[:, _COL['carnival']] = carnival
+    X[:, _COL['month_sin']] = msin
+    X[:, _COL['month_cos']] = mcos
+    for lag in LAGS:
+        shifted = np.full(length, np.nan)
+        if lag < length:
+            shifted[lag:] = padded[:length - lag]
+        if lag == 12:
+            X[:, _COL['has_lag_12']] = ~np.isnan(shifted)
+        X[:, _COL[f'lag_{lag}']] = np.where(np.isnan(shifted), level, shifted)
+    for window in ROLLING_WINDOWS:
+        mean, std = _window_stats(values, length, window)
+        X[:, _COL[f'roll_mean_{window}']] = mean
+        if window == 3:
+            X[:, _COL['roll_std_3']] = std
+    X[:, _COL['level']] = level
+    return X
+
+
+def make_series(rows, key='category_id'):
+    """
+    Agrupa filas {period, <key>, total} en series mensuales alineadas a un mismo
+    calendario (los meses sin ventas valen 0). Devuelve (periods, {clave: valores}).
+    """
+    totals = {}
+    for row in rows:
+        period = row['period']
+        if isinstance(period, str):
+            period = date.fromisoformat(period[:10])
+        elif hasattr(period, 'date') and callable(period.date):
+            period = period.date()
+        period = period.replace(day=1)
+        k = row.get(key)
+        totals.setdefault(k, {})
+        totals[k][period] = totals[k].get(period, 0.0) + float(row['total'] or 0)
+    if not totals:
+        return [], {}
+    first = min(min(s) for s in totals.values())
+    last = max(max(s) for s in totals.values())
+    periods = []
+    current = first
+    while current <= last:
+        periods.append(current)
+        current += relativedelta(months=1)
+    series = {k: np.array([s.get(p, 0.0) for p in periods]) for k, s in totals.items()}
+    return periods, series
+
+
+def future_periods(periods, horizon):
+    return [periods[-1] + relativedelta(months=i) for i in range(1, horizon + 1)]
+
+
+class SeasonalNaive:
+    """Baseline: el mismo mes del año anterior, o el ultimo mes si aun no hay 12 de historia."""
+
+    def fit(self, X, y):
+        return self
+
+    def predict(self, X):
+        return np.where(X[:, _COL['has_lag_12']] > 0, X[:, _COL['lag_12']], X[:, _COL['lag_1']])
+
+
+def _random_forest(n_jobs=1):
+    from sklearn.ensemble import RandomForestRegressor  # type: ignore
+    return RandomForestRegressor(n_estimators=150, random_state=42, n_jobs=n_jobs)
+
+
+def _gradient_boosting(n_jobs=1):
+    from sklearn.ensemble import HistGradientBoostingRegressor  # type: ignore
+    return HistGradientBoostingRegressor(max_iter=200, learning_rate=0.05, min_samples_leaf=5, random_state=42)
+
+
+FORECAST_ESTIMATORS = {
+    'seasonal_naive': lambda n_jobs=1: SeasonalNaive(),
+    'random_forest': _random_forest,
+    'gradient_boosting': _gradient_boosting,
+}
+
+
+class Forecaster:
+    def __init__(self, estimator='random_forest', n_jobs=1):
+        if estimator not in FORECAST_ESTIMATORS:
+            raise ValueError(f"estimador invalido: {estimator} (opciones: {', '.join(FORECAST_ESTIMATORS)})")
+        self.name = estimator
+        self.model = FORECAST_ESTIMATORS[estimator](n_jobs=n_jobs)
+        self.periods = []
+        self.series = {}
+
+    def fit(self, periods, series):
+        """Entrena y guarda la historia (periods, series) para predecir desde ella despues."""
+        self.periods = list(periods)
+        self.series = {k: np.asarray(v, dtype=float) for k, v in series.items()}
+        if len(self.periods) < MIN_FIT_PERIODS or not self.series:
+            self.name = 'seasonal_naive'
+            self.model = SeasonalNaive()
+            return self
+        blocks, targets = [], []
+        for values in self.series.values():
+            X = feature_matrix(values, self.periods)
+            blocks.append(X[1:])  # la fila 0 no tiene historia
+            targets.append(values[1:])
+        self.model.fit(np.vstack(blocks), np.concatenate(targets))
+        return self
+
+    def predict(self, periods, series, horizon, per_tree=False):
+        """
+        {clave: array(horizon)} prediciendo mes a mes, un predict por paso para todas las series.
+        Con per_tree devuelve ademas (arboles x series x horizon): la prediccion de cada arbol
+        sobre el camino medio, para armar intervalos; None si el estimador no es un bosque
+        (seasonal-naive, gradient boosting), que no tiene dispersion entre arboles.
+        """
+        keys = list(series)
+        history = [list(np.asarray(series[k], dtype=float)) for k in keys]
+        steps = future_periods(periods, horizon)
+        trees = getattr(self.model, 'estimators_', None) if per_tree else None
+        out = np.empty((len(keys), horizon))
+        spread = np.empty((len(trees), len(keys), horizon)) if trees is not None else None
+        for h in range(horizon):
+            cal = list(periods) + steps[:h + 1]
+            rows = np.vstack([feature_matrix(values, cal)[-1] for values in history])
+            if trees is not None:
+                per = np.stack([tree.predict(rows) for tree in trees])
+                spread[:, :, h] = np.maximum(per, 0.0)
+                preds = np.maximum(per.mean(axis=0), 0.0)
+            else:
+                preds = np.maximum(self.model.predict(rows), 0.0)
+            out[:, h] = preds
+            for values, p in zip(history, preds):
+                values.append(float(p))
+        result = {k: out[i] for i, k in enumerate(keys)}
+        if not per_tree:
+            return result
+        return result, spread
+
+
+_fit_cache = OrderedDict()
+_fit_lock = threading.Lock()
+
+
+def fitted(periods, series, estimator='seasonal_naive', n_jobs=1):
+    """
+    Forecaster entrenado, memorizado por (estimador, meses, valores): mientras la historia
+    no cambie no se reentrena. LRU de FIT_CACHE_SIZE modelos.
+    """
+    key = (
+        estimator, tuple(periods),
+        tuple(sorted(((k, np.asarray(v, dtype=float).tobytes()) for k, v in series.items()), key=repr)),
+    )
+    with _fit_lock:
+        model = _fit_cache.get(key)
+        if model is not None:
+            _fit_cache.move_to_end(key)
+            return model
+    model = Forecaster(estimator, n_jobs=n_jobs).fit(periods, series)
+    with _fit_lock:
+        _fit_cache[key] = model
+        while len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+    return model
+
+
+def forecast(rows, horizon=1, estimator='seasonal_naive', key='category_id', n_jobs=1, cache=False):
+    """Atajo: arma las series, entrena (o reusa con cache) y devuelve (meses futuros, {clave: predicciones})."""
+    periods, series = make_series(rows, key=key)
+    if not periods:
+        return [], {}
+    if cache:
+        model = fitted(periods, series, estimator, n_jobs=n_jobs)
+    else:
+        model = Forecaster(estimator, n_jobs=n_jobs).fit(periods, series)
+    return future_periods(periods, horizon), model.predict(periods, series, horizon)
+
+
+def mape(actual, predicted):
+    """MAPE en % ignorando meses con venta 0 (no definido); NaN si no queda ninguno."""
+    actual = np.asarray(actual, dtype=float)
+    predicted = np.asarray(predicted, dtype=float)
+    mask = actual != 0
+    if not mask.any():
+        return float('nan')
+    return float(np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100)
+
+
+def backtest(rows, estimators=None, horizon=3, folds=6, min_train=12, key='category_id', n_jobs=1):
+    """
+    Rolling-origin: para cada uno de los ultimos `folds` origenes entrena con los meses
+    previos y predice `horizon` meses. Devuelve por estimador MAPE y tiempos medios (ms).
+    """
+    periods, series = make_series(rows, key=key)
+    last_origin = len(periods) - horizon
+    origins = [o for o in range(last_origin - folds + 1, last_origin + 1) if o >= min_train]
+    if not origins:
+        raise ValueError(f'historia insuficiente: {len(periods)} meses (min_train={min_train}, horizon={horizon})')
+    results = []
+    for name in (estimators or list(FORECAST_ESTIMATORS)):
+        errors, fit_ms, predict_ms = [], [], []
+        for origin in origins:
+            train_periods = periods[:origin]
+            train = {k: v[:origin] for k, v in series.items()}
+            t0 = time.perf_counter()
+            model = Forecaster(name, n_jobs=n_jobs).fit(train_periods, train)
+            t1 = time.perf_counter()
+            preds = model.predict(train_periods, train, horizon)
+            t2 = time.perf_counter()
+            fit_ms.append((t1 - t0) * 1000)
+            predict_ms.append((t2 - t1) * 1000)
+            actual = np.concatenate([series[k][origin:origin + horizon] for k in series])
+            predicted = np.concatenate([preds[k] for k in series])
+            errors.append(mape(actual, predicted))
+        results.append({
+            'estimator': name,
+            'mape': float(np.nanmean(errors)) if not np.all(np.isnan(errors)) else float('nan'),
+            'fit_ms': float(np.mean(fit_ms)),
+            'predict_ms': float(np.mean(predict_ms)),
+            'folds': len(origins),
+        })
+    return results
+
+
+def pick_estimator(results, tolerance=0.10):
+    """El mas rapido (fit + predict) cuyo MAPE no supera al mejor en mas de `tolerance` relativo."""
+    scored = [r for r in results if not np.isnan(r['mape'])]
+    if not scored:
+        return None
+    best = min(r['mape'] for r in scored)
+    ok = [r for r in scored if r['mape'] <= best * (1 + tolerance)]
+    return min(ok, key=lambda r: r['fit_ms'] + r['predict_ms'])['estimator']
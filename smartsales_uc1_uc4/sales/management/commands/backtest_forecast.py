@@ -0,0 +1,61 @@
+import math
+import random
+from datetime import date
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.forecasting import FORECAST_ESTIMATORS, backtest, pick_estimator
+from sales.services import _monthly_training_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Backtest rolling-origin de los estimadores de pronostico (sales.forecasting) sobre "
+        "los agregados mensuales del rollup. Reporta MAPE y tiempos de fit/predict por modelo "
+        "y sugiere el mas rapido cuyo error esta dentro de --tolerance del mejor."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scope', choices=('total', 'category'), default='total')
+        parser.add_argument('--horizon', type=int, default=3, help='Meses a predecir por origen (default 3)')
+        parser.add_argument('--folds', type=int, default=6, help='Origenes a evaluar (default 6)')
+        parser.add_argument('--min-train', type=int, default=12, help='Meses minimos de entrenamiento')
+        parser.add_argument('--estimator', action='append', choices=list(FORECAST_ESTIMATORS), help='Repetible; default todos')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='MAPE relativo aceptado sobre el mejor (default 0.10)')
+        parser.add_argument('--synthetic', type=int, default=0, help='Usar N meses sinteticos con estacionalidad en vez del rollup')
+
+    def handle(self, *args, **opts):
+        if opts['synthetic']:
+            rows = self._synthetic(opts['synthetic'], 4 if opts['scope'] == 'category' else 1)
+        else:
+            rows = _monthly_training_rows(opts['scope'])
+        key = 'category_id'
+        try:
+            results = backtest(
+                rows, estimators=opts['estimator'], horizon=opts['horizon'], folds=opts['folds'],
+                min_train=opts['min_train'], key=key,
+            )
+        except ValueError as exc:
+            raise CommandError(f'{exc}; probar con --synthetic 48')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== backtest {opts['scope']} (horizonte {opts['horizon']}, {results[0]['folds']} origenes) =="
+        ))
+        for r in sorted(results, key=lambda r: r['mape']):
+            self.stdout.write(f"{r['estimator']:<18} MAPE {r['mape']:6.2f}%   fit {r['fit_ms']:8.2f} ms   predict {r['predict_ms']:7.2f} ms")
+        choice = pick_estimator(results, opts['tolerance'])
+        if choice:
+            self.stdout.write(self.style.SUCCESS(f"Sugerido: {choice}"))
+
+    def _synthetic(self, months, categories, seed=7):
+        rng = random.Random(seed)
+        start = date.today().replace(day=1) - relativedelta(months=months)
+        rows = []
+        for cat in range(1, categories + 1):
+            scale = 1 + 0.3 * cat
+            for i in range(months):
+                period = start + relativedelta(months=i)
+                season = 1 + 0.25 * math.sin(2 * math.pi * (period.month - 3) / 12) + (0.35 if period.month == 12 else 0)
+                total = scale * (2000 + 25 * i) * season * rng.uniform(0.92, 1.08)
+                rows.append({'period': period.isoformat(), 'category_id': cat, 'total': total})
+        return rows
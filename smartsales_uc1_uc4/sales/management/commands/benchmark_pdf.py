@@ -0,0 +1,174 @@
+import re
+import statistics
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from io import BytesIO
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import make_aware
+
+from sales.reports import render_order_receipt_pdf
+from sales.services import export_to_pdf
+
+PAGE_RE = re.compile(rb'/Type /Page\b(?!s)')
+
+
+def _legacy_fonts(pdfmetrics, TTFont):
+    # tal como lo hacian order_receipt_pdf2 / export_to_pdf: se intenta en cada llamada
+    try:
+        pdfmetrics.registerFont(TTFont('Arial', 'C\\\\Windows\\\\Fonts\\\\arial.ttf'))
+        pdfmetrics.registerFont(TTFont('Arial-Bold', 'C\\\\Windows\\\\Fonts\\\\arialbd.ttf'))
+        return 'Arial', 'Arial-Bold'
+    except Exception:
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
+            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
+            return 'DejaVuSans', 'DejaVuSans-Bold'
+        except Exception:
+            return 'Helvetica', 'Helvetica-Bold'
+
+
+def legacy_receipt(order, items):
+    """Copia del dibujo con canvas del comprobante anterior (solo para comparar)."""
+    from reportlab.lib.colors import HexColor, black, white
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    W, H = A4
+    font, font_bold = _legacy_fonts(pdfmetrics, TTFont)
+    c.setFillColor(HexColor('#0B6E4F'))
+    c.rect(0, H - 30 * mm, W, 30 * mm, fill=1, stroke=0)
+    c.setFillColor(white)
+    c.setFont(font_bold, 16)
+    c.drawString(20 * mm, H - 15 * mm, 'SmartSales365')
+    c.setFont(font, 10)
+    c.drawRightString(W - 20 * mm, H - 12 * mm, 'Comprobante de Compra')
+    y = H - 35 * mm
+    c.setFillColor(black)
+    c.drawString(20 * mm, y, f'Transaccion: {order.transaction_number}'); y -= 6 * mm
+    c.drawString(20 * mm, y, f'Fecha: {order.created_at.strftime("%Y-%m-%d %H:%M")}'); y -= 6 * mm
+    c.drawString(20 * mm, y, f'Cliente: {order.customer_name}'); y -= 10 * mm
+    c.setFont(font_bold, 10)
+    c.drawString(20 * mm, y, 'Items'); y -= 6 * mm
+    c.setFont(font, 10)
+    for it in items:
+        c.drawString(22 * mm, y, f'{it.qty}x {it.name_snapshot}  @ Bs. {float(it.unit_price):.2f}  = Bs. {float(it.line_total):.2f}'); y -= 6 * mm
+        if it.warranty_expires_at:
+            c.drawString(24 * mm, y, f'Garantia hasta: {it.warranty_expires_at}'); y -= 5 * mm
+        if y < 30 * mm:
+            c.showPage()
+            c.setFillColor(HexColor('#0B6E4F'))
+            c.rect(0, H - 15 * mm, W, 15 * mm, fill=1, stroke=0)
+            c.setFillColor(white)
+            c.setFont(font_bold, 12)
+            c.drawString(20 * mm, H - 10 * mm, 'SmartSales365 - Comprobante de Compra')
+            c.setFillColor(black)
+            c.setFont(font, 10)
+            y = H - 25 * mm
+    y -= 5 * mm
+    c.setFont(font_bold, 11)
+    c.drawString(20 * mm, y, f'Subtotal: Bs. {float(order.subtotal):.2f}'); y -= 6 * mm
+    c.drawString(20 * mm, y, f'TOTAL: Bs. {float(order.grand_total):.2f}')
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+def legacy_rows(rows, title='Reporte de Ventas'):
+    """Copia del export_to_pdf anterior (una linea "k: v" por fila)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    W, H = A4
+    font, font_bold = _legacy_fonts(pdfmetrics, TTFont)
+    y = H - 20 * mm
+    c.setFont(font_bold, 14)
+    c.drawString(20 * mm, y, title); y -= 10 * mm
+    c.setFont(font, 10)
+    for r in rows:
+        c.drawString(20 * mm, y, ', '.join(f'{k}: {v}' for k, v in r.items()))
+        y -= 6 * mm
+        if y < 30 * mm:
+            c.showPage(); y = H - 20 * mm; c.setFont(font, 10)
+    c.showPage(); c.save()
+    return buf.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara paginas por segundo del motor comun de PDFs (sales.pdf) contra el dibujo "
+        "con canvas que tenia cada vista: comprobantes de orden y reportes tabulares. "
+        "Usa datos sinteticos en memoria; no toca la base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--receipts', type=int, default=50, help='Comprobantes por repeticion (default 50)')
+        parser.add_argument('--items', type=int, default=8, help='Lineas por comprobante (default 8)')
+        parser.add_argument('--rows', type=int, default=3000, help='Filas del reporte tabular (default 3000)')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **opts):
+        order, items = self._order(opts['items'])
+        rows = self._rows(opts['rows'])
+        cases = (
+            ('comprobante', opts['receipts'],
+             lambda: legacy_receipt(order, items), lambda: render_order_receipt_pdf(order, items=items)),
+            ('reporte tabular', 1, lambda: legacy_rows(rows), lambda: export_to_pdf(rows)),
+        )
+        for name, count, legacy, current in cases:
+            for label, func in (('antes (canvas)', legacy), ('sales.pdf', current)):
+                pages_per_s, docs_per_s, pages = self._measure(func, count, opts['repeat'])
+                self.stdout.write(
+                    f'{name:<16} {label:<15} {pages_per_s:9,.1f} paginas/s  {docs_per_s:8,.1f} docs/s  ({pages} paginas por doc)'
+                )
+
+    def _measure(self, func, count, repeat):
+        func()  # la primera llamada registra las fuentes del motor nuevo
+        rates, docs, pages = [], [], 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            total = 0
+            for _ in range(count):
+                pdf = func()
+                total += len(PAGE_RE.findall(pdf))
+            elapsed = time.perf_counter() - t0
+            pages = total // count
+            rates.append(total / elapsed)
+            docs.append(count / elapsed)
+        return statistics.median(rates), statistics.median(docs), pages
+
+    def _order(self, n_items):
+        user = SimpleNamespace(username='cliente', get_full_name=lambda: 'Cliente Demo')
+        order = SimpleNamespace(
+            transaction_number='TX-000123', created_at=make_aware(datetime(2025, 3, 14, 10, 30)), user=user,
+            customer_name='Cliente Demo', customer_document='1234567', customer_phone='70000000',
+            customer_warranty_note='', subtotal=Decimal('4599.00'), shipping_total=Decimal('0'),
+            discount_total=Decimal('0'), tax_total=Decimal('0'), grand_total=Decimal('4599.00'),
+            status='PAID', transaction_status='PAGADO',
+        )
+        items = [
+            SimpleNamespace(
+                qty=1 + i % 3, name_snapshot=f'Producto de prueba {i} & accesorios', unit_price=Decimal('199.90') + i,
+                line_total=(Decimal('199.90') + i) * (1 + i % 3), warranty_expires_at=date(2026, 3, 14) if i % 2 else None,
+            )
+            for i in range(n_items)
+        ]
+        return order, items
+
+    def _rows(self, n):
+        return [
+            {'periodo': f'2025-{1 + i % 12:02d}', 'producto': f'Producto {i % 97}', 'unidades': i % 13, 'total': round(150.5 * (i % 13), 2)}
+            for i in range(n)
+        ]
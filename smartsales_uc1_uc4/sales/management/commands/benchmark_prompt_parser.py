@@ -0,0 +1,50 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from sales.services import KEYWORD_BUCKETS, detect_keyword_key, parse_prompt_to_spec
+
+
+# Fragmentos tipicos de los prompts del reporte dinamico y del asesor
+PROMPT_FRAGMENTS = (
+    'reporte de ventas', 'quiero', 'en PDF', 'en excel', 'xlsx', 'por producto', 'por cliente',
+    'por categoría', 'mensual', 'hoy', 'ayer', 'esta semana', 'semana pasada', 'este mes',
+    'mes pasado', 'este año', 'año pasado', 'último trimestre', 'este trimestre',
+    'últimos 15 días', 'marzo', 'septiembre', '2024', 'del 01/02/2024 al 31/03/2024',
+    'para mi casa', 'económico', 'de buena marca',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmark de parse_prompt_to_spec y detect_keyword_key sobre prompts "
+        "sinteticos. Reporta prompts por segundo (mediana de las repeticiones)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prompts', type=int, default=5000, help='Prompts sinteticos (default 5000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por funcion')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **opts):
+        prompts = self._prompts(opts['prompts'], opts['seed'])
+        # _category_lookup consulta la base la primera vez por bucket: calentar antes de medir
+        for prompt in prompts[:200]:
+            parse_prompt_to_spec(prompt)
+        for name, func in (('parse_prompt_to_spec', parse_prompt_to_spec), ('detect_keyword_key', detect_keyword_key)):
+            rates = []
+            for _ in range(opts['repeat']):
+                t0 = time.perf_counter()
+                for prompt in prompts:
+                    func(prompt)
+                rates.append(len(prompts) / (time.perf_counter() - t0))
+            self.stdout.write(f'{name}: {statistics.median(rates):,.0f} prompts/s ({len(prompts)} prompts x {opts["repeat"]})')
+
+    def _prompts(self, n, seed):
+        rng = random.Random(seed)
+        fragments = list(PROMPT_FRAGMENTS)
+        for tokens in KEYWORD_BUCKETS.values():
+            fragments.extend(tokens)
+        return [' '.join(rng.choice(fragments) for _ in range(rng.randint(2, 8))) for _ in range(n)]
@@ -0,0 +1,135 @@
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from sales.models import AdminAuditLog, Brand, Cart, Category, Order, OrderItem, Product
+from sales.services import build_sales_report_filters, day_range, sales_report_lines
+
+
+# Modelos cuyos índices (Meta.indexes) se comparan con/sin
+INDEXED_MODELS = (Order, Product, Cart, AdminAuditLog)
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra N órdenes de prueba y compara plan de consulta y tiempos de los "
+        "endpoints más usados con y sin los índices de Meta.indexes. "
+        "Todo corre en una transacción que se revierte al final (salvo --keep)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20000, help='Órdenes a sembrar (default 20000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por consulta')
+        parser.add_argument('--no-plan', action='store_true', help='No imprimir EXPLAIN')
+        parser.add_argument('--keep', action='store_true', help='Conservar los datos sembrados')
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            ctx = self._seed(opts['orders'])
+            after = self._run('con indices', ctx, opts)
+            self._toggle_indexes(drop=True)
+            before = self._run('sin indices', ctx, opts)
+            self._toggle_indexes(drop=False)
+            self._report(before, after)
+            if not opts['keep']:
+                transaction.set_rollback(True)
+                self.stdout.write('Datos de prueba revertidos.')
+
+    # -- datos --
+    def _seed(self, n_orders):
+        stamp = int(time.time())
+        brand, _ = Brand.objects.get_or_create(name='Bench Brand')
+        category, _ = Category.objects.get_or_create(name='Bench Category')
+        Product.objects.bulk_create([
+            Product(name=f'Bench {stamp}-{i}', brand=brand, category=category, price=Decimal(100 + i), stock=1000, is_active=bool(i % 5))
+            for i in range(500)
+        ])
+        products = list(Product.objects.filter(name__startswith=f'Bench {stamp}-'))
+        User.objects.bulk_create([User(username=f'bench_{stamp}_{i}') for i in range(200)])
+        users = list(User.objects.filter(username__startswith=f'bench_{stamp}_'))
+        Cart.objects.bulk_create([Cart(user=u, status='CONVERTED') for u in users for _ in range(3)] + [Cart(user=u) for u in users])
+
+        base = now()
+        statuses = ['PAID'] * 6 + ['PENDING', 'CANCELLED', 'SHIPPED', 'DELIVERED']
+        orders = []
+        for i in range(n_orders):
+            status = statuses[i % len(statuses)]
+            orders.append(Order(
+                user=users[i % len(users)], status=status, transaction_number=f'BENCH-{stamp}-{i}',
+                subtotal=Decimal('0'), grand_total=Decimal('0'),
+                paid_at=base if status == 'PAID' else None,
+            ))
+        Order.objects.bulk_create(orders, batch_size=2000)
+        orders = list(Order.objects.filter(transaction_number__startswith=f'BENCH-{stamp}-').only('id'))
+        # repartir created_at en el último año
+        for idx, o in enumerate(orders):
+            o.created_at = base - timedelta(minutes=(idx * 525600) // max(1, n_orders))
+        Order.objects.bulk_update(orders, ['created_at'], batch_size=2000)
+        items = []
+        for idx, o in enumerate(orders):
+            for k in range(3):
+                p = products[(idx + k) % len(products)]
+                items.append(OrderItem(order=o, product=p, name_snapshot=p.name, qty=1 + k, unit_price=p.price, line_total=p.price * (1 + k)))
+        OrderItem.objects.bulk_create(items, batch_size=5000)
+        AdminAuditLog.objects.bulk_create([
+            AdminAuditLog(action=('UPDATE', 'CREATE', 'ADJUST_STOCK')[i % 3], model_name=('Product', 'User', 'Order')[i % 3], object_id=str(i))
+            for i in range(n_orders)
+        ], batch_size=5000)
+        self.stdout.write(f'Sembradas {len(orders)} órdenes, {len(items)} líneas, {len(products)} productos.')
+        return {'user': users[0], 'date_from': (base - timedelta(days=30)).date().isoformat()}
+
+    # -- consultas de los endpoints --
+    def _queries(self, ctx):
+        user = ctx['user']
+        month = ctx['date_from']
+        report_f = build_sales_report_filters({'date_from': month})
+        return [
+            ('OrderMineList', Order.objects.filter(user=user).order_by('-created_at')[:12]),
+            ('AdminPendingPaymentsList', Order.objects.filter(status='PENDING').order_by('-created_at')[:12]),
+            ('SalesReport (PAID, 30 dias)', Order.objects.filter(day_range('created_at', month), status='PAID').values('id')),
+            ('SalesReport lineas', sales_report_lines(report_f).values('id')),
+            ('ProductListView sort=name', Product.objects.filter(is_active=True).order_by('name')[:12]),
+            ('ProductListView sort=price_asc', Product.objects.filter(is_active=True).order_by('price', 'name')[:12]),
+            ('ProductListView sort=newest', Product.objects.filter(is_active=True).order_by('-created_at')[:12]),
+            ('_get_or_create_active_cart', Cart.objects.filter(user=user, status='ACTIVE')),
+            ('AuditReport (30 dias)', AdminAuditLog.objects.filter(day_range('created_at', month)).order_by('-created_at')[:1000]),
+            ('AuditReport action', AdminAuditLog.objects.filter(action='UPDATE').order_by('-created_at')[:1000]),
+        ]
+
+    def _run(self, label, ctx, opts):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {label} =='))
+        results = {}
+        for name, qs in self._queries(ctx):
+            timings = []
+            for _ in range(opts['repeat']):
+                t0 = time.perf_counter()
+                list(qs.all())
+                timings.append((time.perf_counter() - t0) * 1000)
+            results[name] = statistics.median(timings)
+            self.stdout.write(f'{name}: {results[name]:.2f} ms')
+            if not opts['no_plan']:
+                for line in qs.explain().splitlines():
+                    self.stdout.write(f'    {line}')
+        return results
+
+    def _toggle_indexes(self, drop):
+        # SQL directo: el schema editor de SQLite no puede abrirse dentro de atomic()
+        editor = connection.SchemaEditorClass(connection)
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    sql = index.remove_sql(model, editor) if drop else index.create_sql(model, editor)
+                    cursor.execute(str(sql))
+
+    def _report(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING('== resumen (mediana ms) =='))
+        for name in after:
+            b, a = before[name], after[name]
+            speedup = (b / a) if a else 0
+            self.stdout.write(f'{name}: {b:.2f} -> {a:.2f}  (x{speedup:.1f})')
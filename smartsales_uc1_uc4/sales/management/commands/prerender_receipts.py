@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from sales.models import Order
+from sales.receipts import get_or_render_receipt, receipt_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera por adelantado los comprobantes PDF de las ordenes pagadas y los guarda en "
+        "default_storage (receipts/<orden>/<version>.pdf). Las que ya tienen el archivo de "
+        "su version actual se saltean, asi que se puede correr periodicamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Solo ordenes pagadas en los ultimos N dias')
+        parser.add_argument('--limit', type=int, default=None, help='Maximo de ordenes a revisar')
+        parser.add_argument('--include-void', action='store_true', help='Incluir transacciones anuladas')
+        parser.add_argument('--force', action='store_true', help='Volver a renderizar aunque exista el archivo')
+
+    def handle(self, *args, **opts):
+        qs = Order.objects.filter(status='PAID').select_related('user').prefetch_related('items').order_by('-paid_at', '-id')
+        if not opts['include_void']:
+            qs = qs.exclude(transaction_status='VOID')
+        if opts['days']:
+            qs = qs.filter(paid_at__gte=now() - timedelta(days=opts['days']))
+        if opts['limit']:
+            qs = qs[:opts['limit']]
+        t0 = time.perf_counter()
+        rendered = skipped = failed = 0
+        for order in qs.iterator(chunk_size=200):
+            try:
+                _path, created = get_or_render_receipt(order, receipt_version(order), force=opts['force'])
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f"Orden #{order.pk}: {exc}")
+                continue
+            if created:
+                rendered += 1
+            else:
+                skipped += 1
+        ms = (time.perf_counter() - t0) * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"Comprobantes: {rendered} generados, {skipped} ya estaban, {failed} con error ({ms:.0f} ms)."
+        ))
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from sales.payments import process_webhook_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa por lotes la bandeja de webhooks de pago (PaymentWebhookEvent) y confirma "
+        "las ordenes pagadas. Se pueden lanzar varias instancias: cada evento se toma una sola vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Vacia la bandeja y termina')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Segundos de espera cuando la bandeja esta vacia')
+        parser.add_argument('--batch-size', type=int, default=200, help='Eventos por lote')
+
+    def handle(self, *args, **opts):
+        total = 0
+        self.stdout.write(self.style.SUCCESS('Worker de webhooks iniciado.'))
+        while True:
+            close_old_connections()
+            taken = process_webhook_events(batch_size=opts['batch_size'])
+            total += taken
+            if taken:
+                self.stdout.write(f"Lote procesado: {taken} eventos.")
+                continue
+            if opts['once']:
+                break
+            time.sleep(opts['sleep'])
+        self.stdout.write(f"Eventos procesados: {total}")
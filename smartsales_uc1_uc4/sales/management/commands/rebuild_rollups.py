@@ -0,0 +1,26 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.services import rebuild_sales_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la tabla SalesDailyRollup desde las lineas de ordenes vendidas. "
+        "Sin rango reconstruye todo; con --start/--end solo esos dias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Fecha inicial YYYY-MM-DD (inclusive)')
+        parser.add_argument('--end', help='Fecha final YYYY-MM-DD (inclusive)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Filas por bulk_create')
+
+    def handle(self, *args, **opts):
+        try:
+            start = datetime.strptime(opts['start'], '%Y-%m-%d').date() if opts['start'] else None
+            end = datetime.strptime(opts['end'], '%Y-%m-%d').date() if opts['end'] else None
+        except ValueError:
+            raise CommandError('Las fechas deben tener formato YYYY-MM-DD')
+        written = rebuild_sales_rollups(start=start, end=end, batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rollup diario reconstruido: {written} filas.'))
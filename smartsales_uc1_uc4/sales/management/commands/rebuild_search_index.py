@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from sales.search import rebuild_search_index, search_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera el indice de busqueda de productos (ProductSearchDocument y, en SQLite, "
+        "la tabla FTS5). Necesario tras cargas masivas con bulk_create o SQL directo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Productos por lote')
+
+    def handle(self, *args, **opts):
+        total = rebuild_search_index(batch_size=opts['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indice de busqueda reconstruido ({search_backend()}): {total} productos.'))
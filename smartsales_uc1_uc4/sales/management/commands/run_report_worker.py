@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from sales.reports import claim_next_report_job, run_report_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa la cola de reportes (ReportJob) fuera de los workers web. "
+        "Se pueden lanzar varias instancias en paralelo: cada trabajo se toma una sola vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Procesa los trabajos pendientes y termina')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Segundos de espera cuando la cola esta vacia')
+        parser.add_argument('--max-jobs', type=int, default=0, help='Termina luego de N trabajos (0 = sin limite)')
+
+    def handle(self, *args, **opts):
+        done = 0
+        self.stdout.write(self.style.SUCCESS('Worker de reportes iniciado.'))
+        while True:
+            close_old_connections()
+            job = claim_next_report_job()
+            if job is None:
+                if opts['once']:
+                    break
+                time.sleep(opts['sleep'])
+                continue
+            run_report_job(job)
+            done += 1
+            if job.status == 'DONE':
+                self.stdout.write(self.style.SUCCESS(f"Reporte #{job.pk} ({job.kind}) listo."))
+            else:
+                self.stdout.write(self.style.ERROR(f"Reporte #{job.pk} ({job.kind}) fallo: {job.error}"))
+            if opts['max_jobs'] and done >= opts['max_jobs']:
+                break
+        self.stdout.write(f"Trabajos procesados: {done}")
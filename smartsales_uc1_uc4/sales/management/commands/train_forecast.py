@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils.timezone import localtime
+
+from sales.ml import ML_N_JOBS, ML_SCOPES, claim_next_training_job, enqueue_training_job, run_training_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Entrena los modelos de prediccion fuera de los workers web. Sin opciones encola "
+        "y entrena todos los scopes una vez. Con --schedule queda corriendo: procesa la cola "
+        "(ForecastTrainingJob, p. ej. POST /api/admin/ml/train con async) y encola un "
+        "reentrenamiento de todos los scopes cada noche a la hora --at. "
+        "El fit corre en un pool de procesos con n_jobs = ML_N_JOBS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scope', choices=ML_SCOPES, action='append', help='Scope a entrenar (repetible; default todos)')
+        parser.add_argument('--full', action='store_true', help='Releer todo el historico en vez de desde el watermark')
+        parser.add_argument('--schedule', action='store_true', help='Quedar corriendo y reentrenar cada noche')
+        parser.add_argument('--at', default='03:00', help='Hora local del reentrenamiento nocturno (HH:MM, default 03:00)')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Segundos de espera cuando la cola esta vacia')
+
+    def handle(self, *args, **opts):
+        scopes = opts['scope'] or list(ML_SCOPES)
+        try:
+            at = datetime.strptime(opts['at'], '%H:%M').time()
+        except ValueError:
+            raise CommandError('--at debe tener formato HH:MM')
+        # el pool se crea sin conexiones abiertas: los hijos solo ajustan el modelo, no usan la base
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            if not opts['schedule']:
+                for scope in scopes:
+                    enqueue_training_job(None, scope, full=opts['full'])
+                self._drain(executor)
+                return
+            self.stdout.write(self.style.SUCCESS(f"Entrenamiento programado todos los dias a las {at:%H:%M} (n_jobs={ML_N_JOBS})."))
+            next_run = self._next_run(at)
+            while True:
+                close_old_connections()
+                if localtime() >= next_run:
+                    for scope in scopes:
+                        enqueue_training_job(None, scope, full=opts['full'])
+                    next_run = self._next_run(at)
+                if not self._drain(executor):
+                    time.sleep(opts['sleep'])
+
+    def _next_run(self, at):
+        current = localtime()
+        run = current.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
+        return run if run > current else run + timedelta(days=1)
+
+    def _drain(self, executor):
+        done = 0
+        while True:
+            job = claim_next_training_job()
+            if job is None:
+                return done
+            t0 = time.perf_counter()
+            run_training_job(job, executor=executor)
+            done += 1
+            ms = (time.perf_counter() - t0) * 1000
+            if job.status == 'DONE':
+                info = job.info or {}
+                self.stdout.write(self.style.SUCCESS(
+                    f"Modelo {job.scope} entrenado ({info.get('mode')}, {info.get('rows')} filas, "
+                    f"{info.get('months_reread')} meses releidos) en {ms:.0f} ms."
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f"Entrenamiento #{job.pk} ({job.scope}) fallo: {job.error}"))
@@ -0,0 +1,49 @@
+# sales/middleware.py
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('sales.queries')
+
+
+class QueryCountMiddleware:
+    """
+    Cuenta las consultas SQL de cada request (sin depender de DEBUG) y las
+    registra en el logger 'sales.queries'. Si se supera QUERY_COUNT_WARN se
+    loguea como warning, útil para detectar N+1 en los listados.
+    En DEBUG agrega las cabeceras X-DB-Queries / X-DB-Time-ms.
+
+    Limitacion: solo se cuentan las consultas hechas hasta que la vista devuelve la
+    respuesta. En un StreamingHttpResponse (exports CSV/Parquet, ZIP de comprobantes)
+    el generador corre despues, mientras el servidor envia el cuerpo, y sus consultas
+    no aparecen en el conteo ni en las cabeceras. Para esos casos medir el generador
+    directamente con QueryBudgetMixin (sales/testing.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.warn_at = int(getattr(settings, 'QUERY_COUNT_WARN', 30) or 0)
+
+    def __call__(self, request):
+        stats = {'count': 0, 'time': 0.0}
+
+        def _counter(execute, sql, params, many, context):
+            t0 = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['count'] += 1
+                stats['time'] += time.perf_counter() - t0
+
+        with connection.execute_wrapper(_counter):
+            response = self.get_response(request)
+
+        ms = stats['time'] * 1000
+        level = logging.WARNING if (self.warn_at and stats['count'] > self.warn_at) else logging.DEBUG
+        logger.log(level, '%s %s -> %s consultas (%.1f ms)', request.method, request.path, stats['count'], ms)
+        if settings.DEBUG:
+            response['X-DB-Queries'] = str(stats['count'])
+            response['X-DB-Time-ms'] = f'{ms:.1f}'
+        return response
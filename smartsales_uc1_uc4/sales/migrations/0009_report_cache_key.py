@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0008_reportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditreport',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='salesreport',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
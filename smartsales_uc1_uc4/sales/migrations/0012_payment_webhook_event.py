@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0011_sales_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('stripe', 'stripe'), ('cucu', 'cucu'), ('mp', 'mp'), ('bnb', 'bnb')], max_length=20)),
+                ('event_id', models.CharField(max_length=128)),
+                ('external_reference', models.CharField(blank=True, max_length=120, null=True)),
+                ('state', models.CharField(blank=True, default='', max_length=40)),
+                ('paid', models.BooleanField(default=False)),
+                ('payload', models.TextField(blank=True, default='')),
+                ('status', models.CharField(choices=[('QUEUED', 'QUEUED'), ('PROCESSING', 'PROCESSING'), ('DONE', 'DONE'), ('IGNORED', 'IGNORED'), ('FAILED', 'FAILED')], default='QUEUED', max_length=12)),
+                ('claim_token', models.CharField(blank=True, max_length=32, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='webhook_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='paymentwebhookevent',
+            constraint=models.UniqueConstraint(fields=('provider', 'event_id'), name='webhook_provider_event_uniq'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:29
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+FTS_SQL = [
+    """CREATE VIRTUAL TABLE sales_product_fts USING fts5(
+        name, keywords, body,
+        content='sales_productsearchdocument', content_rowid='product_id'
+    )""",
+    """CREATE TRIGGER sales_product_fts_ai AFTER INSERT ON sales_productsearchdocument BEGIN
+        INSERT INTO sales_product_fts(rowid, name, keywords, body) VALUES (new.product_id, new.name, new.keywords, new.body);
+    END""",
+    """CREATE TRIGGER sales_product_fts_ad AFTER DELETE ON sales_productsearchdocument BEGIN
+        INSERT INTO sales_product_fts(sales_product_fts, rowid, name, keywords, body) VALUES ('delete', old.product_id, old.name, old.keywords, old.body);
+    END""",
+    """CREATE TRIGGER sales_product_fts_au AFTER UPDATE ON sales_productsearchdocument BEGIN
+        INSERT INTO sales_product_fts(sales_product_fts, rowid, name, keywords, body) VALUES ('delete', old.product_id, old.name, old.keywords, old.body);
+        INSERT INTO sales_product_fts(rowid, name, keywords, body) VALUES (new.product_id, new.name, new.keywords, new.body);
+    END""",
+]
+
+# misma expresion que SearchVector('document', config='simple') para que el planner use el indice
+PG_SQL = [
+    """CREATE INDEX sales_psd_document_gin ON sales_productsearchdocument
+        USING gin (to_tsvector('simple'::regconfig, COALESCE(document, '')))""",
+]
+
+
+def create_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for sql in FTS_SQL:
+                schema_editor.execute(sql)
+        except OperationalError:
+            pass  # SQLite sin FTS5: sales.search usa LIKE sobre el texto normalizado
+    elif vendor == 'postgresql':
+        for sql in PG_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for name in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS sales_product_fts_{name}')
+        schema_editor.execute('DROP TABLE IF EXISTS sales_product_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS sales_psd_document_gin')
+
+
+# copia congelada de sales.search.build_document_fields al crear esta migracion: si la
+# funcion cambia despues, esta migracion sigue escribiendo lo mismo (rebuild_search_index
+# regenera el indice con la version vigente)
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(value):
+    text = unicodedata.normalize('NFKD', str(value or '')).encode('ascii', 'ignore').decode('ascii')
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _document_fields(name, description=None, color=None, size=None, brand=None, category=None):
+    name = ' '.join(_tokens(name))
+    keywords = ' '.join(_tokens(' '.join(str(v) for v in (brand, category, color, size) if v)))
+    body = ' '.join(_tokens(description))
+    return {
+        'name': name,
+        'keywords': keywords,
+        'body': body,
+        'document': ' '.join(part for part in (name, keywords, body) if part),
+    }
+
+
+def backfill(apps, schema_editor):
+    Product = apps.get_model('sales', 'Product')
+    ProductSearchDocument = apps.get_model('sales', 'ProductSearchDocument')
+    docs = [
+        ProductSearchDocument(product_id=p.pk, **_document_fields(
+            p.name, p.description, p.color, p.size,
+            p.brand.name if p.brand_id else None,
+            p.category.name if p.category_id else None,
+        ))
+        for p in Product.objects.select_related('brand', 'category').iterator()
+    ]
+    ProductSearchDocument.objects.bulk_create(docs, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_payment_webhook_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='sales.product')),
+                ('name', models.TextField(blank=True, default='')),
+                ('keywords', models.TextField(blank=True, default='')),
+                ('body', models.TextField(blank=True, default='')),
+                ('document', models.TextField(blank=True, default='')),
+            ],
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0014_forecast_training_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adminauditlog',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
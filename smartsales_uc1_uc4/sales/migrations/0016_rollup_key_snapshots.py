@@ -0,0 +1,63 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:24
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+
+SOLD_STATUSES = ('PAID', 'DELIVERED', 'SHIPPED')
+
+
+def backfill(apps, schema_editor):
+    """
+    Fija la categoria/marca de las lineas ya vendidas con la del producto hoy (la misma
+    que uso el rollup al crearlas) y une filas duplicadas del rollup con categoria o
+    marca NULL, que el unique_together anterior no impedia.
+    """
+    OrderItem = apps.get_model('sales', 'OrderItem')
+    Product = apps.get_model('sales', 'Product')
+    SalesDailyRollup = apps.get_model('sales', 'SalesDailyRollup')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderItem.objects.filter(order__status__in=SOLD_STATUSES).update(
+        category_snapshot_id=Subquery(product.values('category_id')[:1]),
+        brand_snapshot_id=Subquery(product.values('brand_id')[:1]),
+    )
+    duplicates = SalesDailyRollup.objects.values('day', 'product_id', 'category_id', 'brand_id').annotate(
+        n=Count('id'), keep=Min('id'), qty_sum=Sum('qty'), revenue_sum=Sum('revenue'), orders=Sum('order_count'),
+    ).filter(n__gt=1).order_by()
+    for row in list(duplicates):
+        group = SalesDailyRollup.objects.filter(
+            day=row['day'], product_id=row['product_id'],
+            category_id=row['category_id'], brand_id=row['brand_id'],
+        )
+        group.exclude(pk=row['keep']).delete()
+        group.filter(pk=row['keep']).update(qty=row['qty_sum'], revenue=row['revenue_sum'], order_count=row['orders'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0015_audit_log_event_time'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='salesdailyrollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='brand_snapshot',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sales.brand'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='category_snapshot',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='sales.category'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='salesdailyrollup',
+            constraint=models.UniqueConstraint(models.F('day'), models.F('product'), django.db.models.functions.comparison.Coalesce('category', models.Value(0)), django.db.models.functions.comparison.Coalesce('brand', models.Value(0)), name='rollup_day_product_key'),
+        ),
+    ]
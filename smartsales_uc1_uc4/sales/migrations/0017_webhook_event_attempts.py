@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0016_rollup_key_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentwebhookevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0019_reportjob_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='forecasttrainingjob',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,254 @@
+# sales/ml.py
+"""
+Registro de modelos de prediccion (Forecaster RandomForest de sales.forecasting) por scope.
+
+Cada modelo vive en MEDIA_ROOT/ml/model_<scope>.pkl con su metadata al lado
+(model_<scope>.json: filas, features, trained_at, watermark de datos). El registro
+guarda en memoria el modelo cargado con la clave (scope, mtime, tamaño) del pickle:
+un stat por request basta para notar un reentrenamiento hecho por otro proceso.
+Las predicciones de un mismo modelo y mes base tambien se memorizan.
+
+No entrena en el request: si no hay modelo, ModelNotTrained (entrenar con
+POST /api/admin/ml/train). El registro carga cada modelo en su primer uso; el
+servidor web (wsgi/asgi) los precarga al iniciar con warm_on_startup().
+
+Entrenamiento incremental: junto al modelo se guardan los agregados mensuales con
+los que se entreno (model_<scope>.rows.json) y su watermark; el siguiente
+entrenamiento solo relee del rollup los meses desde ese watermark. El ajuste
+(fit_forecast_model) es una funcion pura que `train_forecast` corre en un pool de
+procesos, con n_jobs = ML_N_JOBS (por defecto todos los nucleos).
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+logger = logging.getLogger('sales.ml')
+
+ML_SCOPES = ('total', 'category')
+# predicciones memorizadas por modelo cargado (months x category_id x mes base)
+PREDICTION_CACHE_SIZE = 256
+ML_N_JOBS = getattr(settings, 'ML_N_JOBS', None) or os.cpu_count() or 1
+# un entrenamiento RUNNING por mas de esto se considera abandonado (worker caido)
+TRAINING_JOB_TIMEOUT = timedelta(hours=1)
+TRAINING_JOB_MAX_ATTEMPTS = 3
+
+
+class ModelNotTrained(RuntimeError):
+    pass
+
+
+def model_dir() -> Path:
+    return Path(getattr(settings, 'MEDIA_ROOT', Path('.'))) / 'ml'
+
+
+def model_paths(scope):
+    if scope not in ML_SCOPES:
+        raise ValueError(f"scope invalido: {scope} (opciones: {', '.join(ML_SCOPES)})")
+    base = model_dir()
+    return base / f'model_{scope}.pkl', base / f'model_{scope}.json'
+
+
+def _rows_path(scope):
+    pkl, _meta = model_paths(scope)
+    return pkl.with_suffix('.rows.json')
+
+
+def _atomic_write(path: Path, write):
+    """Escribe en un temporal del mismo directorio y lo renombra (os.replace es atomico)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write(fh)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class LoadedModel:
+    def __init__(self, scope, key, model, meta):
+        self.scope = scope
+        self.key = key
+        self.model = model
+        self.meta = meta
+        self.predictions = {}
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    @staticmethod
+    def _file_key(path):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, scope, key):
+        import joblib  # type: ignore
+        pkl, meta_path = model_paths(scope)
+        model = joblib.load(pkl)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            # modelos entrenados antes del registro no tienen metadata
+            meta = {}
+        return LoadedModel(scope, key, model, meta)
+
+    def get(self, scope):
+        pkl, _meta = model_paths(scope)
+        key = self._file_key(pkl)
+        if key is None:
+            self._models.pop(scope, None)
+            raise ModelNotTrained(f"No hay modelo entrenado para '{scope}'; entrenar con POST /api/admin/ml/train")
+        entry = self._models.get(scope)
+        if entry is not None and entry.key == key:
+            return entry
+        with self._lock:
+            entry = self._models.get(scope)
+            if entry is None or entry.key != key:
+                entry = self._load(scope, key)
+                self._models[scope] = entry
+        return entry
+
+    def save(self, scope, model, meta, rows=None):
+        import joblib  # type: ignore
+        pkl, meta_path = model_paths(scope)
+        if rows is not None:
+            payload = {'watermark': meta.get('data_watermark'), 'source': meta.get('source'), 'rows': rows}
+            _atomic_write(_rows_path(scope), lambda fh: fh.write(json.dumps(payload, default=str).encode('utf-8')))
+        # metadata primero: quien vea el pickle nuevo ya encuentra su json
+        _atomic_write(meta_path, lambda fh: fh.write(json.dumps(meta, indent=2, default=str).encode('utf-8')))
+        _atomic_write(pkl, lambda fh: joblib.dump(model, fh))
+        with self._lock:
+            self._models[scope] = LoadedModel(scope, self._file_key(pkl), model, meta)
+
+    def training_rows(self, scope):
+        """Agregados mensuales del ultimo entrenamiento ({watermark, source, rows}) o None."""
+        try:
+            return json.loads(_rows_path(scope).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def warm(self):
+        """Carga los modelos que existan en disco; devuelve los scopes cargados."""
+        loaded = []
+        for scope in ML_SCOPES:
+            try:
+                self.get(scope)
+                loaded.append(scope)
+            except ModelNotTrained:
+                continue
+            except Exception:
+                logger.exception('No se pudo precargar el modelo %s', scope)
+        return loaded
+
+    def has_model(self, scope):
+        pkl, _meta = model_paths(scope)
+        return self._file_key(pkl) is not None
+
+    def metadata(self, scope):
+        return dict(self.get(scope).meta)
+
+
+registry = ModelRegistry()
+
+
+def warm_on_startup():
+    """Precarga los modelos si ML_WARM_ON_STARTUP; solo lee MEDIA_ROOT/ml, no toca la base."""
+    if getattr(settings, 'ML_WARM_ON_STARTUP', True):
+        return registry.warm()
+    return []
+
+
+def fit_forecast_model(rows, scope, n_jobs=1):
+    """
+    Ajusta un Forecaster RandomForest (features de sales.forecasting: lags, medias moviles,
+    calendario y feriados) sobre filas {period, category_id, total}; con scope 'category'
+    hay una serie por categoria (sin categoria = 0). No toca la base ni Django: se puede
+    ejecutar en otro proceso (ProcessPoolExecutor).
+    """
+    from .forecasting import FEATURES, Forecaster, make_series
+    if scope == 'category':
+        rows = [dict(r, category_id=int(r.get('category_id') or 0)) for r in rows]
+        periods, series = make_series(rows, key='category_id')
+    else:
+        periods, series = make_series(rows, key=None)
+    forecaster = Forecaster('random_forest', n_jobs=n_jobs).fit(periods, series)
+    if hasattr(forecaster.model, 'n_jobs'):
+        # para predecir pocas filas el paralelismo solo agrega latencia
+        forecaster.model.set_params(n_jobs=1)
+    return forecaster, list(FEATURES)
+
+
+# ----------------------------
+# Cola de entrenamientos (ForecastTrainingJob)
+# ----------------------------
+
+def enqueue_training_job(user, scope='total', full=False):
+    """Encola un entrenamiento; si ya hay uno QUEUED para el scope, devuelve ese."""
+    from .models import ForecastTrainingJob
+    model_paths(scope)
+    pending = ForecastTrainingJob.objects.filter(scope=scope, status='QUEUED').order_by('created_at').first()
+    if pending is not None:
+        if full and not pending.full:
+            pending.full = True
+            pending.save(update_fields=['full'])
+        return pending
+    return ForecastTrainingJob.objects.create(created_by=user, scope=scope, full=full)
+
+
+def claim_next_training_job():
+    """
+    Toma el siguiente trabajo QUEUED, o RUNNING abandonado (started_at de hace mas de
+    TRAINING_JOB_TIMEOUT), con un UPDATE condicional (seguro con varios workers). Tras
+    TRAINING_JOB_MAX_ATTEMPTS tomas sin terminar queda FAILED.
+    """
+    from .models import ForecastTrainingJob
+    stale = Q(status='RUNNING', started_at__lt=now() - TRAINING_JOB_TIMEOUT)
+    ForecastTrainingJob.objects.filter(stale, attempts__gte=TRAINING_JOB_MAX_ATTEMPTS).update(
+        status='FAILED', finished_at=now(),
+        error=f'Abandonado tras {TRAINING_JOB_MAX_ATTEMPTS} intentos sin terminar',
+    )
+    claimable = Q(status='QUEUED') | (stale & Q(attempts__lt=TRAINING_JOB_MAX_ATTEMPTS))
+    while True:
+        job = ForecastTrainingJob.objects.filter(claimable).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        # started_at distingue una toma ajena hecha entre la lectura y el UPDATE
+        claimed = ForecastTrainingJob.objects.filter(
+            claimable, pk=job.pk, status=job.status, started_at=job.started_at,
+        ).update(status='RUNNING', started_at=now(), attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run_training_job(job, executor=None):
+    from .services import train_rf
+    try:
+        job.info = train_rf(scope=job.scope, full=job.full, executor=executor)
+        job.status = 'DONE'
+        job.finished_at = now()
+        job.save(update_fields=['info', 'status', 'finished_at'])
+    except Exception as exc:
+        job.status = 'FAILED'
+        job.error = str(exc) or exc.__class__.__name__
+        job.finished_at = now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
@@ -2,6 +2,9 @@
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
 from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from decimal import Decimal
 
 try:
@@ -35,9 +38,11 @@ class UserAddress(models.Model):
 # â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 class Brand(models.Model):
     name = models.CharField(max_length=120, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -80,6 +85,26 @@ class Product(models.Model):
         except Exception:
             return False
 
+    class Meta:
+        indexes = [
+            # ProductListView: solo activos (índices parciales) por nombre / precio / novedades
+            models.Index(fields=['name'], condition=models.Q(is_active=True), name='product_active_name_idx'),
+            models.Index(fields=['price', 'name'], condition=models.Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='product_active_created_idx'),
+        ]
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Indice sombra de busqueda: texto normalizado (sin acentos) de cada producto.
+    En SQLite alimenta la tabla FTS5 sales_product_fts por triggers; ver sales.search.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    name = models.TextField(blank=True, default='')
+    keywords = models.TextField(blank=True, default='')  # marca, categoria, color, tamaño
+    body = models.TextField(blank=True, default='')  # descripcion
+    document = models.TextField(blank=True, default='')  # todo junto (PostgreSQL / LIKE)
+
 # â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
 # CARRITO (UC5)
 # â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€â”€
@@ -90,6 +115,11 @@ class Cart(models.Model):
     currency = models.CharField(max_length=8, default='BOB')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='cart_user_status_idx'),
+        ]
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
@@ -142,6 +172,16 @@ class Order(models.Model):
     voided_at = models.DateTimeField(blank=True, null=True)
     voided_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
+    class Meta:
+        indexes = [
+            # reportes / listados por estado y fecha
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+            # OrderMineList
+            models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+            # AdminPendingPaymentsList: solo las pendientes (índice parcial)
+            models.Index(fields=['-created_at'], condition=models.Q(status='PENDING'), name='order_pending_created_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
@@ -153,12 +193,49 @@ class OrderItem(models.Model):
     warranty_months_snapshot = models.IntegerField(default=0)
     warranty_expires_at = models.DateField(blank=True, null=True)
 
+    # categoria/marca con las que la linea entro a SalesDailyRollup (se fijan al pagar);
+    # la anulacion resta de esa misma fila aunque el producto se haya recategorizado
+    category_snapshot = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+    brand_snapshot = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', db_index=False)
+
     qty = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=12, decimal_places=2)
     tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     line_total = models.DecimalField(max_digits=12, decimal_places=2)
 
+
+class SalesDailyRollup(models.Model):
+    """
+    Ventas agregadas por (dia, producto, categoria, marca) de ordenes PAID/SHIPPED/DELIVERED.
+    Se mantiene en adjust_stock_on_paid / revert_stock_on_void; backfill con `rebuild_rollups`.
+    La categoria/marca de la clave es la del producto al pagar (OrderItem.*_snapshot).
+    """
+    day = models.DateField()  # fecha local de order.created_at
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    qty = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # categoria/marca pueden ser NULL: con COALESCE dos filas "sin marca" del mismo
+            # dia y producto tambien chocan (un unique_together comun las dejaria pasar)
+            models.UniqueConstraint(
+                'day', 'product',
+                Coalesce('category', Value(0)),
+                Coalesce('brand', Value(0)),
+                name='rollup_day_product_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='rollup_day_idx'),
+            models.Index(fields=['category', 'day'], name='rollup_category_day_idx'),
+        ]
+
 # ------------------------------
 # ADMIN / AUDITORÃA / REPORTES
 # ------------------------------
@@ -179,9 +256,17 @@ class AdminAuditLog(models.Model):
     action = models.CharField(max_length=20, choices=ACTIONS)
     model_name = models.CharField(max_length=80)
     object_id = models.CharField(max_length=80)
-    before_data = JSONField(blank=True, null=True)
+    before_data = JSONField(blank=True, null=True)  # en UPDATE solo los campos que cambiaron
     after_data = JSONField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # default en vez de auto_now_add: la entrada se guarda en lote, con la hora del evento
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='auditlog_created_idx'),
+            models.Index(fields=['action', 'created_at'], name='auditlog_action_created_idx'),
+            models.Index(fields=['model_name', 'created_at'], name='auditlog_model_created_idx'),
+        ]
 
 
 def report_upload_path(instance, filename):
@@ -193,6 +278,8 @@ class SalesReport(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     filters = JSONField()
     pdf_file = models.FileField(upload_to=report_upload_path)
+    # sha256(filtros normalizados + marca de agua de datos); ver sales.reports
+    cache_key = models.CharField(max_length=64, blank=True, null=True, db_index=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -203,6 +290,38 @@ class AuditReport(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     filters = JSONField()
     pdf_file = models.FileField(upload_to=report_upload_path)
+    cache_key = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ReportJob(models.Model):
+    KINDS = (
+        ('sales', 'sales'),
+        ('audit', 'audit'),
+        ('prompt', 'prompt'),
+    )
+    STATUS_CHOICES = (
+        ('QUEUED', 'QUEUED'),
+        ('RUNNING', 'RUNNING'),
+        ('DONE', 'DONE'),
+        ('FAILED', 'FAILED'),
+    )
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    kind = models.CharField(max_length=10, choices=KINDS)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    progress = models.PositiveSmallIntegerField(default=0)  # 0..100
+    attempts = models.PositiveSmallIntegerField(default=0)  # veces que un worker lo tomo
+    params = JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, null=True)
+    # resultado: se adjunta al SalesReport/AuditReport existente o, para prompts, a result_file
+    sales_report = models.ForeignKey(SalesReport, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    audit_report = models.ForeignKey(AuditReport, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    result_file = models.FileField(upload_to=report_upload_path, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -225,3 +344,70 @@ class PaymentTransaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+
+class PaymentWebhookEvent(models.Model):
+    """
+    Bandeja de entrada (append-only) de webhooks de pago. El webhook solo inserta y responde;
+    `process_payment_webhooks` procesa por lotes. (provider, event_id) deduplica reintentos.
+    """
+    STATUS_CHOICES = (
+        ('QUEUED', 'QUEUED'),
+        ('PROCESSING', 'PROCESSING'),
+        ('DONE', 'DONE'),
+        ('IGNORED', 'IGNORED'),
+        ('FAILED', 'FAILED'),
+    )
+    provider = models.CharField(max_length=20, choices=PaymentTransaction.PROVIDERS)
+    event_id = models.CharField(max_length=128)
+    external_reference = models.CharField(max_length=120, blank=True, null=True)  # Order.transaction_number
+    state = models.CharField(max_length=40, blank=True, default='')
+    paid = models.BooleanField(default=False)
+    payload = models.TextField(blank=True, default='')  # cuerpo crudo recibido
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default='QUEUED')
+    claim_token = models.CharField(max_length=32, blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)  # veces que un worker lo tomo
+    error = models.TextField(blank=True, null=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='webhook_provider_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_status_idx'),
+        ]
+
+
+class ForecastTrainingJob(models.Model):
+    """
+    Entrenamiento del modelo de prediccion fuera del request. Lo encola POST /api/admin/ml/train
+    (async) o `train_forecast --schedule`; `train_forecast` lo procesa en un pool de procesos.
+    """
+    SCOPES = (
+        ('total', 'total'),
+        ('category', 'category'),
+    )
+    STATUS_CHOICES = (
+        ('QUEUED', 'QUEUED'),
+        ('RUNNING', 'RUNNING'),
+        ('DONE', 'DONE'),
+        ('FAILED', 'FAILED'),
+    )
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    scope = models.CharField(max_length=10, choices=SCOPES, default='total')
+    full = models.BooleanField(default=False)  # ignorar el watermark y releer todo el historico
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    attempts = models.PositiveSmallIntegerField(default=0)  # veces que un worker lo tomo
+    info = JSONField(default=dict, blank=True)  # resultado de train_rf (filas, features, modo)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='forecast_job_status_idx'),
+        ]
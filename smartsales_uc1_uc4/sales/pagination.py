@@ -0,0 +1,150 @@
+# sales/pagination.py
+"""
+Paginacion de los listados de admin.
+
+AdminPagination mantiene la respuesta de PageNumberPagination (?page=N) y agrega:
+- ?count=0: no ejecuta COUNT(*); se lee page_size + 1 filas para saber si hay `next`.
+- modo keyset (?cursor=... o ?paginate=cursor): WHERE (created_at, id) < (c, i) sobre
+  el orden de la vista (`cursor_ordering`, por defecto -created_at, -id). No usa OFFSET,
+  asi que el costo de una pagina no depende de su profundidad. El cursor es opaco
+  (base64 de los valores de la ultima/primera fila) y no incluye total salvo ?count=1.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+TRUTHY = ('1', 'true', 'yes', 'si')
+FALSY = ('0', 'false', 'no')
+
+
+def _encode_cursor(values, reverse=False):
+    raw = json.dumps({'v': values, 'r': 1 if reverse else 0}, default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        return list(data['v']), bool(data.get('r'))
+    except Exception:
+        raise NotFound('Cursor invalido.')
+
+
+class AdminPagination(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    default_cursor_ordering = ('-created_at', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = None
+        params = request.query_params
+        default_mode = getattr(view, 'pagination_mode', 'page')
+        keyset = params.get(self.cursor_query_param) or (params.get('paginate') or default_mode).lower() == 'cursor'
+        count_flag = str(params.get('count') or '').lower()
+        if keyset:
+            self.mode = 'cursor'
+            self.with_count = count_flag in TRUTHY
+            return self._paginate_keyset(queryset, request, view)
+        if count_flag in FALSY:
+            self.mode = 'nocount'
+            return self._paginate_without_count(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.mode is None:
+            return super().get_paginated_response(data)
+        body = OrderedDict()
+        if self.mode == 'cursor' and self.with_count:
+            body['count'] = self.total
+        body['next'] = self.next_link
+        body['previous'] = self.previous_link
+        body['results'] = data
+        return Response(body)
+
+    # -- page=N sin COUNT(*) --
+    def _paginate_without_count(self, queryset, request, view):
+        size = self.get_page_size(request)
+        try:
+            number = max(1, int(request.query_params.get(self.page_query_param) or 1))
+        except ValueError:
+            raise NotFound('Pagina invalida.')
+        offset = (number - 1) * size
+        rows = list(queryset[offset:offset + size + 1])
+        if not rows and number > 1:
+            raise NotFound('Pagina invalida.')
+        url = request.build_absolute_uri()
+        self.next_link = replace_query_param(url, self.page_query_param, number + 1) if len(rows) > size else None
+        if number <= 1:
+            self.previous_link = None
+        elif number == 2:
+            self.previous_link = remove_query_param(url, self.page_query_param)
+        else:
+            self.previous_link = replace_query_param(url, self.page_query_param, number - 1)
+        return rows[:size]
+
+    # -- keyset --
+    def _ordering(self, view):
+        return tuple(getattr(view, 'cursor_ordering', None) or self.default_cursor_ordering)
+
+    def _keyset_filter(self, model, ordering, values, reverse):
+        """Q de las filas estrictamente despues (o antes, si reverse) de `values` en `ordering`."""
+        fields = []
+        for term, raw in zip(ordering, values):
+            name = term.lstrip('-')
+            desc = term.startswith('-') != reverse
+            try:
+                value = model._meta.get_field(name).to_python(raw)
+            except (DjangoValidationError, ValueError):
+                raise NotFound('Cursor invalido.')
+            if value is None:
+                # las columnas del orden no admiten NULL: un cursor con null esta adulterado
+                raise NotFound('Cursor invalido.')
+            fields.append((name, 'lt' if desc else 'gt', value))
+        condition = Q()
+        for i, (name, op, value) in enumerate(fields):
+            prefix = {fname: fvalue for fname, _op, fvalue in fields[:i]}
+            condition |= Q(**prefix, **{f'{name}__{op}': value})
+        return condition
+
+    def _paginate_keyset(self, queryset, request, view):
+        ordering = self._ordering(view)
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        values, reverse = _decode_cursor(cursor) if cursor else (None, False)
+        if values is not None and len(values) != len(ordering):
+            raise NotFound('Cursor invalido.')
+        if self.with_count:
+            self.total = queryset.order_by().count()
+        order = [(term[1:] if term.startswith('-') else f'-{term}') if reverse else term for term in ordering]
+        qs = queryset.order_by(*order)
+        if values is not None:
+            qs = qs.filter(self._keyset_filter(queryset.model, ordering, values, reverse))
+        rows = list(qs[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+        if reverse:
+            rows.reverse()
+        url = request.build_absolute_uri()
+        names = [term.lstrip('-') for term in ordering]
+        self.next_link = self.previous_link = None
+        if rows:
+            first = [getattr(rows[0], n) for n in names]
+            last = [getattr(rows[-1], n) for n in names]
+            # yendo hacia atras siempre hay siguiente; la fila extra indica si hay mas en el sentido recorrido
+            has_next = bool(cursor) if reverse else has_more
+            has_previous = has_more if reverse else bool(cursor)
+            if has_next:
+                self.next_link = replace_query_param(url, self.cursor_query_param, _encode_cursor(last))
+            if has_previous:
+                self.previous_link = replace_query_param(url, self.cursor_query_param, _encode_cursor(first, reverse=True))
+        return rows
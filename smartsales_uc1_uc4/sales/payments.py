@@ -0,0 +1,160 @@
+# sales/payments.py
+"""
+Ingesta de webhooks de pago (Stripe, MercadoPago, Cucu, BNB).
+
+El webhook solo normaliza el cuerpo e inserta una fila en PaymentWebhookEvent
+(INSERT ... ON CONFLICT DO NOTHING sobre (provider, event_id)), asi los reintentos
+del proveedor no vuelven a tocar ordenes ni stock. `process_payment_webhooks`
+toma lotes, resuelve todos los transaction_number en una consulta y confirma
+las ordenes con adjust_stock_on_paid.
+
+Un evento que falla (error del proveedor, de la base, etc.) queda FAILED con el error y
+no frena al resto del lote. Si el worker muere a mitad de lote, los eventos se vuelven a
+tomar tras WEBHOOK_CLAIM_TIMEOUT hasta WEBHOOK_MAX_ATTEMPTS veces y luego quedan FAILED.
+"""
+import hashlib
+import json
+import logging
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .services import adjust_stock_on_paid
+
+logger = logging.getLogger('sales.payments')
+
+PAID_STATES = ('paid', 'approved', 'success')
+
+# un evento en PROCESSING por mas de esto se considera abandonado (worker caido)
+WEBHOOK_CLAIM_TIMEOUT = timedelta(minutes=10)
+WEBHOOK_MAX_ATTEMPTS = 5
+
+
+def _parse_stripe(payload):
+    ext = payload.get('external_reference') or (payload.get('metadata') or {}).get('order_id')
+    state = (payload.get('status') or '').lower()
+    return ext, state, state in PAID_STATES + ('succeeded',)
+
+
+def _parse_mp(payload):
+    ext = payload.get('external_reference') or payload.get('order_id')
+    state = (payload.get('status') or payload.get('type') or '').lower()
+    return ext, state, state in PAID_STATES
+
+
+def _parse_cucu(payload):
+    ext = payload.get('external_reference') or payload.get('order_id')
+    state = (payload.get('status') or '').lower()
+    return ext, state, bool(payload.get('paid') or payload.get('success') or state in PAID_STATES)
+
+
+def _parse_bnb(payload):
+    ext = payload.get('external_reference') or payload.get('externalRef') or payload.get('order_code') or payload.get('order_id')
+    state = (payload.get('state') or payload.get('status') or '').lower()
+    return ext, state, state in PAID_STATES + ('completed',) or bool(payload.get('paid'))
+
+
+WEBHOOK_PARSERS = {
+    'stripe': _parse_stripe,
+    'mp': _parse_mp,
+    'cucu': _parse_cucu,
+    'bnb': _parse_bnb,
+}
+
+
+def _event_id(payload, state, raw_body):
+    """
+    Id del evento del proveedor + estado (un mismo pago notifica 'pending' y luego 'approved').
+    Sin id, el hash del cuerpo: un reintento identico es el mismo evento.
+    """
+    data = payload.get('data') if isinstance(payload.get('data'), dict) else {}
+    ext_id = payload.get('id') or payload.get('event_id') or payload.get('payment_id') or payload.get('transaction_id') or data.get('id')
+    if ext_id:
+        return f"{ext_id}:{state}"[:128]
+    return 'sha256:' + hashlib.sha256(raw_body).hexdigest()
+
+
+def record_webhook_event(provider, raw_body):
+    """Guarda el evento en la bandeja (una sola sentencia) y devuelve su event_id."""
+    from .models import PaymentWebhookEvent
+    try:
+        payload = json.loads(raw_body.decode('utf-8') or '{}')
+    except Exception:
+        payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    ext, state, paid = WEBHOOK_PARSERS[provider](payload)
+    event_id = _event_id(payload, state, raw_body)
+    PaymentWebhookEvent.objects.bulk_create([
+        PaymentWebhookEvent(
+            provider=provider, event_id=event_id,
+            external_reference=str(ext)[:120] if ext else None,
+            state=state[:40], paid=paid,
+            payload=raw_body.decode('utf-8', errors='replace'),
+        )
+    ], ignore_conflicts=True)
+    return event_id
+
+
+def claim_webhook_events(limit=200):
+    """Reserva hasta `limit` eventos pendientes para este worker (seguro con varios workers)."""
+    from .models import PaymentWebhookEvent
+    stale = Q(status='PROCESSING', claimed_at__lt=now() - WEBHOOK_CLAIM_TIMEOUT)
+    # un evento que ya tumbo al worker WEBHOOK_MAX_ATTEMPTS veces no se vuelve a tomar
+    PaymentWebhookEvent.objects.filter(stale, attempts__gte=WEBHOOK_MAX_ATTEMPTS).update(
+        status='FAILED', processed_at=now(),
+        error=f'Abandonado tras {WEBHOOK_MAX_ATTEMPTS} intentos sin terminar de procesarse',
+    )
+    claimable = Q(status='QUEUED') | (stale & Q(attempts__lt=WEBHOOK_MAX_ATTEMPTS))
+    ids = list(PaymentWebhookEvent.objects.filter(claimable).order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    PaymentWebhookEvent.objects.filter(claimable, pk__in=ids).update(
+        status='PROCESSING', claim_token=token, claimed_at=now(), attempts=F('attempts') + 1,
+    )
+    return list(PaymentWebhookEvent.objects.filter(claim_token=token, status='PROCESSING').order_by('id'))
+
+
+def _confirm_order(order_id):
+    """Marca PAID la orden si sigue pendiente; devuelve False si ya no correspondia."""
+    from .models import Order
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        if order.status != 'PENDING' or order.transaction_status == 'VOID':
+            return False
+        adjust_stock_on_paid(order)
+        return True
+
+
+def process_webhook_events(batch_size=200):
+    """Procesa un lote de la bandeja; devuelve cuantos eventos se tomaron."""
+    from .models import Order, PaymentTransaction, PaymentWebhookEvent
+    events = claim_webhook_events(batch_size)
+    if not events:
+        return 0
+    refs = {ev.external_reference for ev in events if ev.paid and ev.external_reference}
+    orders = Order.objects.filter(status='PENDING').only('id', 'transaction_number').in_bulk(refs, field_name='transaction_number')
+    confirmed = []
+    for ev in events:
+        order = orders.get(ev.external_reference) if ev.paid else None
+        ev.status, ev.error = 'IGNORED', None
+        if order is not None:
+            try:
+                if _confirm_order(order.pk):
+                    ev.status = 'DONE'
+                    confirmed.append(order.pk)
+            except ValueError as exc:
+                ev.status, ev.error = 'FAILED', str(exc)
+            except Exception as exc:
+                # un evento roto no debe dejar el lote entero en PROCESSING
+                logger.exception('Error procesando el webhook %s/%s', ev.provider, ev.event_id)
+                ev.status, ev.error = 'FAILED', f'{exc.__class__.__name__}: {exc}'
+        ev.processed_at = now()
+    PaymentWebhookEvent.objects.bulk_update(events, ['status', 'error', 'processed_at'])
+    if confirmed:
+        PaymentTransaction.objects.filter(order_id__in=confirmed, status__in=['CREATED', 'PENDING']).update(status='SUCCEEDED')
+    return len(events)
@@ -0,0 +1,305 @@
+# sales/pdf.py
+"""
+Motor comun de PDFs (comprobantes y reportes) sobre reportlab.platypus.
+
+- fonts(): registra la TTF una sola vez por proceso (Arial en Windows, DejaVu en
+  Linux o PDF_FONT_CANDIDATES de settings) y usa Helvetica si no hay ninguna. Antes
+  cada comprobante intentaba la ruta de Windows, levantaba la excepcion y volvia a
+  parsear DejaVu.
+- Plantillas de pagina: la primera con la banda de encabezado completa y las
+  siguientes con una banda angosta, todas con pie y numero de pagina. Geometria,
+  estilos y callbacks se arman una vez; por documento solo se instancian los
+  PageTemplate (los Frame guardan estado mientras se compone).
+- StreamingTable: tabla que consume un iterador de filas de a una pagina por vez,
+  con encabezado repetido y filas de alto fijo. No arma un Table enorme que platypus
+  tenga que partir pagina por pagina; se le puede pasar un .iterator() del queryset.
+- build_pdf(story, title) devuelve los bytes del documento.
+"""
+import logging
+import os
+from functools import lru_cache
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.utils.timezone import localtime
+from reportlab.lib.colors import HexColor, black, white  # type: ignore
+from reportlab.lib.pagesizes import A4  # type: ignore
+from reportlab.lib.styles import ParagraphStyle  # type: ignore
+from reportlab.lib.units import mm  # type: ignore
+from reportlab.pdfbase import pdfmetrics  # type: ignore
+from reportlab.pdfbase.ttfonts import TTFont  # type: ignore
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, PageTemplate, Paragraph, Spacer, Table, TableStyle  # type: ignore
+
+logger = logging.getLogger('sales.pdf')
+
+PDF_BRAND = getattr(settings, 'PDF_BRAND', 'SmartSales365')
+PDF_BRAND_COLOR = HexColor(getattr(settings, 'PDF_BRAND_COLOR', '#0B6E4F'))
+PDF_FONT_CANDIDATES = getattr(settings, 'PDF_FONT_CANDIDATES', (
+    ('Arial', r'C:\Windows\Fonts\arial.ttf', r'C:\Windows\Fonts\arialbd.ttf'),
+    ('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+))
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 20 * mm
+FIRST_BAND = 30 * mm
+LATER_BAND = 15 * mm
+FOOTER = 15 * mm
+CONTENT_WIDTH = PAGE_WIDTH - 2 * MARGIN
+ROW_HEIGHT = 5.5 * mm
+MUTED = HexColor('#666666')
+ZEBRA = HexColor('#F2F5F4')
+
+
+@lru_cache(maxsize=1)
+def fonts():
+    """(normal, negrita) registradas una vez por proceso."""
+    for name, regular, bold in PDF_FONT_CANDIDATES:
+        if not (os.path.exists(regular) and os.path.exists(bold)):
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(name, regular))
+            pdfmetrics.registerFont(TTFont(f'{name}-Bold', bold))
+            pdfmetrics.registerFontFamily(name, normal=name, bold=f'{name}-Bold', italic=name, boldItalic=f'{name}-Bold')
+            return name, f'{name}-Bold'
+        except Exception:
+            logger.warning('No se pudo registrar la fuente %s (%s)', name, regular, exc_info=True)
+    return 'Helvetica', 'Helvetica-Bold'
+
+
+@lru_cache(maxsize=1)
+def styles():
+    font, bold = fonts()
+    return {
+        'body': ParagraphStyle('body', fontName=font, fontSize=10, leading=14),
+        'small': ParagraphStyle('small', fontName=font, fontSize=9, leading=12),
+        'muted': ParagraphStyle('muted', fontName=font, fontSize=9, leading=12, textColor=MUTED),
+        'heading': ParagraphStyle('heading', fontName=bold, fontSize=11, leading=15, spaceBefore=8, spaceAfter=4, keepWithNext=1),
+    }
+
+
+@lru_cache(maxsize=1)
+def _frames():
+    """Geometria de los frames: (x, y, ancho, alto) de la primera pagina y de las siguientes."""
+    first = (MARGIN, FOOTER + 5 * mm, CONTENT_WIDTH, PAGE_HEIGHT - FIRST_BAND - FOOTER - 10 * mm)
+    later = (MARGIN, FOOTER + 5 * mm, CONTENT_WIDTH, PAGE_HEIGHT - LATER_BAND - FOOTER - 10 * mm)
+    return first, later
+
+
+def _footer(canvas, doc):
+    font, _bold = fonts()
+    canvas.setFillColor(MUTED)
+    canvas.setFont(font, 8)
+    canvas.drawString(MARGIN, FOOTER - 5 * mm, doc.generated_at)
+    canvas.drawRightString(PAGE_WIDTH - MARGIN, FOOTER - 5 * mm, f'Pagina {doc.page}')
+
+
+def _first_page(canvas, doc):
+    font, bold = fonts()
+    canvas.saveState()
+    canvas.setFillColor(PDF_BRAND_COLOR)
+    canvas.rect(0, PAGE_HEIGHT - FIRST_BAND, PAGE_WIDTH, FIRST_BAND, fill=1, stroke=0)
+    canvas.setFillColor(white)
+    canvas.setFont(bold, 16)
+    canvas.drawString(MARGIN, PAGE_HEIGHT - 15 * mm, doc.brand)
+    canvas.setFont(font, 10)
+    canvas.drawRightString(PAGE_WIDTH - MARGIN, PAGE_HEIGHT - 12 * mm, doc.title)
+    _footer(canvas, doc)
+    canvas.restoreState()
+
+
+def _later_pages(canvas, doc):
+    _font, bold = fonts()
+    canvas.saveState()
+    canvas.setFillColor(PDF_BRAND_COLOR)
+    canvas.rect(0, PAGE_HEIGHT - LATER_BAND, PAGE_WIDTH, LATER_BAND, fill=1, stroke=0)
+    canvas.setFillColor(white)
+    canvas.setFont(bold, 12)
+    canvas.drawString(MARGIN, PAGE_HEIGHT - 10 * mm, f'{doc.brand} - {doc.title}')
+    _footer(canvas, doc)
+    canvas.restoreState()
+
+
+class BrandedDocument(BaseDocTemplate):
+    def __init__(self, buf, title, brand=None, **kwargs):
+        super().__init__(buf, pagesize=A4, title=title, author=brand or PDF_BRAND, **kwargs)
+        self.brand = brand or PDF_BRAND
+        self.generated_at = f"Generado {localtime():%Y-%m-%d %H:%M}"
+        first, later = _frames()
+        self.addPageTemplates([
+            PageTemplate('first', [Frame(*first, id='first', leftPadding=0, rightPadding=0)], onPage=_first_page, autoNextPageTemplate='later'),
+            PageTemplate('later', [Frame(*later, id='later', leftPadding=0, rightPadding=0)], onPage=_later_pages),
+        ])
+
+
+def build_pdf(story, title, brand=None) -> bytes:
+    fonts()
+    buf = BytesIO()
+    BrandedDocument(buf, title, brand=brand).build(list(story))
+    return buf.getvalue()
+
+
+def paragraph(text, style='body'):
+    """Paragraph con el texto escapado (nombres de producto con & o < no rompen el markup)."""
+    return Paragraph(escape(str(text)), styles()[style])
+
+
+def heading(text):
+    return paragraph(text, 'heading')
+
+
+def spacer(height=4 * mm):
+    return Spacer(1, height)
+
+
+def fit_text(text, width, font, size):
+    """(texto, ancho): recorta `text` con '...' para que entre en `width` puntos."""
+    text = '' if text is None else str(text)
+    if len(text) * size <= width:
+        return text, None  # ningun glifo es mas ancho que el cuerpo: entra sin medir
+    measured = pdfmetrics.stringWidth(text, font, size)
+    if measured <= width:
+        return text, measured
+    while text and pdfmetrics.stringWidth(text + '...', font, size) > width:
+        text = text[:-1]
+    return text + '...', None
+
+
+class _TablePage(Flowable):
+    """Las filas de una pagina de StreamingTable: fondos y un solo objeto de texto."""
+
+    def __init__(self, spec, rows, width):
+        super().__init__()
+        self.spec = spec
+        self.rows = rows
+        self.width = width
+        self.height = ROW_HEIGHT * (len(rows) + 1)
+
+    def wrap(self, avail_width, avail_height):
+        return self.width, self.height
+
+    def draw(self):
+        spec, canv = self.spec, self.canv
+        font, bold = fonts()
+        size = spec.font_size
+        widths = [self.width * w for w in spec.col_widths]
+        lefts = [sum(widths[:i]) for i in range(len(widths))]
+        pad = 4
+        baseline = (ROW_HEIGHT - size * 0.7) / 2  # texto centrado en la fila
+        canv.saveState()
+        canv.setFillColor(PDF_BRAND_COLOR)
+        canv.rect(0, self.height - ROW_HEIGHT, self.width, ROW_HEIGHT, fill=1, stroke=0)
+        if spec.zebra:
+            canv.setFillColor(ZEBRA)
+            for i in range(1, len(self.rows), 2):
+                canv.rect(0, self.height - ROW_HEIGHT * (i + 2), self.width, ROW_HEIGHT, fill=1, stroke=0)
+        # desplazamientos relativos (Td) en vez de reposicionar con la matriz completa (Tm)
+        text = canv.beginText(0, 0)
+        cx = cy = 0
+        text.setFont(bold, size)
+        text.setFillColor(white)
+        for row_index, row in enumerate([spec.headers] + self.rows):
+            if row_index == 1:
+                text.setFont(font, size)
+                text.setFillColor(black)
+            y = self.height - ROW_HEIGHT * (row_index + 1) + baseline
+            for value, left, width, align in zip(row, lefts, widths, spec.align):
+                value, measured = fit_text(value, width - 2 * pad, bold if row_index == 0 else font, size)
+                if not value:
+                    continue
+                x = left + pad
+                if align == 'RIGHT':
+                    if measured is None:
+                        measured = pdfmetrics.stringWidth(value, bold if row_index == 0 else font, size)
+                    x = left + width - pad - measured
+                text.moveCursor(x - cx, cy - y)
+                cx, cy = x, y
+                text.textOut(value)
+        canv.drawText(text)
+        canv.restoreState()
+
+
+class StreamingTable(Flowable):
+    """
+    Tabla de una linea por fila que se reparte entre paginas sin materializar las filas:
+    en cada pagina toma del iterador solo las que entran. `col_widths` son fracciones
+    del ancho disponible (o None para columnas iguales); `align` ('LEFT'/'RIGHT') por columna.
+    """
+
+    def __init__(self, headers, rows, col_widths=None, align=None, font_size=8.5, zebra=True):
+        super().__init__()
+        self.headers = [str(h) for h in headers]
+        self.rows = iter(rows)
+        self.col_widths = col_widths or [1.0 / len(self.headers)] * len(self.headers)
+        self.align = align or ['LEFT'] * len(self.headers)
+        self.font_size = font_size
+        self.zebra = zebra
+        self._buffer = []
+        self._exhausted = False
+
+    def _fill(self, count):
+        while len(self._buffer) < count and not self._exhausted:
+            try:
+                self._buffer.append(next(self.rows))
+            except StopIteration:
+                self._exhausted = True
+
+    def _capacity(self, avail_height):
+        return int((avail_height - ROW_HEIGHT) // ROW_HEIGHT)
+
+    def wrap(self, avail_width, avail_height):
+        fit = max(self._capacity(avail_height), 0)
+        # una fila de mas para saber si el resto continua en otra pagina
+        self._fill(fit + 1)
+        self.width = avail_width
+        if fit and len(self._buffer) <= fit and self._exhausted:
+            self.height = ROW_HEIGHT * (len(self._buffer) + 1)
+        else:
+            self.height = avail_height + 1  # no entra: platypus llama a split()
+        return self.width, self.height
+
+    def split(self, avail_width, avail_height):
+        fit = self._capacity(avail_height)
+        if fit < 1:
+            return []  # ni una fila: pasar a la pagina siguiente
+        self._fill(fit + 1)
+        page, self._buffer = self._buffer[:fit], self._buffer[fit:]
+        # platypus marca con _postponed lo que no entro en un frame y falla si vuelve a no
+        # entrar; aqui si hubo avance, el resto puede volver a esperar una pagina nueva
+        self.__dict__.pop('_postponed', None)
+        if not self._buffer and self._exhausted:
+            return [_TablePage(self, page, avail_width)]
+        return [_TablePage(self, page, avail_width), self]
+
+    def draw(self):
+        page = _TablePage(self, self._buffer, self.width)
+        page.drawOn(self.canv, 0, 0)
+        self._buffer = []
+
+
+def key_value_table(pairs, label_width=0.35):
+    """Tabla de dos columnas (etiqueta, valor) sin bordes para encabezados y totales."""
+    font, bold = fonts()
+    data = [[str(k), str(v)] for k, v in pairs]
+    table = Table(data, colWidths=[CONTENT_WIDTH * label_width, CONTENT_WIDTH * (1 - label_width)], hAlign='LEFT')
+    table.setStyle(TableStyle([
+        ('FONT', (0, 0), (0, -1), bold, 10),
+        ('FONT', (1, 0), (1, -1), font, 10),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 1),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 1),
+    ]))
+    return table
+
+
+def highlight(text):
+    """Texto en blanco sobre la banda del color de la marca (p. ej. el TOTAL del comprobante)."""
+    _font, bold = fonts()
+    table = Table([[str(text)]], hAlign='LEFT')
+    table.setStyle(TableStyle([
+        ('FONT', (0, 0), (-1, -1), bold, 11),
+        ('BACKGROUND', (0, 0), (-1, -1), PDF_BRAND_COLOR),
+        ('TEXTCOLOR', (0, 0), (-1, -1), white),
+        ('LEFTPADDING', (0, 0), (-1, -1), 6),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ]))
+    return table
@@ -0,0 +1,280 @@
+# sales/receipts.py
+"""
+Comprobantes de compra renderizados una vez y servidos desde default_storage.
+
+- receipt_version(order): hash de lo que se imprime y puede cambiar (estado, estado
+  de la transaccion, datos del cliente, nombre del usuario) mas RECEIPT_LAYOUT_VERSION.
+  Las lineas y los importes se fijan en el checkout. Como la version sale de la fila
+  de la orden, cualquier cambio (save, update() masivo, webhook) da otra version sin
+  depender de signals; la signal solo borra los archivos viejos.
+- El archivo vive en receipts/<order_id>/<version>.pdf y nunca se reescribe: la
+  version es un ETag fuerte y la fecha del archivo el Last-Modified, asi que los
+  clientes revalidan con If-None-Match y reciben 304 sin renderizar ni leer storage.
+- manage.py prerender_receipts genera por adelantado los de las ordenes pagadas.
+- iter_receipts_zip(): ZIP de comprobantes (y opcionalmente el PDF de SalesReport) que
+  se arma mientras se envia. Las ordenes se leen por lotes; los comprobantes que faltan
+  se renderizan en el proceso web o, con RECEIPT_RENDER_WORKERS > 1, en un pool de
+  procesos mientras los que ya estan en storage se copian al ZIP. La memoria depende
+  del lote, no del total.
+- El pool es por proceso web y sus hijos viven lo que vive ese proceso (N procesos
+  Django extra por worker de gunicorn/uwsgi), por eso el default es 1 (sin pool).
+"""
+import atexit
+import hashlib
+import json
+import logging
+import multiprocessing
+import posixpath
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.dateparse import parse_date
+from django.utils.text import get_valid_filename
+from django.utils.timezone import localtime
+
+logger = logging.getLogger('sales.receipts')
+
+RECEIPT_RENDER_WORKERS = max(1, getattr(settings, 'RECEIPT_RENDER_WORKERS', 1) or 1)
+RECEIPT_ZIP_MAX_ORDERS = getattr(settings, 'RECEIPT_ZIP_MAX_ORDERS', 5000)
+RECEIPT_ZIP_BATCH = max(8, RECEIPT_RENDER_WORKERS * 4)
+ZIP_COPY_CHUNK = 64 * 1024
+
+RECEIPT_DIR = 'receipts'
+# subir cuando cambie el diseño del comprobante (sales.reports.render_order_receipt_pdf)
+RECEIPT_LAYOUT_VERSION = 1
+RECEIPT_FIELDS = (
+    'status', 'transaction_status', 'customer_name', 'customer_document',
+    'customer_phone', 'customer_warranty_note',
+)
+
+
+def receipt_version(order):
+    user = order.user
+    payload = [RECEIPT_LAYOUT_VERSION, order.pk, order.transaction_number]
+    payload += [getattr(order, field) or '' for field in RECEIPT_FIELDS]
+    payload += [user.get_full_name(), user.username]
+    raw = json.dumps(payload, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def receipt_path(order_id, version):
+    return posixpath.join(RECEIPT_DIR, str(order_id), f'{version}.pdf')
+
+
+def get_or_render_receipt(order, version=None, force=False):
+    """Devuelve (ruta, creado). Renderiza solo si no existe el archivo de esa version."""
+    from .reports import render_order_receipt_pdf
+    version = version or receipt_version(order)
+    path = receipt_path(order.pk, version)
+    if not force and default_storage.exists(path):
+        return path, False
+    if force and default_storage.exists(path):
+        default_storage.delete(path)
+    store_receipt(order.pk, path, render_order_receipt_pdf(order))
+    return path, True
+
+
+def store_receipt(order_id, path, pdf_bytes):
+    saved = default_storage.save(path, ContentFile(pdf_bytes))
+    if saved != path:
+        # otro request lo guardo entre exists() y save(): el contenido es equivalente
+        default_storage.delete(saved)
+    purge_receipts(order_id, keep=path)
+
+
+def purge_receipts(order_id, keep=None):
+    """Borra las versiones anteriores del comprobante de una orden."""
+    folder = posixpath.join(RECEIPT_DIR, str(order_id))
+    try:
+        _dirs, files = default_storage.listdir(folder)
+    except (FileNotFoundError, NotImplementedError):
+        return 0
+    removed = 0
+    for name in files:
+        path = posixpath.join(folder, name)
+        if path != keep:
+            try:
+                default_storage.delete(path)
+                removed += 1
+            except Exception:
+                logger.warning('No se pudo borrar el comprobante %s', path, exc_info=True)
+    return removed
+
+
+# ----------------------------
+# Render en lote (pool de procesos)
+# ----------------------------
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _init_render_worker():
+    import django
+    django.setup()
+
+
+def _render_receipt_bytes(order, items):
+    from .reports import render_order_receipt_pdf
+    return render_order_receipt_pdf(order, items=items)
+
+
+def receipt_pool():
+    """
+    Pool compartido por el proceso web. Usa 'spawn': los hijos no heredan las conexiones
+    a la base ni los hilos del servidor; solo reciben la orden ya cargada y devuelven bytes.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=RECEIPT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_render_worker,
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+
+def ensure_receipts(orders):
+    """
+    Genera (orden, ruta) para un lote de ordenes con user e items precargados. Los que
+    faltan se mandan al pool antes de devolver los que ya estan en storage, asi el
+    render en los hijos se solapa con la copia de esos al ZIP.
+    """
+    cached, pending = [], []
+    for order in orders:
+        path = receipt_path(order.pk, receipt_version(order))
+        (cached if default_storage.exists(path) else pending).append((order, path))
+    pool = receipt_pool() if RECEIPT_RENDER_WORKERS > 1 and len(pending) > 1 else None
+    futures = [
+        (order, path, pool.submit(_render_receipt_bytes, order, list(order.items.all())) if pool else None)
+        for order, path in pending
+    ]
+    yield from cached
+    for order, path, future in futures:
+        try:
+            pdf_bytes = future.result() if future else None
+        except BrokenProcessPool:
+            # un hijo murio (OOM, kill): se rehace el pool la proxima vez y esta se renderiza aca
+            _reset_pool()
+            pdf_bytes = None
+        if pdf_bytes is None:
+            pdf_bytes = _render_receipt_bytes(order, list(order.items.all()))
+        store_receipt(order.pk, path, pdf_bytes)
+        yield order, path
+
+
+# ----------------------------
+# ZIP en streaming
+# ----------------------------
+
+class _ZipBuffer:
+    """Destino no seekable de zipfile: junta lo escrito hasta que el generador lo entrega."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_storage_file(zf, buf, arcname, path, when):
+    info = zipfile.ZipInfo(arcname, date_time=localtime(when).timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED  # los PDF ya van comprimidos
+    with default_storage.open(path, 'rb') as src, zf.open(info, 'w') as dst:
+        while True:
+            chunk = src.read(ZIP_COPY_CHUNK)
+            if not chunk:
+                break
+            dst.write(chunk)
+            data = buf.take()
+            if data:
+                yield data
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_receipts_zip(orders, extra_files=()):
+    """
+    Bytes del ZIP: primero `extra_files` [(nombre, ruta en storage, fecha)] y luego
+    comprobantes/<transaccion>.pdf por cada orden de `orders` (queryset).
+    """
+    buf = _ZipBuffer()
+    with zipfile.ZipFile(buf, 'w', allowZip64=True) as zf:
+        for arcname, path, when in extra_files:
+            yield from _zip_storage_file(zf, buf, arcname, path, when)
+        qs = orders.select_related('user').prefetch_related('items')
+        for batch in _batches(qs.iterator(chunk_size=RECEIPT_ZIP_BATCH), RECEIPT_ZIP_BATCH):
+            for order, path in ensure_receipts(batch):
+                arcname = f"comprobantes/{get_valid_filename(order.transaction_number)}.pdf"
+                yield from _zip_storage_file(zf, buf, arcname, path, order.created_at)
+    yield buf.take()  # directorio central
+
+
+def _parse_day(data, key):
+    value = data.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        day = parse_date(str(value).strip())
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValueError(f'{key} invalida: use el formato AAAA-MM-DD')
+    return day
+
+
+def receipt_export_queryset(data):
+    """Ordenes a exportar: `ids` (lista o 'a,b,c') o rango date_from/date_to de ordenes pagadas."""
+    from .models import Order
+    from .services import day_range
+    data = data or {}
+    ids = data.get('ids') or []
+    if isinstance(ids, str):
+        ids = [part for part in ids.split(',') if part.strip()]
+    try:
+        ids = [int(value) for value in ids]
+    except (TypeError, ValueError):
+        raise ValueError('ids debe ser una lista de enteros')
+    date_from, date_to = _parse_day(data, 'date_from'), _parse_day(data, 'date_to')
+    if not ids and not (date_from or date_to):
+        raise ValueError('Indique ids o un rango de fechas (date_from/date_to)')
+    if ids:
+        qs = Order.objects.filter(pk__in=ids)
+    else:
+        qs = Order.objects.filter(status='PAID').filter(day_range('created_at', date_from, date_to))
+    if str(data.get('include_void') or '').lower() not in ('1', 'true', 'yes', 'si'):
+        qs = qs.exclude(transaction_status='VOID')
+    if qs.count() > RECEIPT_ZIP_MAX_ORDERS:
+        raise ValueError(f'Demasiadas ordenes para un ZIP (maximo {RECEIPT_ZIP_MAX_ORDERS}); acote el rango')
+    return qs.order_by('created_at', 'id')
@@ -0,0 +1,421 @@
+# sales/reports.py
+"""
+Generación de reportes (PDF/Excel) y cola de trabajos ReportJob.
+Las vistas síncronas y el worker (manage.py run_report_worker) comparten estas funciones.
+"""
+import datetime
+import hashlib
+import json
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+
+from django.core.files.base import ContentFile, File
+from django.db.models import Count, F, Max, Q
+from django.utils.timezone import localtime, now
+
+from .services import (
+    build_sales_report_filters, day_range, sales_report_summary, iter_sales_report_detail,
+    parse_prompt_to_spec, sales_aggregate, fallback_aggregate_rows,
+    export_to_pdf, validate_sales_report_filters, write_excel,
+)
+
+# un trabajo RUNNING por mas de esto se considera abandonado (worker caido)
+REPORT_JOB_TIMEOUT = datetime.timedelta(minutes=30)
+REPORT_JOB_MAX_ATTEMPTS = 3
+
+
+def _timestamp():
+    return datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+
+
+# ----------------------------
+# Cache de reportes (por contenido)
+# ----------------------------
+
+def _normalize_filters(f):
+    """
+    Forma canónica de los filtros: texto sin espacios, marca/categoría/modelo en
+    minúsculas y precios como Decimal normalizado ('' si no son válidos, igual
+    que los ignora el motor de reportes).
+    """
+    out = {}
+    for key in sorted(f or {}):
+        value = '' if f[key] is None else str(f[key]).strip()
+        if key in ('brand', 'category', 'model'):
+            value = value.lower()
+        elif key in ('min_price', 'max_price') and value:
+            try:
+                value = str(Decimal(value).normalize())
+            except Exception:
+                value = ''
+        out[key] = value
+    return out
+
+
+def _created_range(qs, f, field='created_at'):
+    return qs.filter(day_range(field, f.get('date_from'), f.get('date_to')))
+
+
+def sales_report_watermark(f):
+    """
+    Versión de los datos del rango: cambia cuando una orden del intervalo se
+    paga, se anula o cambia de estado PAID (ventas locales, webhooks, void), y
+    cuando cambia el catálogo que el reporte muestra (nombres de marca/categoría,
+    recategorización de productos, altas y bajas).
+    """
+    from .models import Brand, Category, Order, Product
+    agg = _created_range(Order.objects.all(), f).aggregate(
+        paid=Max('paid_at'), voided=Max('voided_at'), paid_count=Count('id', filter=Q(status='PAID')),
+    )
+    catalog = [
+        model.objects.aggregate(changed=Max('updated_at'), total=Count('id'))
+        for model in (Brand, Category, Product)
+    ]
+    return [str(agg['paid'] or ''), str(agg['voided'] or ''), agg['paid_count']] + [
+        [str(c['changed'] or ''), c['total']] for c in catalog
+    ]
+
+
+def audit_report_watermark(f):
+    """La bitácora es append-only: basta el último id y el conteo del rango."""
+    from .models import AdminAuditLog
+    agg = _created_range(AdminAuditLog.objects.all(), f).aggregate(last=Max('id'), total=Count('id'))
+    return [agg['last'] or 0, agg['total']]
+
+
+def report_cache_key(kind, f, watermark):
+    payload = json.dumps({'kind': kind, 'filters': _normalize_filters(f), 'watermark': watermark}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _cached_report(model, key):
+    from django.core.files.storage import default_storage
+    rep = model.objects.filter(cache_key=key).order_by('-created_at').first()
+    if rep and rep.pdf_file and default_storage.exists(rep.pdf_file.name):
+        return rep
+    return None
+
+
+# ----------------------------
+# Reporte de ventas
+# ----------------------------
+
+def _amount(value):
+    return f"{float(value or 0):.2f}"
+
+
+def render_sales_report_pdf(f) -> bytes:
+    from .pdf import StreamingTable, build_pdf, heading, key_value_table, paragraph, spacer
+
+    summary = sales_report_summary(f)
+    story = [
+        key_value_table([
+            ('Intervalo', f"{f['date_from'] or '-'} a {f['date_to'] or '-'}"),
+            ('Filtros', f"marca={f['brand'] or '-'}  categoría={f['category'] or '-'}  min={f['min_price'] or '-'}  max={f['max_price'] or '-'}"),
+            ('Órdenes', summary['orders_count']),
+            ('Ticket promedio', _amount(summary['avg_ticket'])),
+            ('Líneas vendidas', summary['lines_count']),
+            ('Total vendido', _amount(summary['total'])),
+        ]),
+        spacer(),
+    ]
+    sections = (
+        ('Totales por marca', ('Marca', 'Importe'), [(name or 'Sin marca', _amount(amt)) for name, amt in summary['by_brand']]),
+        ('Totales por categoría', ('Categoría', 'Importe'), [(name or 'Sin categoría', _amount(amt)) for name, amt in summary['by_category']]),
+        ('Top 5 productos por unidades', ('Producto', 'Unidades'), [(name, q) for name, q in summary['top_qty']]),
+        ('Top 5 productos por importe', ('Producto', 'Importe'), [(name, _amount(amt)) for name, amt in summary['top_amount']]),
+    )
+    for title, headers, rows in sections:
+        story += [heading(title), StreamingTable(headers, rows, col_widths=[0.75, 0.25], align=['LEFT', 'RIGHT'])]
+    detail = (
+        (order_id, name, qty, unit_price, line_total)
+        for order_id, name, qty, unit_price, line_total, *_rest in iter_sales_report_detail(f, limit=200)
+    )
+    story += [
+        heading('Detalle'),
+        StreamingTable(
+            ('Orden', 'Producto', 'Cant.', 'P. unit.', 'Importe'), detail,
+            col_widths=[0.1, 0.5, 0.1, 0.15, 0.15], align=['LEFT', 'LEFT', 'RIGHT', 'RIGHT', 'RIGHT'],
+        ),
+    ]
+    if not summary['lines_count']:
+        story.append(paragraph('Sin ventas para los filtros indicados.', 'muted'))
+    return build_pdf(story, 'Reporte de Ventas')
+
+
+def create_sales_report(user, f, refresh=False):
+    """
+    Devuelve (SalesReport, hit). Si ya existe un PDF para los mismos filtros y
+    la misma versión de datos se reutiliza en vez de renderizar otro.
+    """
+    from .models import SalesReport
+    key = report_cache_key('sales', f, sales_report_watermark(f))
+    if not refresh:
+        cached = _cached_report(SalesReport, key)
+        if cached:
+            return cached, True
+    pdf_bytes = render_sales_report_pdf(f)
+    rep = SalesReport(created_by=user, filters=f, cache_key=key)
+    rep.pdf_file.save(f"sales_{_timestamp()}.pdf", ContentFile(pdf_bytes))
+    rep.save()
+    return rep, False
+
+
+# ----------------------------
+# Reporte de auditoría
+# ----------------------------
+
+def build_audit_report_filters(data):
+    data = data or {}
+    return {
+        'date_from': data.get('date_from'),
+        'date_to': data.get('date_to'),
+        'action': data.get('action') or '',
+        'model': data.get('model') or '',
+    }
+
+
+def audit_log_queryset(f):
+    """AdminAuditLog filtrado con los mismos filtros del reporte (lo usa tambien el listado JSON)."""
+    from .models import AdminAuditLog
+    qs = AdminAuditLog.objects.all().select_related('user').filter(
+        day_range('created_at', f['date_from'], f['date_to']),
+    )
+    if f['action']:
+        qs = qs.filter(action=f['action'])
+    if f['model']:
+        qs = qs.filter(model_name__iexact=f['model'])
+    return qs
+
+
+def render_audit_report_pdf(f) -> bytes:
+    from .pdf import StreamingTable, build_pdf, key_value_table, spacer
+
+    logs = audit_log_queryset(f).order_by('-created_at').values_list(
+        'created_at', 'user__username', 'action', 'model_name', 'object_id',
+    )[:1000]
+    rows = (
+        (localtime(created).strftime('%Y-%m-%d %H:%M:%S'), who or 'N/A', action, f"{model}#{object_id}")
+        for created, who, action, model, object_id in logs.iterator(chunk_size=500)
+    )
+    story = [
+        key_value_table([
+            ('Intervalo', f"{f['date_from'] or '-'} a {f['date_to'] or '-'}"),
+            ('Filtros', f"action={f['action'] or '-'}  model={f['model'] or '-'}"),
+        ]),
+        spacer(),
+        StreamingTable(('Fecha', 'Usuario', 'Acción', 'Objeto'), rows, col_widths=[0.22, 0.2, 0.28, 0.3]),
+    ]
+    return build_pdf(story, 'Auditoría de Admin')
+
+
+def create_audit_report(user, f, refresh=False):
+    """Devuelve (AuditReport, hit); mismo esquema de cache que create_sales_report."""
+    from .models import AuditReport
+    key = report_cache_key('audit', f, audit_report_watermark(f))
+    if not refresh:
+        cached = _cached_report(AuditReport, key)
+        if cached:
+            return cached, True
+    pdf_bytes = render_audit_report_pdf(f)
+    rep = AuditReport(created_by=user, filters=f, cache_key=key)
+    rep.pdf_file.save(f"audit_{_timestamp()}.pdf", ContentFile(pdf_bytes))
+    rep.save()
+    return rep, False
+
+
+# ----------------------------
+# Comprobante de compra
+# ----------------------------
+
+def _bs(value):
+    return f"Bs. {float(value or 0):.2f}"
+
+
+def render_order_receipt_pdf(order, items=None) -> bytes:
+    """Comprobante de una orden; `items` permite pasar las lineas ya cargadas."""
+    from .pdf import StreamingTable, build_pdf, heading, highlight, key_value_table, paragraph, spacer
+
+    items = order.items.all() if items is None else items
+    header = [
+        ('Transaccion', order.transaction_number),
+        ('Fecha', localtime(order.created_at).strftime('%Y-%m-%d %H:%M')),
+        ('Cliente', order.customer_name or order.user.get_full_name() or order.user.username),
+    ]
+    if order.customer_document:
+        header.append(('Documento', order.customer_document))
+    if order.customer_phone:
+        header.append(('Telefono', order.customer_phone))
+    lines = []
+    for it in items:
+        lines.append((it.qty, it.name_snapshot, _bs(it.unit_price), _bs(it.line_total)))
+        if it.warranty_expires_at:
+            lines.append(('', f"   Garantia hasta: {it.warranty_expires_at}", '', ''))
+    story = [
+        key_value_table(header, label_width=0.2),
+        heading('Items'),
+        StreamingTable(('Cant.', 'Producto', 'P. unit.', 'Importe'), lines, col_widths=[0.08, 0.56, 0.18, 0.18], align=['RIGHT', 'LEFT', 'RIGHT', 'RIGHT']),
+        spacer(),
+        key_value_table([
+            ('Subtotal', _bs(order.subtotal)),
+            ('Envio', _bs(order.shipping_total)),
+            ('Descuento', _bs(order.discount_total)),
+            ('Impuestos', _bs(order.tax_total)),
+        ], label_width=0.2),
+        spacer(2),
+        highlight(f"TOTAL: {_bs(order.grand_total)}"),
+        spacer(),
+        paragraph(f"Estado: {order.status}  | Transaccion: {order.transaction_status}", 'small'),
+    ]
+    if order.customer_warranty_note:
+        story.append(paragraph(f"Garantia declarada: {order.customer_warranty_note}", 'small'))
+    story.append(paragraph('Gracias por su compra. Conserve este comprobante para garantias.', 'small'))
+    return build_pdf(story, 'Comprobante de Compra')
+
+
+# ----------------------------
+# Reporte por prompt
+# ----------------------------
+
+PROMPT_REPORT_FILES = {
+    'pdf': ('reporte.pdf', 'application/pdf'),
+    'excel': ('reporte.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+
+def build_prompt_report(prompt, force_format=None):
+    """
+    Devuelve (spec, rows) para un prompt de reporte en lenguaje natural. Para Excel, rows
+    es el queryset agregado sin evaluar: open_prompt_report lo recorre con iterator().
+    """
+    spec = parse_prompt_to_spec(prompt)
+    if force_format and force_format.lower() in ('pdf', 'excel', 'screen'):
+        spec['format'] = force_format.lower()
+    lazy = spec.get('format') == 'excel'
+    rows = sales_aggregate(
+        spec.get('group_by'), start=spec.get('start'), end=spec.get('end'),
+        category_ids=spec.get('category_ids'), keyword_key=spec.get('keyword_key'), lazy=lazy,
+    )
+    empty = not rows.exists() if lazy else not rows
+    if empty and not spec.get('explicit_range'):
+        cat_id = (spec.get('category_ids') or [None])[0]
+        rows = fallback_aggregate_rows(spec.get('group_by'), category_id=cat_id)
+    return spec, rows
+
+
+def open_prompt_report(rows, fmt):
+    """
+    Archivo (binario, al inicio) con el reporte listo para FileResponse o FieldFile.save.
+    El Excel se escribe directo a un archivo temporal en disco, que se borra al cerrarlo.
+    """
+    if fmt == 'pdf':
+        return BytesIO(export_to_pdf(rows, title='Reporte de Ventas'))
+    if fmt == 'excel':
+        tmp = tempfile.TemporaryFile(suffix='.xlsx')
+        try:
+            write_excel(rows, tmp, title='Reporte de Ventas')
+        except Exception:
+            tmp.close()
+            raise
+        tmp.seek(0)
+        return tmp
+    raise ValueError(f'Formato no soportado: {fmt}')
+
+
+# ----------------------------
+# Cola de trabajos (ReportJob)
+# ----------------------------
+
+def enqueue_report_job(user, kind, params):
+    """Registra un trabajo en estado QUEUED; lo procesa run_report_worker."""
+    from .models import ReportJob
+    if kind not in dict(ReportJob.KINDS):
+        raise ValueError(f'Tipo de reporte invalido: {kind}')
+    if kind == 'sales':
+        params = validate_sales_report_filters(build_sales_report_filters(params))
+    elif kind == 'audit':
+        params = validate_sales_report_filters(build_audit_report_filters(params))
+    else:
+        prompt = ((params or {}).get('prompt') or '').strip()
+        if not prompt:
+            raise ValueError('prompt requerido')
+        fmt = ((params or {}).get('format') or '').lower() or None
+        if fmt not in (None, 'pdf', 'excel'):
+            raise ValueError('format debe ser pdf o excel')
+        params = {'prompt': prompt, 'format': fmt}
+    return ReportJob.objects.create(created_by=user, kind=kind, params=params)
+
+
+def claim_next_report_job():
+    """
+    Toma el siguiente trabajo QUEUED, o RUNNING abandonado (started_at de hace mas de
+    REPORT_JOB_TIMEOUT), con un UPDATE condicional, de modo que varios workers pueden
+    correr en paralelo sin procesar dos veces el mismo. Un trabajo que ya se tomo
+    REPORT_JOB_MAX_ATTEMPTS veces sin terminar queda FAILED.
+    """
+    from .models import ReportJob
+    stale = Q(status='RUNNING', started_at__lt=now() - REPORT_JOB_TIMEOUT)
+    ReportJob.objects.filter(stale, attempts__gte=REPORT_JOB_MAX_ATTEMPTS).update(
+        status='FAILED', finished_at=now(),
+        error=f'Abandonado tras {REPORT_JOB_MAX_ATTEMPTS} intentos sin terminar',
+    )
+    claimable = Q(status='QUEUED') | (stale & Q(attempts__lt=REPORT_JOB_MAX_ATTEMPTS))
+    while True:
+        job = ReportJob.objects.filter(claimable).order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        # started_at distingue una toma ajena hecha entre la lectura y el UPDATE
+        claimed = ReportJob.objects.filter(claimable, pk=job.pk, status=job.status, started_at=job.started_at).update(
+            status='RUNNING', started_at=now(), progress=5, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def _set_progress(job, progress):
+    job.progress = progress
+    type(job).objects.filter(pk=job.pk).update(progress=progress)
+
+
+def run_report_job(job):
+    try:
+        _set_progress(job, 10)
+        updates = ['status', 'progress', 'finished_at']
+        if job.kind == 'sales':
+            job.sales_report, _hit = create_sales_report(job.created_by, job.params)
+            updates.append('sales_report')
+        elif job.kind == 'audit':
+            job.audit_report, _hit = create_audit_report(job.created_by, job.params)
+            updates.append('audit_report')
+        else:
+            spec, rows = build_prompt_report(job.params.get('prompt'), job.params.get('format'))
+            fmt = spec.get('format') if spec.get('format') in PROMPT_REPORT_FILES else 'pdf'
+            _set_progress(job, 50)
+            name = PROMPT_REPORT_FILES[fmt][0].replace('reporte', f'reporte_{job.pk}_{_timestamp()}')
+            with open_prompt_report(rows, fmt) as content:
+                job.result_file.save(name, File(content), save=False)
+            updates.append('result_file')
+        job.status = 'DONE'
+        job.progress = 100
+        job.finished_at = now()
+        job.save(update_fields=updates)
+    except Exception as exc:
+        job.status = 'FAILED'
+        job.error = str(exc) or exc.__class__.__name__
+        job.finished_at = now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def report_job_file(job):
+    """Devuelve (FieldFile, content_type) del resultado de un trabajo DONE."""
+    if job.sales_report_id:
+        return job.sales_report.pdf_file, 'application/pdf'
+    if job.audit_report_id:
+        return job.audit_report.pdf_file, 'application/pdf'
+    if job.result_file:
+        is_excel = job.result_file.name.endswith('.xlsx')
+        return job.result_file, PROMPT_REPORT_FILES['excel' if is_excel else 'pdf'][1]
+    return None, None
@@ -0,0 +1,189 @@
+# sales/search.py
+"""
+Busqueda de productos sobre un indice sombra (ProductSearchDocument).
+
+El texto se guarda ya normalizado (sin acentos, minusculas) con el mismo
+_normalize_text que usa el resto de services, asi "climatizacion" encuentra
+"Climatización". Backends:
+- SQLite: tabla FTS5 `sales_product_fts` (external content + triggers, ver
+  migracion 0013) ordenada por bm25 con pesos por columna.
+- PostgreSQL: SearchVector/SearchQuery sobre `document` (indice GIN) y SearchRank ponderado.
+- Otros / SQLite sin FTS5: LIKE sobre el texto normalizado.
+El indice se mantiene con signals de Product/Brand/Category; `rebuild_search_index` lo regenera.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+
+from .services import _normalize_text
+
+FTS_TABLE = 'sales_product_fts'
+# pesos bm25 por columna: name, keywords (marca, categoria, color, tamaño), body (descripcion)
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+# tope de ids ordenados por relevancia: 20 paginas del storefront (PAGE_SIZE 12); el
+# resto de las coincidencias se lista despues, por nombre
+SEARCH_MAX_RESULTS = 240
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+_backend = None
+
+
+def normalize_search_text(value) -> str:
+    return _normalize_text(str(value or '')).lower()
+
+
+def search_tokens(value):
+    """Tokenizador compartido por indexacion y consulta."""
+    return _TOKEN_RE.findall(normalize_search_text(value))
+
+
+def build_document_fields(name, description=None, color=None, size=None, brand=None, category=None):
+    """Campos normalizados de ProductSearchDocument (la migracion 0013 tiene su propia copia)."""
+    name = ' '.join(search_tokens(name))
+    keywords = ' '.join(search_tokens(' '.join(str(v) for v in (brand, category, color, size) if v)))
+    body = ' '.join(search_tokens(description))
+    return {
+        'name': name,
+        'keywords': keywords,
+        'body': body,
+        'document': ' '.join(part for part in (name, keywords, body) if part),
+    }
+
+
+def _document_for(product):
+    from .models import ProductSearchDocument
+    return ProductSearchDocument(product_id=product.pk, **build_document_fields(
+        product.name, product.description, product.color, product.size,
+        product.brand.name if product.brand else None,
+        product.category.name if product.category else None,
+    ))
+
+
+def index_products(products, batch_size=1000):
+    """Reindexa los productos dados (queryset o lista de ids). Devuelve cuantos se indexaron."""
+    from .models import Product, ProductSearchDocument
+    if not hasattr(products, 'select_related'):
+        products = Product.objects.filter(pk__in=list(products))
+    docs = [_document_for(p) for p in products.select_related('brand', 'category')]
+    ProductSearchDocument.objects.filter(product_id__in=[d.product_id for d in docs]).delete()
+    ProductSearchDocument.objects.bulk_create(docs, batch_size=batch_size)
+    return len(docs)
+
+
+def rebuild_search_index(batch_size=1000):
+    from .models import Product, ProductSearchDocument
+    ProductSearchDocument.objects.all().delete()
+    total = 0
+    ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(ids), batch_size):
+        total += index_products(ids[i:i + batch_size], batch_size=batch_size)
+    if search_backend() == 'fts5':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+    return total
+
+
+def search_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'postgresql':
+            _backend = 'postgresql'
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backend = 'fts5'
+        else:
+            _backend = 'like'
+    return _backend
+
+
+def _fts_match(tokens):
+    return ' '.join(f'"{t}"*' for t in tokens)
+
+
+def _pg_query(tokens):
+    from django.contrib.postgres.search import SearchQuery
+    return SearchQuery(' & '.join(f'{t}:*' for t in tokens), search_type='raw', config='simple')
+
+
+def matching_product_ids(query):
+    """Subconsulta (sin orden ni tope) con los ids que contienen todos los terminos."""
+    from django.db.models.expressions import RawSQL
+    from .models import ProductSearchDocument
+    tokens = search_tokens(query)
+    if not tokens:
+        return ProductSearchDocument.objects.none().values('product_id')
+    backend = search_backend()
+    if backend == 'fts5':
+        return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts_match(tokens)])
+    if backend == 'postgresql':
+        from django.contrib.postgres.search import SearchVector
+        return ProductSearchDocument.objects.annotate(
+            vector=SearchVector('document', config='simple'),
+        ).filter(vector=_pg_query(tokens)).values('product_id')
+    qs = ProductSearchDocument.objects.all()
+    for t in tokens:
+        qs = qs.filter(document__contains=t)
+    return qs.values('product_id')
+
+
+def search_product_ids(query, limit=SEARCH_MAX_RESULTS, within=None):
+    """
+    Ids de productos que contienen todos los terminos (prefijo), del mas al menos relevante.
+    `within` (queryset de Product) acota la busqueda antes del tope.
+    """
+    from .models import ProductSearchDocument
+    tokens = search_tokens(query)
+    if not tokens:
+        return []
+    backend = search_backend()
+    if backend == 'fts5':
+        weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+        sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        params = [_fts_match(tokens)]
+        if within is not None:
+            inner, inner_params = within.order_by().values('pk').query.sql_with_params()
+            sql += f" AND rowid IN ({inner})"
+            params += list(inner_params)
+        with connection.cursor() as cursor:
+            cursor.execute(f"{sql} ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s", params + [limit])
+            return [row[0] for row in cursor.fetchall()]
+    if backend == 'postgresql':
+        from django.contrib.postgres.search import SearchRank, SearchVector
+        ts_query = _pg_query(tokens)
+        weighted = (
+            SearchVector('name', config='simple', weight='A')
+            + SearchVector('keywords', config='simple', weight='B')
+            + SearchVector('body', config='simple', weight='C')
+        )
+        qs = ProductSearchDocument.objects.annotate(vector=SearchVector('document', config='simple')).filter(vector=ts_query)
+        if within is not None:
+            qs = qs.filter(product_id__in=within.order_by().values('pk'))
+        qs = qs.annotate(rank=SearchRank(weighted, ts_query)).order_by('-rank', 'product_id')
+        return list(qs.values_list('product_id', flat=True)[:limit])
+    qs = ProductSearchDocument.objects.all()
+    if within is not None:
+        qs = qs.filter(product_id__in=within.order_by().values('pk'))
+    for t in tokens:
+        qs = qs.filter(document__contains=t)
+    return list(qs.order_by('product_id').values_list('product_id', flat=True)[:limit])
+
+
+def apply_product_search(qs, query, ranked=True):
+    """
+    Filtra un queryset de Product por la busqueda (todas las coincidencias, sin tope), asi el
+    conteo no depende del orden. Con ranked=True primero van los SEARCH_MAX_RESULTS mas
+    relevantes dentro de `qs` y despues el resto por nombre. Aplicar despues de los demas
+    filtros, para que el tope se tome sobre los productos que se van a listar.
+    """
+    matched = qs.filter(pk__in=matching_product_ids(query))
+    if not ranked:
+        return matched
+    ids = search_product_ids(query, limit=SEARCH_MAX_RESULTS, within=qs)
+    if not ids:
+        return matched.none()
+    ordering = Case(
+        *[When(pk=pid, then=pos) for pos, pid in enumerate(ids)],
+        default=Value(len(ids)), output_field=IntegerField(),
+    )
+    return matched.order_by(ordering, 'name', 'pk')
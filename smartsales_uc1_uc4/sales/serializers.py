@@ -2,14 +2,13 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.db import transaction
-from datetime import date
-from dateutil.relativedelta import relativedelta  # pip install python-dateutil
 
 from .models import (
     UserProfile, UserAddress, Brand, Category, Product,
     Cart, CartItem, Order, OrderItem,
-    SalesReport, AuditReport, AdminAuditLog
+    SalesReport, AuditReport, AdminAuditLog, ReportJob, ForecastTrainingJob
 )
+from .services import build_order_items
 
 # ───────────────────────────
 # AUTH / PERFIL
@@ -294,6 +293,36 @@ class AuditReportSerializer(serializers.ModelSerializer):
         model = AuditReport
         fields = ['id', 'created_by', 'created_at', 'filters', 'pdf_file']
 
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReportJob
+        fields = [
+            'id', 'kind', 'status', 'progress', 'attempts', 'params', 'error', 'created_by',
+            'sales_report', 'audit_report', 'result_file',
+            'created_at', 'started_at', 'finished_at',
+        ]
+        read_only_fields = fields
+
+
+class AdminAuditLogSerializer(serializers.ModelSerializer):
+    username = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AdminAuditLog
+        fields = ['id', 'created_at', 'user', 'username', 'action', 'model_name', 'object_id', 'before_data', 'after_data']
+        read_only_fields = fields
+
+    def get_username(self, obj):
+        return obj.user.get_username() if obj.user_id else None
+
+
+class ForecastTrainingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ForecastTrainingJob
+        fields = ['id', 'scope', 'full', 'status', 'attempts', 'info', 'error', 'created_by', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
 # ───────────────────────────
 # CARRITO
 # ───────────────────────────
@@ -364,7 +393,8 @@ class CheckoutSerializer(serializers.Serializer):
         shipping = UserAddress.objects.filter(user=user, id=ship_id).first() if ship_id else None
         billing = UserAddress.objects.filter(user=user, id=bill_id).first() if bill_id else None
 
-        subtotal = sum([i.qty * i.price_snapshot for i in cart.items.all()])
+        cart_items = list(cart.items.select_related('product'))
+        subtotal = sum([i.qty * i.price_snapshot for i in cart_items])
         discount_total = 0
         tax_total = 0
         shipping_total = 0
@@ -381,21 +411,12 @@ class CheckoutSerializer(serializers.Serializer):
         )
 
         # Items snapshot (no descontamos stock todavía)
-        today = date.today()
-        for it in cart.items.select_related('product'):
-            wmonths = it.product.warranty_months or 0
-            wexp = (today + relativedelta(months=wmonths)) if wmonths > 0 else None
-            OrderItem.objects.create(
-                order=order, product=it.product,
-                name_snapshot=it.product.name,
-                color_snapshot=it.product.color, size_snapshot=it.product.size,
-                warranty_months_snapshot=wmonths, warranty_expires_at=wexp,
-                qty=it.qty, unit_price=it.price_snapshot, tax_rate=0, discount=0,
-                line_total=it.qty * it.price_snapshot
-            )
+        OrderItem.objects.bulk_create(build_order_items(
+            order, [(it.product, it.qty, it.price_snapshot) for it in cart_items]
+        ))
 
         # cerrar carrito
         cart.status = 'CONVERTED'
-        cart.save()
+        cart.save(update_fields=['status'])
 
         return order
@@ -1,11 +1,14 @@
 # sales/services.py
 from django.db import transaction
-from django.utils.timezone import now, localtime
-from django.forms.models import model_to_dict
-from django.db.models import Sum, Count, Q
+from django.utils.dateparse import parse_date
+from django.utils.timezone import now, localtime, make_aware
+from django.db.models import Sum, Count, Q, F, Case, When, OuterRef, Subquery
 from django.db.models.functions import TruncMonth
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 import io
+import itertools
+import logging
+import re
 from decimal import Decimal
 import random
 from functools import lru_cache
@@ -14,6 +17,8 @@ from typing import Optional, Tuple
 import unicodedata
 from dateutil.relativedelta import relativedelta  # type: ignore
 
+from .catalog import bump_catalog_version
+
 try:
     import pandas as pd  # type: ignore
 except Exception:
@@ -27,6 +32,8 @@ try:
 except Exception:
     joblib = None
 
+logger = logging.getLogger('sales.services')
+
 
 KEYWORD_BUCKETS = {
     'aire': ['aire', 'ac', 'acond', 'clima', 'btu', 'calor', 'split', 'temperatura', 'frio', 'caliente'],
@@ -50,22 +57,7 @@ CATEGORY_HINTS = {
 
 
 def detect_keyword_key(prompt: Optional[str]) -> Optional[str]:
-    import re
-
-    text = _normalize_text(prompt or '').lower()
-    words = set(re.findall(r'[a-z0-9]+', text))
-    for key, tokens in KEYWORD_BUCKETS.items():
-        for token in tokens:
-            norm_token = _normalize_text(token).lower().strip()
-            if not norm_token:
-                continue
-            if ' ' in norm_token:
-                if norm_token in text:
-                    return key
-            else:
-                if norm_token in words:
-                    return key
-    return None
+    return _keyword_in(_normalize_text(prompt or '').lower())
 
 
 @lru_cache(maxsize=32)
@@ -88,27 +80,6 @@ def _category_lookup(keyword_key: Optional[str]) -> Tuple[Tuple[int, ...], Optio
 def _normalize_text(value: str) -> str:
     return unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode('ascii')
 
-def _serialize_value(value):
-    if isinstance(value, (datetime, date)):
-        return value.isoformat()
-    if isinstance(value, Decimal):
-        return str(value)
-    return value
-
-def _serialize_json(obj):
-    if isinstance(obj, dict):
-        return {k: _serialize_json(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_serialize_json(v) for v in obj]
-    return _serialize_value(obj)
-
-def _safe_model_to_dict(obj):
-    try:
-        return _serialize_json(model_to_dict(obj))
-    except Exception:
-        return {}
-
-
 def _synthetic_training_rows(scope='total'):
     """
     Devuelve filas sintéticas para entrenar el modelo cuando aún no hay ventas reales.
@@ -215,20 +186,32 @@ def _month_label(dt):
     return f"{MONTH_NAMES[dt.month-1].capitalize()} {dt.year}"
 
 
+def _forecast_next_month(parsed):
+    """Proximo mes con sales.forecasting (ML_SUMMARY_ESTIMATOR); sin numpy, el ultimo mes."""
+    from django.conf import settings
+    try:
+        from .forecasting import forecast
+    except ImportError:
+        return parsed[-1]['total']
+    estimator = getattr(settings, 'ML_SUMMARY_ESTIMATOR', 'seasonal_naive')
+    _periods, preds = forecast(parsed, horizon=1, estimator=estimator, key=None, cache=True)
+    return float(preds[None][0])
+
+
 def _prediction_summary(prompt, keyword_key=None):
     category_ids, category_name = _category_lookup(keyword_key)
-    qs = build_sales_queryset(
+    hist = sales_aggregate(
+        'monthly',
         category_ids=list(category_ids) if category_ids else None,
         keyword_key=None if category_ids else keyword_key,
     )
-    hist = list(qs.annotate(period=TruncMonth('order__created_at')).values('period').annotate(total=Sum('line_total')).order_by('period'))
     if not hist:
         base_category = category_ids[0] if category_ids else None
         fallback = fallback_aggregate_rows('monthly', category_id=base_category)
         hist = [{'period': row['period'], 'total': row['total']} for row in fallback]
     from datetime import datetime as _dt
     parsed = []
-    for row in hist[-6:]:
+    for row in hist:
         period = row['period']
         if hasattr(period, 'year'):
             dt = period
@@ -237,11 +220,12 @@ def _prediction_summary(prompt, keyword_key=None):
         parsed.append({'period': dt, 'total': float(row['total'])})
     if not parsed:
         parsed.append({'period': _dt.utcnow(), 'total': 1200.0})
-    last = parsed[-1]
-    peak = max(parsed, key=lambda x: x['total'])
-    avg = sum(item['total'] for item in parsed) / len(parsed)
+    recent = parsed[-6:]
+    last = recent[-1]
+    peak = max(recent, key=lambda x: x['total'])
+    avg = sum(item['total'] for item in recent) / len(recent)
     next_dt = last['period'] + relativedelta(months=1)
-    forecast = max(400.0, last['total'] * 1.05 + 100)
+    forecast = _forecast_next_month(parsed)
     context_map = {
         'aire': 'El calor de primavera y verano suele disparar la demanda de aires.',
         'consola': 'La campaña navideña y los bonos incentivan la compra de consolas.',
@@ -267,18 +251,98 @@ def _prediction_summary(prompt, keyword_key=None):
     }
 
 
+SOLD_STATUSES = ('PAID', 'DELIVERED', 'SHIPPED')
+
+# productos por sentencia UPDATE ... CASE (acota el tamaño del SQL)
+STOCK_UPDATE_CHUNK = 500
+
+
+class InsufficientStock(ValueError):
+    """
+    Lineas sin stock suficiente; `shortages` es una lista de
+    {'product_id', 'name', 'requested', 'available'}.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ', '.join(s['name'] for s in shortages)
+        super().__init__(f"Stock insuficiente para {names}")
+
+
+class _StockShortfall(Exception):
+    pass
+
+
+def _stock_case(wanted, sign):
+    from .models import Product
+    return Case(
+        *[When(pk=pid, then=F('stock') + sign * qty) for pid, qty in wanted.items()],
+        default=F('stock'),
+        output_field=Product._meta.get_field('stock'),
+    )
+
+
+def _stock_shortages(wanted):
+    from .models import Product
+    shortages = []
+    for row in Product.objects.filter(pk__in=list(wanted)).values('id', 'name', 'stock'):
+        if row['stock'] < wanted[row['id']]:
+            shortages.append({'product_id': row['id'], 'name': row['name'], 'requested': wanted[row['id']], 'available': row['stock']})
+    return shortages
+
+
+def reserve_stock(wanted, attempts=2):
+    """
+    Descuenta {product_id: qty} con un UPDATE condicional por bloque:
+    SET stock = CASE id WHEN .. THEN stock - qty END WHERE (id = .. AND stock >= qty) OR ...
+    Todo o nada: si alguna fila no cumple, se revierte el savepoint y se lanza InsufficientStock
+    con las lineas que no alcanzan. No requiere select_for_update sobre los productos.
+    """
+    from .models import Product
+    wanted = {pid: int(qty) for pid, qty in wanted.items() if qty}
+    items = list(wanted.items())
+    for _ in range(attempts):
+        try:
+            with transaction.atomic():
+                for i in range(0, len(items), STOCK_UPDATE_CHUNK):
+                    chunk = dict(items[i:i + STOCK_UPDATE_CHUNK])
+                    enough = Q()
+                    for pid, qty in chunk.items():
+                        enough |= Q(pk=pid, stock__gte=qty)
+                    if Product.objects.filter(enough).update(stock=_stock_case(chunk, -1)) != len(chunk):
+                        raise _StockShortfall
+            bump_catalog_version()
+            return
+        except _StockShortfall:
+            shortages = _stock_shortages(wanted)
+            if shortages:
+                raise InsufficientStock(shortages)
+            # el stock cambio entre el UPDATE y la lectura: reintentar
+    raise ValueError('Conflicto concurrente al reservar stock, reintente')
+
+
+def release_stock(wanted):
+    """Devuelve {product_id: qty} al stock en un UPDATE por bloque."""
+    from .models import Product
+    wanted = {pid: int(qty) for pid, qty in wanted.items() if qty}
+    items = list(wanted.items())
+    for i in range(0, len(items), STOCK_UPDATE_CHUNK):
+        chunk = dict(items[i:i + STOCK_UPDATE_CHUNK])
+        Product.objects.filter(pk__in=list(chunk)).update(stock=_stock_case(chunk, 1))
+    if items:
+        bump_catalog_version()
+
+
 def adjust_stock_on_paid(order, approved_by=None):
     """
     Descuenta stock cuando la orden pasa a PAID.
+    Lanza InsufficientStock (ValueError) sin tocar nada si alguna linea no alcanza.
     """
-    from .models import Product  # import local para evitar ciclos
     with transaction.atomic():
-        for it in order.items.select_related('product'):
-            p = it.product
-            if p.stock < it.qty:
-                raise ValueError(f"Stock insuficiente para {p.name}")
-            p.stock -= it.qty
-            p.save(update_fields=['stock'])
+        snapshot_rollup_keys(order.items.all())
+        lines = list(_order_rollup_lines(order))
+        reserve_stock({line['product_id']: line['qty_sum'] for line in lines})
+        apply_order_to_rollup(order, lines=lines)
         order.status = 'PAID'
         updates = ['status']
         if not order.paid_at:
@@ -293,27 +357,46 @@ def revert_stock_on_void(order):
     """
     Devuelve stock si la orden estaba pagada y se anula.
     """
-    from .models import Product
     with transaction.atomic():
-        if order.status == 'PAID':
-            for it in order.items.select_related('product'):
-                p = it.product
-                p.stock += it.qty
-                p.save(update_fields=['stock'])
+        if order.status in SOLD_STATUSES:
+            lines = list(_order_rollup_lines(order))
+            apply_order_to_rollup(order, sign=-1, lines=lines)
+            if order.status == 'PAID':
+                release_stock({line['product_id']: line['qty_sum'] for line in lines})
         order.status = 'CANCELLED'
         order.save(update_fields=['status'])
 
 
+def build_order_items(order, lines, today=None):
+    """
+    Arma (sin guardar) los OrderItem de `order` a partir de (producto, qty, precio unitario),
+    para insertarlos con un solo bulk_create. La fecha de garantia se calcula una vez por plazo.
+    """
+    from .models import OrderItem
+    today = today or date.today()
+    expiries = {}
+    items = []
+    for prod, qty, price in lines:
+        wmonths = prod.warranty_months or 0
+        if wmonths > 0 and wmonths not in expiries:
+            expiries[wmonths] = today + relativedelta(months=wmonths)
+        items.append(OrderItem(
+            order=order, product=prod,
+            name_snapshot=prod.name,
+            color_snapshot=prod.color, size_snapshot=prod.size,
+            warranty_months_snapshot=wmonths, warranty_expires_at=expiries.get(wmonths),
+            qty=qty, unit_price=price, tax_rate=0, discount=0, line_total=price * qty,
+        ))
+    return items
+
+
 def log_admin_action(user, action, model_name, object_id, before_obj=None, after_obj=None):
-    from .models import AdminAuditLog
-    AdminAuditLog.objects.create(
-        user=user,
-        action=action,
-        model_name=model_name,
-        object_id=str(object_id),
-        before_data=_safe_model_to_dict(before_obj) if before_obj is not None else None,
-        after_data=_safe_model_to_dict(after_obj) if after_obj is not None else None,
-    )
+    """
+    Encola la entrada de auditoria (sales.audit): se escribe en lote despues del commit.
+    `before_obj` puede ser un snapshot (audit.snapshot) tomado antes de modificar el objeto.
+    """
+    from .audit import record
+    record(user, action, model_name, object_id, before_obj, after_obj)
 
 
 # ----------------------------
@@ -327,114 +410,152 @@ def _last_day_of_month(y: int, m: int) -> date:
     return (date(y, m+1, 1) - timedelta(days=1))
 
 
-def parse_prompt_to_spec(prompt: str):
-    """Parser basado en reglas para prompts en español."""
-    import re
-
-    raw = prompt or ''
-    normalized = _normalize_text(raw).lower()
-    fmt = 'screen'
-    if 'pdf' in normalized:
-        fmt = 'pdf'
-    elif 'excel' in normalized or 'xlsx' in normalized:
-        fmt = 'excel'
-
-    group_by = None
-    if 'producto' in normalized:
-        group_by = 'product'
-    elif 'cliente' in normalized:
-        group_by = 'customer'
-    elif 'categor' in normalized:
-        group_by = 'category'
-    elif 'mes' in normalized or 'mensual' in normalized:
-        group_by = 'monthly'
+# ----------------------------
+# Vocabulario compilado de prompts
+# ----------------------------
+# Las tablas y regex de detect_keyword_key/parse_prompt_to_spec se preparan una sola
+# vez al importar: los tokens de KEYWORD_BUCKETS ya normalizados y separados en
+# palabras sueltas (interseccion de sets) y frases (substring), y las regex compiladas.
+
+PROMPT_FORMATS = (('pdf', ('pdf',)), ('excel', ('excel', 'xlsx')))
+PROMPT_GROUPS = (
+    ('product', ('producto',)),
+    ('customer', ('cliente',)),
+    ('category', ('categor',)),
+    ('monthly', ('mes', 'mensual')),
+)
+# en orden de prioridad, como la cadena if/elif original
+PROMPT_RANGES = (
+    ('today', ('hoy',)),
+    ('yesterday', ('ayer',)),
+    ('this_week', ('esta semana', 'semana actual')),
+    ('last_week', ('semana pasada', 'ultima semana')),
+    ('this_month', ('este mes', 'mes actual')),
+    ('last_month', ('mes pasado', 'ultimo mes')),
+    ('this_year', ('este ano',)),
+    ('last_year', ('ano pasado',)),
+    ('last_quarter', ('ultimo trimestre', 'trimestre pasado')),
+    ('this_quarter', ('este trimestre', 'trimestre actual')),
+)
+PROMPT_MONTHS = (
+    ('enero', 1), ('febrero', 2), ('marzo', 3), ('abril', 4), ('mayo', 5), ('junio', 6),
+    ('julio', 7), ('agosto', 8), ('septiembre', 9), ('setiembre', 9), ('octubre', 10),
+    ('noviembre', 11), ('diciembre', 12),
+)
+
+_DATE_PAIR_RE = re.compile(r'(\d{2}/\d{2}/\d{4}).*?(\d{2}/\d{2}/\d{4})')
+_DAYS_WINDOW_RE = re.compile(r'ultim[oa]s?\s+(\d+)\s+dias')
+_YEAR_RE = re.compile(r'(20\d{2})')
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _compile_keyword_plan():
+    plan = []
+    for key, tokens in KEYWORD_BUCKETS.items():
+        single, multi = set(), []
+        for token in tokens:
+            norm = _normalize_text(token).lower().strip()
+            if not norm:
+                continue
+            if ' ' in norm:
+                multi.append(norm)
+            else:
+                single.add(norm)
+        plan.append((key, frozenset(single), tuple(multi)))
+    return tuple(plan)
 
-    start = end = None
-    explicit_range = False
-    today = date.today()
 
-    def _set_range(s: date, e: date):
-        nonlocal start, end, explicit_range
-        start, end = s, e
-        explicit_range = True
+_KEYWORD_PLAN = _compile_keyword_plan()
+
+
+def _keyword_in(text: str) -> Optional[str]:
+    words = set(_WORD_RE.findall(text))
+    for key, single, multi in _KEYWORD_PLAN:
+        if not single.isdisjoint(words) or any(t in text for t in multi):
+            return key
+    return None
+
+
+def _first_match(table, text):
+    for value, terms in table:
+        if any(t in text for t in terms):
+            return value
+    return None
 
-    m = re.search(r'(\d{2}/\d{2}/\d{4}).*?(\d{2}/\d{2}/\d{4})', normalized)
-    if m:
-        try:
-            s = datetime.strptime(m.group(1), '%d/%m/%Y').date()
-            e = datetime.strptime(m.group(2), '%d/%m/%Y').date()
-            _set_range(s, e)
-        except Exception:
-            pass
 
-    if start is None and 'hoy' in normalized:
-        _set_range(today, today)
-    elif start is None and 'ayer' in normalized:
+def _relative_range(intent, today):
+    if intent == 'today':
+        return today, today
+    if intent == 'yesterday':
         yday = today - timedelta(days=1)
-        _set_range(yday, yday)
-    elif start is None and ('esta semana' in normalized or 'semana actual' in normalized):
-        monday = today - timedelta(days=today.weekday())
-        _set_range(monday, today)
-    elif start is None and ('semana pasada' in normalized or 'ultima semana' in normalized):
+        return yday, yday
+    if intent == 'this_week':
+        return today - timedelta(days=today.weekday()), today
+    if intent == 'last_week':
         last_sunday = today - timedelta(days=today.weekday() + 1)
-        last_monday = last_sunday - timedelta(days=6)
-        _set_range(last_monday, last_sunday)
-    elif start is None and ('este mes' in normalized or 'mes actual' in normalized):
-        first = today.replace(day=1)
-        _set_range(first, today)
-    elif start is None and ('mes pasado' in normalized or 'ultimo mes' in normalized):
+        return last_sunday - timedelta(days=6), last_sunday
+    if intent == 'this_month':
+        return today.replace(day=1), today
+    if intent == 'last_month':
         prev = today - relativedelta(months=1)
-        first = prev.replace(day=1)
-        _set_range(first, _last_day_of_month(prev.year, prev.month))
-    elif start is None and ('este ano' in normalized or 'este año' in raw.lower()):
-        first = date(today.year, 1, 1)
-        _set_range(first, today)
-    elif start is None and ('ano pasado' in normalized or 'año pasado' in raw.lower()):
+        return prev.replace(day=1), _last_day_of_month(prev.year, prev.month)
+    if intent == 'this_year':
+        return date(today.year, 1, 1), today
+    if intent == 'last_year':
         year = today.year - 1
-        _set_range(date(year, 1, 1), date(year, 12, 31))
-    elif start is None and ('ultimo trimestre' in normalized or 'trimestre pasado' in normalized):
+        return date(year, 1, 1), date(year, 12, 31)
+    if intent == 'last_quarter':
         current_q = ((today.month - 1) // 3) + 1
         prev_q = current_q - 1 or 4
         year = today.year if current_q > 1 else today.year - 1
         start_month = (prev_q - 1) * 3 + 1
-        end_month = start_month + 2
-        _set_range(date(year, start_month, 1), _last_day_of_month(year, end_month))
-    elif start is None and ('este trimestre' in normalized or 'trimestre actual' in normalized):
+        return date(year, start_month, 1), _last_day_of_month(year, start_month + 2)
+    if intent == 'this_quarter':
         current_q = ((today.month - 1) // 3) + 1
-        start_month = (current_q - 1) * 3 + 1
-        _set_range(date(today.year, start_month, 1), today)
+        return date(today.year, (current_q - 1) * 3 + 1, 1), today
+    return None
+
+
+def parse_prompt_to_spec(prompt: str):
+    """Parser basado en reglas para prompts en español."""
+    normalized = _normalize_text(prompt or '').lower()
+    fmt = _first_match(PROMPT_FORMATS, normalized) or 'screen'
+    group_by = _first_match(PROMPT_GROUPS, normalized)
 
+    today = date.today()
+    start = end = None
+    m = _DATE_PAIR_RE.search(normalized)
+    if m:
+        try:
+            start = datetime.strptime(m.group(1), '%d/%m/%Y').date()
+            end = datetime.strptime(m.group(2), '%d/%m/%Y').date()
+        except Exception:
+            start = end = None
     if start is None:
-        window = re.search(r'ultim[oa]s?\s+(\d+)\s+dias', normalized)
+        intent = _first_match(PROMPT_RANGES, normalized)
+        if intent:
+            start, end = _relative_range(intent, today)
+    if start is None:
+        window = _DAYS_WINDOW_RE.search(normalized)
         if window:
             try:
                 span = max(1, int(window.group(1)))
-                _set_range(today - timedelta(days=span-1), today)
-            except Exception:
-                pass
-
-    months = {
-        'enero':1,'febrero':2,'marzo':3,'abril':4,'mayo':5,'junio':6,
-        'julio':7,'agosto':8,'septiembre':9,'setiembre':9,'octubre':10,'noviembre':11,'diciembre':12
-    }
+                start, end = today - timedelta(days=span-1), today
+            except (OverflowError, ValueError):
+                # ventana fuera del rango de date: se ignora como antes
+                start = end = None
     if start is None:
-        for name, num in months.items():
+        for name, num in PROMPT_MONTHS:
             if name in normalized:
-                y = today.year
-                first = date(y, num, 1)
-                _set_range(first, _last_day_of_month(y, num))
+                start, end = date(today.year, num, 1), _last_day_of_month(today.year, num)
                 break
-
     if start is None:
-        year_match = re.search(r'(20\d{2})', normalized)
+        year_match = _YEAR_RE.search(normalized)
         if year_match:
             y = int(year_match.group(1))
-            _set_range(date(y, 1, 1), date(y, 12, 31))
+            start, end = date(y, 1, 1), date(y, 12, 31)
 
-    if start is not None and end is None:
-        end = start
-
-    keyword_key = detect_keyword_key(raw)
+    keyword_key = _keyword_in(normalized)
     category_ids, category_label = _category_lookup(keyword_key)
 
     return {
@@ -445,16 +566,39 @@ def parse_prompt_to_spec(prompt: str):
         'keyword_key': keyword_key,
         'category_ids': list(category_ids),
         'category_label': category_label,
-        'explicit_range': explicit_range or bool(start and end),
+        'explicit_range': bool(start and end),
     }
 
+def _local_midnight(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    elif not isinstance(day, date):
+        parsed = parse_date(str(day))
+        if parsed is None:
+            raise ValueError(f'Fecha invalida: {day}')
+        day = parsed
+    return make_aware(datetime.combine(day, time.min))
+
+
+def day_range(field, start=None, end=None):
+    """
+    Q de `field` (DateTimeField) entre los dias locales start y end, ambos inclusive.
+    Equivale a field__date__gte/lte pero como rango de datetimes, asi la base puede
+    usar los indices que incluyen la columna (p. ej. (status, created_at) de Order).
+    """
+    q = Q()
+    if start:
+        q &= Q(**{f'{field}__gte': _local_midnight(start)})
+    if end:
+        end_day = _local_midnight(end).date() + timedelta(days=1)
+        q &= Q(**{f'{field}__lt': _local_midnight(end_day)})
+    return q
+
+
 def build_sales_queryset(start=None, end=None, category_ids=None, keyword_key=None):
     from .models import OrderItem
     qs = OrderItem.objects.select_related('order','product','product__brand','product__category','order__user')
-    if start:
-        qs = qs.filter(order__created_at__date__gte=start)
-    if end:
-        qs = qs.filter(order__created_at__date__lte=end)
+    qs = qs.filter(day_range('order__created_at', start, end))
     if category_ids:
         qs = qs.filter(product__category_id__in=category_ids)
     elif keyword_key:
@@ -469,127 +613,613 @@ def build_sales_queryset(start=None, end=None, category_ids=None, keyword_key=No
     return qs
 
 
-def aggregate_sales(qs, group_by='product'):
+def aggregate_sales(qs, group_by='product', lazy=False):
+    """Filas agregadas (dicts); con lazy=True devuelve el queryset sin evaluar."""
     if group_by == 'product':
-        return list(qs.values('product_id','product__name').annotate(quantity=Sum('qty'), total=Sum('line_total')).order_by('-total'))
-    if group_by == 'customer':
+        agg = qs.values('product_id','product__name').annotate(quantity=Sum('qty'), total=Sum('line_total')).order_by('-total')
+    elif group_by == 'customer':
         from django.db.models import Min, Max
-        return list(qs.values('order__user_id','order__user__first_name','order__user__last_name').annotate(
+        agg = qs.values('order__user_id','order__user__first_name','order__user__last_name').annotate(
             quantity=Sum('qty'), total=Sum('line_total'), orders=Count('order', distinct=True),
             first_purchase=Min('order__created_at'), last_purchase=Max('order__created_at')
-        ).order_by('-total'))
-    if group_by == 'category':
-        return list(qs.values('product__category_id','product__category__name').annotate(quantity=Sum('qty'), total=Sum('line_total')).order_by('-total'))
-    if group_by == 'monthly':
-        return list(qs.annotate(period=TruncMonth('order__created_at')).values('period').annotate(total=Sum('line_total')).order_by('period'))
-    return list(qs.values('id'))
+        ).order_by('-total')
+    elif group_by == 'category':
+        agg = qs.values('product__category_id','product__category__name').annotate(quantity=Sum('qty'), total=Sum('line_total')).order_by('-total')
+    elif group_by == 'monthly':
+        agg = qs.annotate(period=TruncMonth('order__created_at')).values('period').annotate(total=Sum('line_total')).order_by('period')
+    else:
+        agg = qs.values('id')
+    return agg if lazy else list(agg)
 
 
-def export_to_pdf(rows, title='Reporte de Ventas') -> bytes:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-    buf = io.BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    W, H = A4
-    # fuentes con acentos
-    font='Helvetica'; font_bold='Helvetica-Bold'
+# ----------------------------
+# Rollup diario de ventas (SalesDailyRollup)
+# ----------------------------
+
+ROLLUP_GROUPS = ('product', 'category', 'monthly')
+
+
+def _order_rollup_lines(order):
+    """Lineas de la orden agrupadas por la clave del rollup (producto + categoria/marca fijadas)."""
+    return order.items.values('product_id', 'category_snapshot_id', 'brand_snapshot_id').annotate(
+        qty_sum=Sum('qty'), revenue_sum=Sum('line_total'),
+    ).order_by()
+
+
+def snapshot_rollup_keys(items):
+    """Copia a las lineas `items` (queryset) la categoria/marca actual de su producto (un UPDATE)."""
+    from .models import Product
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    return items.update(
+        category_snapshot_id=Subquery(product.values('category_id')[:1]),
+        brand_snapshot_id=Subquery(product.values('brand_id')[:1]),
+    )
+
+
+def _rollup_case(field, deltas):
+    from .models import SalesDailyRollup
+    return Case(
+        *[When(pk=pk, then=F(field) + delta) for pk, delta in deltas.items()],
+        default=F(field),
+        output_field=SalesDailyRollup._meta.get_field(field),
+    )
+
+
+def apply_order_to_rollup(order, sign=1, lines=None):
+    """
+    Suma (sign=1) o resta (sign=-1) las lineas de la orden en SalesDailyRollup.
+    Se llama dentro de la transaccion que cambia el estado de la orden; `lines` es el
+    resultado de _order_rollup_lines (al pagar, despues de snapshot_rollup_keys).
+    Costo fijo: un SELECT, un UPDATE ... CASE y, si hay filas nuevas, un bulk_create.
+
+    Al anular, la fila se busca con la categoria/marca guardadas en la linea. Si aun asi
+    falta alguna (rollup desincronizado), no se adivina: se registra y el dia se
+    recalcula desde OrderItem cuando la anulacion se confirma.
+    """
+    from django.db import IntegrityError
+    from .models import SalesDailyRollup
+    day = localtime(order.created_at).date()
+    lines = list(_order_rollup_lines(order) if lines is None else lines)
+    if not lines:
+        return
+    for attempt in range(2):
+        existing = {
+            (r.product_id, r.category_id, r.brand_id): r.pk
+            for r in SalesDailyRollup.objects.filter(day=day, product_id__in={line['product_id'] for line in lines}).only('id', 'product_id', 'category_id', 'brand_id')
+        }
+        qty, revenue, count, missing = {}, {}, {}, []
+        for line in lines:
+            pk = existing.get((line['product_id'], line['category_snapshot_id'], line['brand_snapshot_id']))
+            if pk is None:
+                missing.append(line)
+                continue
+            qty[pk] = qty.get(pk, 0) + sign * line['qty_sum']
+            revenue[pk] = revenue.get(pk, 0) + sign * line['revenue_sum']
+            count[pk] = count.get(pk, 0) + sign
+        if sign < 0 and missing:
+            logger.error(
+                'Rollup sin fila para anular la orden %s (%s): se recalcula el dia %s',
+                order.pk, [line['product_id'] for line in missing], day,
+            )
+            transaction.on_commit(lambda: rebuild_sales_rollups(start=day, end=day))
+            return
+        new_rows = [
+            SalesDailyRollup(
+                day=day, product_id=line['product_id'], category_id=line['category_snapshot_id'], brand_id=line['brand_snapshot_id'],
+                qty=line['qty_sum'], revenue=line['revenue_sum'], order_count=1,
+            )
+            for line in missing
+        ]
+        try:
+            with transaction.atomic():
+                if new_rows:
+                    SalesDailyRollup.objects.bulk_create(new_rows)
+                if qty:
+                    SalesDailyRollup.objects.filter(pk__in=list(qty)).update(
+                        qty=_rollup_case('qty', qty), revenue=_rollup_case('revenue', revenue),
+                        order_count=_rollup_case('order_count', count), updated_at=now(),
+                    )
+            break
+        except IntegrityError:
+            # otra transaccion creo alguna de las filas: releer y aplicar como UPDATE
+            if attempt:
+                raise
+    if sign < 0:
+        SalesDailyRollup.objects.filter(day=day, order_count__lte=0).delete()
+
+
+def rebuild_sales_rollups(start=None, end=None, batch_size=2000):
+    """
+    Recalcula SalesDailyRollup desde OrderItem (todo, o solo los dias entre start y end).
+    Devuelve la cantidad de filas escritas.
+    """
+    from itertools import islice
+    from django.db.models.functions import TruncDate
+    from .models import OrderItem, SalesDailyRollup
+    qs = OrderItem.objects.filter(order__status__in=SOLD_STATUSES)
+    stale = SalesDailyRollup.objects.all()
+    qs = qs.filter(day_range('order__created_at', start, end))
+    if start:
+        stale = stale.filter(day__gte=start)
+    if end:
+        stale = stale.filter(day__lte=end)
+    # lineas vendidas que nunca pasaron por adjust_stock_on_paid: se fija la clave actual
+    snapshot_rollup_keys(qs.filter(category_snapshot__isnull=True, brand_snapshot__isnull=True))
+    agg = qs.annotate(day=TruncDate('order__created_at')).values(
+        'day', 'product_id', 'category_snapshot_id', 'brand_snapshot_id',
+    ).annotate(
+        qty_sum=Sum('qty'), revenue_sum=Sum('line_total'), orders=Count('order', distinct=True),
+    ).order_by()
+    rows = (
+        SalesDailyRollup(
+            day=r['day'], product_id=r['product_id'], category_id=r['category_snapshot_id'], brand_id=r['brand_snapshot_id'],
+            qty=r['qty_sum'], revenue=r['revenue_sum'], order_count=r['orders'],
+        )
+        for r in agg.iterator()
+    )
+    written = 0
+    with transaction.atomic():
+        stale.delete()
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            SalesDailyRollup.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+def build_rollup_queryset(start=None, end=None, category_ids=None):
+    from .models import SalesDailyRollup
+    qs = SalesDailyRollup.objects.all()
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+    if category_ids:
+        qs = qs.filter(category_id__in=category_ids)
+    return qs
+
+
+def aggregate_rollup(qs, group_by='product', lazy=False):
+    """Mismas filas que aggregate_sales (product/category/monthly), leyendo del rollup."""
+    if group_by == 'product':
+        agg = qs.values('product_id', 'product__name').annotate(quantity=Sum('qty'), total=Sum('revenue')).order_by('-total')
+    elif group_by == 'category':
+        agg = qs.values(product__category_id=F('category_id'), product__category__name=F('category__name')).annotate(
+            quantity=Sum('qty'), total=Sum('revenue'),
+        ).order_by('-total')
+    elif group_by == 'monthly':
+        agg = qs.annotate(period=TruncMonth('day')).values('period').annotate(total=Sum('revenue')).order_by('period')
+    else:
+        raise ValueError(f'Agrupacion no soportada por el rollup: {group_by}')
+    return agg if lazy else list(agg)
+
+
+def sales_aggregate(group_by='product', start=None, end=None, category_ids=None, keyword_key=None, lazy=False):
+    """
+    Agregados para dashboard/prompts/ML: product, category y monthly salen de SalesDailyRollup;
+    por cliente o por palabra clave sin categoria se necesita el detalle de OrderItem.
+    Con lazy=True devuelve el queryset agregado para recorrerlo con iterator() (exports).
+    """
+    if group_by in ROLLUP_GROUPS and (category_ids or not keyword_key):
+        return aggregate_rollup(build_rollup_queryset(start=start, end=end, category_ids=category_ids), group_by, lazy=lazy)
+    qs = build_sales_queryset(start=start, end=end, category_ids=category_ids, keyword_key=keyword_key)
+    return aggregate_sales(qs, group_by=group_by, lazy=lazy)
+
+
+# ----------------------------
+# Motor de reportes de ventas (admin)
+# ----------------------------
+
+SALES_REPORT_FILTER_KEYS = ('date_from', 'date_to', 'brand', 'category', 'min_price', 'max_price')
+
+SALES_REPORT_DETAIL_FIELDS = (
+    'order_id', 'name_snapshot', 'qty', 'unit_price', 'line_total',
+    'product__brand__name', 'product__category__name', 'order__created_at',
+)
+
+
+def build_sales_report_filters(data):
+    """
+    Normaliza los filtros del reporte de ventas a partir de request.data.
+    Las claves vacías se guardan como '' (igual que en SalesReport.filters).
+    """
+    data = data or {}
+    return {
+        'date_from': data.get('date_from'),
+        'date_to': data.get('date_to'),
+        'brand': data.get('brand') or '',
+        'category': data.get('category') or '',
+        'min_price': data.get('min_price') or '',
+        'max_price': data.get('max_price') or '',
+    }
+
+
+def validate_sales_report_filters(filters):
+    """
+    Lanza ValueError si date_from/date_to no son fechas AAAA-MM-DD validas. Los exports
+    en streaming la llaman antes de responder: un error dentro del generador dejaria
+    un archivo truncado con status 200. Sirve igual para los filtros de auditoria
+    (mismas claves de fecha); la usan tambien los reportes PDF y la cola de trabajos.
+    """
+    for key in ('date_from', 'date_to'):
+        value = (filters or {}).get(key)
+        if value in (None, ''):
+            continue
+        try:
+            parsed = parse_date(str(value).strip())
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValueError(f'{key} invalida: use el formato AAAA-MM-DD')
+    return filters
+
+
+def _to_decimal(value) -> Optional[Decimal]:
+    if value in (None, ''):
+        return None
     try:
-        pdfmetrics.registerFont(TTFont('Arial','C\\Windows\\Fonts\\arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold','C\\Windows\\Fonts\\arialbd.ttf'))
-        font='Arial'; font_bold='Arial-Bold'
+        return Decimal(str(value).strip())
     except Exception:
-        pass
-    y = H - 20*mm
-    c.setFont(font_bold, 14)
-    c.drawString(20*mm, y, title); y -= 10*mm
-    c.setFont(font, 10)
-    for r in rows:
-        line = ", ".join([f"{k}: {v}" for k, v in r.items()])
-        c.drawString(20*mm, y, line)
-        y -= 6*mm
-        if y < 30*mm:
-            c.showPage(); y = H - 20*mm; c.setFont(font, 10)
-    c.showPage(); c.save(); buf.seek(0)
-    return buf.read()
+        return None
 
 
-def export_to_excel(rows, title='Reporte') -> bytes:
+def sales_report_lines(filters):
+    """
+    Líneas de venta (OrderItem) de órdenes PAID que cumplen los filtros.
+    Todo el filtrado se resuelve en SQL; no se instancian modelos.
+    """
+    from .models import OrderItem
+    f = filters or {}
+    qs = OrderItem.objects.filter(order__status='PAID').filter(
+        day_range('order__created_at', f.get('date_from'), f.get('date_to')),
+    )
+    if f.get('brand'):
+        qs = qs.filter(product__brand__name__iexact=f['brand'])
+    if f.get('category'):
+        qs = qs.filter(product__category__name__iexact=f['category'])
+    min_price = _to_decimal(f.get('min_price'))
+    if min_price is not None:
+        qs = qs.filter(unit_price__gte=min_price)
+    max_price = _to_decimal(f.get('max_price'))
+    if max_price is not None:
+        qs = qs.filter(unit_price__lte=max_price)
+    return qs
+
+
+def sales_report_summary(filters, top_n=5):
+    """
+    Resumen del reporte de ventas calculado con GROUP BY en la base de datos.
+    Los importes se devuelven como Decimal; marca/categoría None = sin asignar.
+    """
+    lines = sales_report_lines(filters)
+    totals = lines.aggregate(
+        total=Sum('line_total'),
+        lines_count=Count('id'),
+        orders_count=Count('order', distinct=True),
+    )
+    total = totals['total'] or Decimal('0')
+    orders_count = totals['orders_count'] or 0
+    avg_ticket = (total / (orders_count or 1)).quantize(Decimal('0.01'))
+
+    by_brand = lines.values_list('product__brand__name').annotate(amount=Sum('line_total')).order_by('-amount')
+    by_category = lines.values_list('product__category__name').annotate(amount=Sum('line_total')).order_by('-amount')
+    top_qty = lines.values_list('name_snapshot').annotate(units=Sum('qty')).order_by('-units', 'name_snapshot')[:top_n]
+    top_amount = lines.values_list('name_snapshot').annotate(amount=Sum('line_total')).order_by('-amount', 'name_snapshot')[:top_n]
+
+    return {
+        'orders_count': orders_count,
+        'lines_count': totals['lines_count'] or 0,
+        'total': total,
+        'avg_ticket': avg_ticket,
+        'by_brand': list(by_brand),
+        'by_category': list(by_category),
+        'top_qty': list(top_qty),
+        'top_amount': list(top_amount),
+    }
+
+
+def iter_sales_report_detail(filters, limit=None, chunk_size=2000):
+    """
+    Itera el detalle del reporte como tuplas (ver SALES_REPORT_DETAIL_FIELDS)
+    usando un cursor del lado del servidor para no cargar todo en memoria.
+    """
+    qs = sales_report_lines(filters).order_by('order_id', 'id').values_list(*SALES_REPORT_DETAIL_FIELDS)
+    if limit is not None:
+        qs = qs[:limit]
+    return qs.iterator(chunk_size=chunk_size)
+
+
+def export_to_pdf(rows, title='Reporte de Ventas') -> bytes:
+    from .pdf import StreamingTable, build_pdf, paragraph
+    rows = list(rows or [])
+    if not rows:
+        return build_pdf([paragraph('Sin datos para el periodo indicado.', 'muted')], title)
+    headers = list(rows[0].keys())
+    return build_pdf([StreamingTable(headers, ([r.get(h) for h in headers] for r in rows))], title)
+
+
+EXCEL_MONEY_FORMAT = '#,##0.00'
+EXCEL_DATE_FORMAT = 'yyyy-mm-dd'
+EXCEL_DATETIME_FORMAT = 'yyyy-mm-dd hh:mm'
+# columnas que pueden llegar como texto ISO (filas sinteticas de fallback_aggregate_rows)
+EXCEL_DATE_COLUMNS = ('period',)
+
+
+def _excel_cell(ws, key, value):
+    """Valor tipado para una hoja write_only: numeros y fechas como celdas nativas de Excel."""
+    from openpyxl.cell import WriteOnlyCell  # type: ignore
+    if isinstance(value, str) and key in EXCEL_DATE_COLUMNS:
+        try:
+            value = date.fromisoformat(value[:10])
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        # Excel no guarda zona horaria: se escribe la hora local
+        cell = WriteOnlyCell(ws, value=localtime(value).replace(tzinfo=None) if value.tzinfo else value)
+        cell.number_format = EXCEL_DATETIME_FORMAT
+        return cell
+    if isinstance(value, date):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.number_format = EXCEL_DATE_FORMAT
+        return cell
+    if isinstance(value, (Decimal, float)):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.number_format = EXCEL_MONEY_FORMAT
+        return cell
+    return value
+
+
+def write_excel(rows, dest, title='Reporte', chunk_size=2000):
+    """
+    Escribe `rows` (lista de dicts o queryset .values()) en `dest` (ruta o archivo binario)
+    con un Workbook write_only: cada fila se serializa al agregarla y no queda en memoria.
+    Los querysets se recorren con iterator(); devuelve la cantidad de filas escritas.
+    """
     try:
         import openpyxl  # type: ignore
+        from openpyxl.utils import get_column_letter  # type: ignore
     except Exception:
-        return b''
-    wb = openpyxl.Workbook()
-    ws = wb.active; ws.title = 'Reporte'
-    if rows:
-        headers = list(rows[0].keys())
+        return 0
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title='Reporte')
+    it = rows.iterator(chunk_size=chunk_size) if hasattr(rows, 'iterator') else iter(rows or ())
+    first = next(it, None)
+    count = 0
+    if first is not None:
+        headers = list(first.keys())
+        for idx, header in enumerate(headers, start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = max(12, len(str(header)) + 2)
         ws.append(headers)
-        for r in rows:
-            ws.append([r.get(h) for h in headers])
-    out = io.BytesIO(); wb.save(out); out.seek(0)
-    return out.read()
+        for r in itertools.chain((first,), it):
+            ws.append([_excel_cell(ws, h, r.get(h)) for h in headers])
+            count += 1
+    wb.properties.title = title
+    wb.save(dest)
+    return count
 
 
-def _model_path(scope='total'):
-    from django.conf import settings
-    from pathlib import Path
-    media = getattr(settings, 'MEDIA_ROOT', Path('.'))
-    p = Path(media) / 'ml'
-    p.mkdir(parents=True, exist_ok=True)
-    return str(p / f'model_{scope}.pkl')
+def export_to_excel(rows, title='Reporte') -> bytes:
+    out = io.BytesIO()
+    write_excel(rows, out, title=title)
+    return out.getvalue()
+
+
+def _monthly_training_rows(scope, since=None):
+    """Agregados mensuales del rollup ({period, category_id, total}), opcionalmente desde `since`."""
+    from .models import SalesDailyRollup
+    qs = SalesDailyRollup.objects.all()
+    if since is not None:
+        qs = qs.filter(day__gte=since)
+    qs = qs.annotate(period=TruncMonth('day'))
+    if scope == 'category':
+        agg = qs.values('period', 'category_id').annotate(total=Sum('revenue')).order_by('period', 'category_id')
+    else:
+        agg = qs.values('period').annotate(total=Sum('revenue')).order_by('period')
+    return [
+        {'period': r['period'].isoformat()[:10], 'category_id': r.get('category_id'), 'total': float(r['total'] or 0)}
+        for r in agg
+    ]
 
 
-def train_rf(scope='total'):
+def train_rf(scope='total', full=False, executor=None):
+    """
+    Entrena el modelo de `scope`. Salvo full=True, reutiliza los agregados del entrenamiento
+    anterior y solo relee del rollup desde el mes del ultimo watermark (ese mes pudo estar
+    incompleto). Un ajuste retroactivo de meses viejos (anulaciones) requiere full=True,
+    que es lo que corre `train_forecast --full`. Con `executor` el fit corre en ese pool.
+    """
     if pd is None or RandomForestRegressor is None or joblib is None:
         raise RuntimeError('Faltan dependencias ML (pandas, scikit-learn, joblib)')
-    from .models import OrderItem
-    qs = OrderItem.objects.filter(order__status__in=['PAID','DELIVERED','SHIPPED']).annotate(period=TruncMonth('order__created_at'))
-    if scope == 'category':
-        agg = qs.values('period','product__category_id').annotate(total=Sum('line_total')).order_by('period')
+    from django.db.models import Max
+    from django.utils.timezone import now as tz_now
+    from .ml import ML_N_JOBS, fit_forecast_model, model_paths, registry
+    from .models import SalesDailyRollup
+    model_paths(scope)  # valida el scope antes de consultar
+    last_day = SalesDailyRollup.objects.aggregate(last=Max('day'))['last']
+    previous = None if full else registry.training_rows(scope)
+    if previous and previous.get('source') == 'rollup' and previous.get('watermark'):
+        since = date.fromisoformat(previous['watermark']).replace(day=1)
+        fresh = _monthly_training_rows(scope, since=since)
+        cutoff = since.isoformat()
+        rows = [r for r in previous['rows'] if r['period'] < cutoff] + fresh
+        mode = 'incremental'
     else:
-        agg = qs.values('period').annotate(total=Sum('line_total')).order_by('period')
-    rows = list(agg)
+        fresh = rows = _monthly_training_rows(scope)
+        mode = 'full'
+    source = 'rollup'
     if not rows:
-        rows = _synthetic_training_rows(scope=scope)
-    df = pd.DataFrame(rows)
-    df['year'] = pd.to_datetime(df['period']).dt.year
-    df['month'] = pd.to_datetime(df['period']).dt.month
-    X = df[['year','month']].copy()
-    if scope == 'category':
-        X['category_id'] = df['product__category_id'].fillna(0)
-    y = df['total']
-    model = RandomForestRegressor(n_estimators=150, random_state=42)
-    model.fit(X, y)
-    joblib.dump(model, _model_path(scope))
-    return {'rows': int(len(df)), 'features': list(X.columns)}
+        rows = [
+            {'period': r['period'].date().isoformat(), 'category_id': r.get('product__category_id'), 'total': float(r['total'])}
+            for r in _synthetic_training_rows(scope=scope)
+        ]
+        source = 'synthetic'
+    if executor is not None:
+        model, features = executor.submit(fit_forecast_model, rows, scope, ML_N_JOBS).result()
+    else:
+        model, features = fit_forecast_model(rows, scope, ML_N_JOBS)
+    meta = {
+        'scope': scope,
+        'rows': len(rows),
+        'features': features,
+        'estimator': type(model.model).__name__,
+        'n_estimators': getattr(model.model, 'n_estimators', None),
+        'trained_at': tz_now().isoformat(),
+        'source': source,
+        'mode': mode,
+        'months_reread': len({r['period'] for r in fresh}),
+        # ultimo dia de ventas visto: si el rollup avanza, el modelo esta atrasado
+        'data_watermark': last_day.isoformat() if (last_day and source == 'rollup') else None,
+    }
+    registry.save(scope, model, meta, rows=rows)
+    return {'rows': meta['rows'], 'features': features, 'mode': mode, 'months_reread': meta['months_reread']}
 
 
-def predict_rf(months=6, scope='total', category_id=None):
-    if pd is None or joblib is None:
-        raise RuntimeError('Faltan dependencias ML (pandas, joblib)')
-    try:
-        model = joblib.load(_model_path(scope))
-    except Exception:
-        train_rf(scope=scope)
-        model = joblib.load(_model_path(scope))
-    from django.utils.timezone import now as tz_now
-    base = tz_now().date().replace(day=1)
+def _forecast_periods(base, horizons):
     periods = []
-    for i in range(1, int(months)+1):
+    for i in horizons:
         m = base.month + i
         y = base.year + (m-1)//12
         mo = ((m-1)%12)+1
         periods.append({'year': y, 'month': mo})
-    import pandas as pd2  # local alias
-    df = pd2.DataFrame(periods)
-    if scope == 'category':
-        df['category_id'] = int(category_id or 0)
-    preds = model.predict(df)
+    return periods
+
+
+def _registry_forecast(entry, cats, horizons, base, per_tree=False):
+    """
+    Pronostico del modelo registrado para los meses base+h (h en horizons) y las series
+    `cats`. Se predice en forma recursiva desde el ultimo mes entrenado; los meses que ya
+    estan en la historia devuelven el dato real. Una categoria sin historia arranca en 0.
+    Devuelve (cats x horizons, arboles x cats x horizons); lo segundo es None si no se
+    pidio per_tree o el modelo no es un bosque.
+    """
+    import numpy as np  # type: ignore
+    from .forecasting import Forecaster
+    from .ml import ModelNotTrained
+    forecaster = entry.model
+    if not isinstance(forecaster, Forecaster) or not forecaster.periods:
+        raise ModelNotTrained('El modelo guardado es de una version anterior; reentrenar con POST /api/admin/ml/train')
+    last = forecaster.periods[-1]
+    offset = (base.year - last.year) * 12 + base.month - last.month
+    length = len(forecaster.periods)
+    series = {c: forecaster.series.get(c, np.zeros(length)) for c in cats}
+    steps = max(1, offset + max(horizons))
+    if per_tree:
+        preds, spread = forecaster.predict(forecaster.periods, series, steps, per_tree=True)
+    else:
+        preds, spread = forecaster.predict(forecaster.periods, series, steps), None
+    mean = np.empty((len(cats), len(horizons)))
+    trees = np.empty((spread.shape[0], len(cats), len(horizons))) if spread is not None else None
+    for j, h in enumerate(horizons):
+        step = offset + h - 1
+        for i, c in enumerate(cats):
+            if step >= 0:
+                mean[i, j] = preds[c][step]
+                if trees is not None:
+                    trees[:, i, j] = spread[:, i, step]
+            else:
+                mean[i, j] = series[c][length + step] if length + step >= 0 else 0.0
+                if trees is not None:
+                    trees[:, i, j] = mean[i, j]
+    return mean, trees
+
+
+def predict_rf(months=6, scope='total', category_id=None):
+    """Prediccion con el modelo ya cargado en el registro; nunca entrena en el request."""
+    if pd is None or joblib is None:
+        raise RuntimeError('Faltan dependencias ML (pandas, joblib)')
+    from django.utils.timezone import now as tz_now
+    from .ml import PREDICTION_CACHE_SIZE, registry
+    entry = registry.get(scope)
+    base = tz_now().date().replace(day=1)
+    cat = int(category_id or 0) if scope == 'category' else None
+    cache_key = (int(months), cat, base)
+    cached = entry.predictions.get(cache_key)
+    if cached is not None:
+        return [dict(row) for row in cached]
+    horizons = list(range(1, int(months)+1))
+    periods = _forecast_periods(base, horizons)
+    preds, _trees = _registry_forecast(entry, [cat], horizons, base)
     out = []
     for i, r in enumerate(periods):
-        out.append({'period': f"{r['year']}-{r['month']:02d}-01", 'predicted_total': float(preds[i])})
+        out.append({'period': f"{r['year']}-{r['month']:02d}-01", 'predicted_total': float(preds[0, i])})
+    if len(entry.predictions) >= PREDICTION_CACHE_SIZE:
+        entry.predictions.clear()
+    entry.predictions[cache_key] = out
+    return [dict(row) for row in out]
+
+
+FORECAST_MAX_HORIZON = 36
+FORECAST_MAX_CATEGORIES = 200
+
+
+def predict_rf_batch(scope='total', category_ids=None, horizons=None, months=6, interval=0.8, memoize=True):
+    """
+    Pronostico de varias categorias y horizontes (meses hacia adelante) en una sola pasada.
+
+    Pronostica todas las categorias juntas (un paso por mes, cada arbol del bosque sobre
+    todas las series a la vez) y devuelve la media (igual a model.predict) con un intervalo
+    por percentiles de la dispersion entre arboles (null si el modelo no es un bosque, p. ej.
+    el seasonal-naive de respaldo con poca historia). Con memoize, el resultado queda en el
+    modelo cargado hasta el siguiente entrenamiento.
+    """
+    if pd is None or joblib is None:
+        raise RuntimeError('Faltan dependencias ML (pandas, joblib)')
+    import numpy as np  # type: ignore
+    from django.utils.timezone import now as tz_now
+    from .ml import PREDICTION_CACHE_SIZE, registry
+
+    horizons = sorted({int(h) for h in (horizons or range(1, int(months) + 1))})
+    if not horizons or horizons[0] < 1 or horizons[-1] > FORECAST_MAX_HORIZON:
+        raise ValueError(f'horizons debe estar entre 1 y {FORECAST_MAX_HORIZON}')
+    if not 0 < float(interval) < 1:
+        raise ValueError('interval debe estar entre 0 y 1')
+    if scope == 'category':
+        cats = list(dict.fromkeys(int(c or 0) for c in (category_ids or [0])))
+        if len(cats) > FORECAST_MAX_CATEGORIES:
+            raise ValueError(f'maximo {FORECAST_MAX_CATEGORIES} categorias por consulta')
+    else:
+        cats = [None]
+
+    entry = registry.get(scope)
+    base = tz_now().date().replace(day=1)
+    cache_key = ('batch', tuple(cats), tuple(horizons), float(interval), base)
+    if memoize and cache_key in entry.predictions:
+        return entry.predictions[cache_key]
+
+    periods = _forecast_periods(base, horizons)
+    # (arboles x categorias x meses): prediccion de cada arbol sobre el camino medio; sin
+    # bosque (modelo de respaldo con poca historia) no hay dispersion y el intervalo va null
+    mean, per_tree = _registry_forecast(entry, cats, horizons, base, per_tree=True)
+    if per_tree is not None:
+        tail = (1 - float(interval)) / 2 * 100
+        lower, upper = np.percentile(per_tree, [tail, 100 - tail], axis=0)
+        std = per_tree.std(axis=0)
+
+    results = []
+    for i, cat in enumerate(cats):
+        forecast = []
+        for j, (h, period) in enumerate(zip(horizons, periods)):
+            forecast.append({
+                'horizon': h,
+                'period': f"{period['year']}-{period['month']:02d}-01",
+                'predicted_total': float(mean[i, j]),
+                'lower': float(lower[i, j]) if per_tree is not None else None,
+                'upper': float(upper[i, j]) if per_tree is not None else None,
+                'std': float(std[i, j]) if per_tree is not None else None,
+            })
+        results.append({'category_id': cat, 'forecast': forecast})
+    out = {
+        'scope': scope,
+        'interval': float(interval),
+        'results': results,
+        'model': dict(entry.meta),
+    }
+    if memoize:
+        if len(entry.predictions) >= PREDICTION_CACHE_SIZE:
+            entry.predictions.clear()
+        entry.predictions[cache_key] = out
     return out
 
 
@@ -597,8 +1227,9 @@ def answer_product_question(prompt: str):
     """
     Recomendador ligero basado en reglas para consultas en lenguaje natural.
     Devuelve coincidencias de productos o un resumen de tendencia.
+    Los candidatos y puntajes salen del indice en memoria (sales.catalog_index).
     """
-    from .models import Product
+    from .catalog_index import get_catalog_index
 
     prompt = (prompt or '').strip()
     if not prompt:
@@ -640,64 +1271,18 @@ def answer_product_question(prompt: str):
             'recommendations': []
         }
 
-    products = Product.objects.filter(is_active=True, stock__gt=0).select_related('category', 'brand')
+    index = get_catalog_index()
     category_ids, _cat_label = _category_lookup(keyword_key)
-    if category_ids:
-        products = products.filter(category_id__in=category_ids)
-    elif keyword_key:
-        q = Q()
-        for term in KEYWORD_BUCKETS.get(keyword_key, []):
-            q |= Q(name__icontains=term) | Q(description__icontains=term)
-        if q:
-            products = products.filter(q)
-    if general_intent and not keyword_key:
-        featured = products.filter(is_featured=True)
-        if featured.exists():
-            products = featured
-        products = products.order_by('-is_featured', '-stock', '-updated_at')
-
-    if not products.exists():
+    general = general_intent and not keyword_key
+    candidates = index.candidates(category_ids=category_ids, keyword_key=keyword_key, featured_only=general)
+
+    if not candidates:
         return _prediction_summary(prompt, keyword_key)
 
-    recommendations = []
-    for product in products:
-        base_text = " ".join(filter(None, [
-            product.name or '',
-            product.description or '',
-            product.category.name if product.category else '',
-            product.brand.name if product.brand else '',
-        ])).lower()
-        score = 0.1
-        reasons = []
-
-        if keyword_key and any(term in base_text for term in KEYWORD_BUCKETS.get(keyword_key, [])):
-            score += 3
-            reasons.append(f"Coincide con la categoria {keyword_key}")
-
-        price = float(product.get_final_price() or product.price or 0)
-        if value_focus:
-            score += max(0, 4 - (price / 1000))
-            reasons.append('Buena relacion precio/prestaciones')
-        if premium_focus and price > 2500:
-            score += 2
-            reasons.append('Producto de gama alta')
-        if small_space and 'compact' in base_text:
-            score += 2
-            reasons.append('Formato compacto para espacios reducidos')
-        if energy_focus and any(term in base_text for term in ['eficiencia', 'ahorro', 'inverter']):
-            score += 2
-            reasons.append('Incluye atributos de eficiencia energetica')
-
-        if (product.warranty_months or 0) >= 24:
-            score += 0.5
-        score += min(product.stock or 0, 20) * 0.02
-
-        recommendations.append({
-            'product': product,
-            'score': score,
-            'price': price,
-            'reasons': reasons,
-        })
+    recommendations = index.score(
+        index.ordered(candidates, general=general), keyword_key,
+        value_focus=value_focus, premium_focus=premium_focus, small_space=small_space, energy_focus=energy_focus,
+    )
 
     recommendations.sort(key=lambda x: (x['score'], -x['price']), reverse=True)
     filtered = recommendations
@@ -768,9 +1353,9 @@ def answer_product_question(prompt: str):
             'id': product.id,
             'name': product.name,
             'price': item['price'],
-            'stock': product.stock,
-            'category': product.category.name if product.category else '',
-            'brand': product.brand.name if product.brand else '',
+            'stock': item['stock'],
+            'category': product.category_name,
+            'brand': product.brand_name,
             'warranty_months': product.warranty_months,
             'reason': '; '.join(item['reasons']) or 'Producto destacado del catalogo',
             'image_url': product.image_url,
@@ -1,9 +1,76 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import UserProfile
+from django.db import transaction
+
+from .catalog import bump_catalog_version
+from .catalog_index import refresh_catalog_index
+from .search import index_products
+from .receipts import RECEIPT_FIELDS, purge_receipts, receipt_path, receipt_version
+from .models import UserProfile, Product, Brand, Category, Order
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Brand)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_catalog(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance.pk])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def reindex_related_products(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    field = 'brand' if sender is Brand else 'category'
+    index_products(Product.objects.filter(**{field: instance}))
+
+
+@receiver(pre_delete, sender=Brand)
+@receiver(pre_delete, sender=Category)
+def remember_related_products(sender, instance, **kwargs):
+    field = 'brand' if sender is Brand else 'category'
+    instance._search_product_ids = list(Product.objects.filter(**{field: instance}).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def reindex_orphaned_products(sender, instance, **kwargs):
+    ids = getattr(instance, '_search_product_ids', None)
+    if ids:
+        index_products(ids)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def refresh_advisor_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: refresh_catalog_index([pk]))
+
+@receiver(post_save, sender=Order)
+def invalidate_receipt(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # la version nueva ya no coincide con el archivo guardado; aqui solo se limpia storage
+    if created or raw:
+        return
+    if update_fields is not None and not set(update_fields) & set(RECEIPT_FIELDS):
+        return
+    pk = instance.pk
+    keep = receipt_path(pk, receipt_version(instance))
+    transaction.on_commit(lambda: purge_receipts(pk, keep=keep))
+
+
+@receiver(post_delete, sender=Order)
+def delete_receipts(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: purge_receipts(pk))
@@ -0,0 +1,44 @@
+# sales/testing.py
+"""
+Utilidades para tests: presupuesto de consultas SQL por vista/operación.
+
+    class OrdersTests(QueryBudgetMixin, APITestCase):
+        def test_orders_mine(self):
+            with self.assertMaxQueries(4):
+                self.client.get('/api/orders/mine/')
+
+        def test_orders_mine_sin_n_mas_1(self):
+            self.assertQueryCountConstant(self.client.get, '/api/orders/mine/', setup=self.crear_orden)
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as ctx:
+            yield ctx
+        executed = len(ctx.captured_queries)
+        if executed > limit:
+            sql = '\n'.join(f"{i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, start=1))
+            self.fail(f'{executed} consultas ejecutadas, maximo permitido {limit}:\n{sql}')
+
+    def assertQueryCountConstant(self, func, *args, setup=None, rounds=3, using=DEFAULT_DB_ALIAS, **kwargs):
+        """
+        Ejecuta func varias veces llamando setup() entre rondas (p.ej. para agregar
+        ítems u órdenes) y falla si el número de consultas crece con los datos.
+        """
+        counts = []
+        for _ in range(rounds):
+            if setup is not None:
+                setup()
+            with CaptureQueriesContext(connections[using]) as ctx:
+                func(*args, **kwargs)
+            counts.append(len(ctx.captured_queries))
+        if len(set(counts)) > 1:
+            self.fail(f'El numero de consultas crece con los datos (posible N+1): {counts}')
+        return counts[0]
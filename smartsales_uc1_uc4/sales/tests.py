@@ -0,0 +1,514 @@
+"""
+Presupuesto de consultas de los listados que serializan relaciones (ver sales/testing.py):
+cada test fija un maximo y verifica que el numero de consultas no crece con los datos.
+Busqueda del catalogo: el tope de relevancia no cambia el conteo ni pierde filtros.
+Reportes: una fecha invalida es 400 antes de empezar a responder.
+Export columnar: un valor nuevo a mitad del export no rompe el archivo.
+Pronostico por lotes: sin bosque (poca historia) el intervalo va null, no de ancho cero.
+Stock: reserve_stock descuenta todo o nada y OrderMarkPaid informa los faltantes.
+Webhooks de pago: deduplicacion, confirmacion PENDING -> PAID, aislamiento de eventos
+que fallan y tope de reintentos de eventos abandonados.
+Paginacion keyset: recorrer hacia adelante y hacia atras con created_at repetidos no
+salta ni repite filas; un cursor adulterado es 404.
+"""
+import base64
+import io
+import itertools
+import json
+import tempfile
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.request import Request
+
+from . import columnar, payments, services
+from .models import (
+    AdminAuditLog, Brand, Cart, CartItem, Category, Order, OrderItem, PaymentTransaction, PaymentWebhookEvent, Product,
+    ReportJob,
+)
+from .pagination import AdminPagination
+from .testing import QueryBudgetMixin
+
+_seq = itertools.count(1)
+
+
+class QueryBudgetTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Marca')
+        cls.category = Category.objects.create(name='Categoria')
+        cls.buyer = User.objects.create_user('comprador', 'c@example.com', 'clave123')
+        cls.admin = User.objects.create_superuser('admin', 'a@example.com', 'clave123')
+
+    def setUp(self):
+        cache.clear()
+
+    def _product(self):
+        n = next(_seq)
+        return Product.objects.create(
+            name=f'Producto {n}', brand=self.brand, category=self.category,
+            price=Decimal('100.00'), stock=50, warranty_months=12,
+        )
+
+    def _order(self, status='PENDING', lines=2):
+        n = next(_seq)
+        order = Order.objects.create(
+            user=self.buyer, status=status, transaction_number=f'TX-{n}',
+            subtotal=Decimal('0'), grand_total=Decimal('0'),
+        )
+        for _ in range(lines):
+            product = self._product()
+            OrderItem.objects.create(
+                order=order, product=product, name_snapshot=product.name,
+                qty=1, unit_price=product.price, line_total=product.price,
+            )
+        return order
+
+    def _cart_item(self):
+        cart, _ = Cart.objects.get_or_create(user=self.buyer, status='ACTIVE')
+        product = self._product()
+        CartItem.objects.create(cart=cart, product=product, qty=1, price_snapshot=product.price)
+
+    def test_orders_mine(self):
+        self.client.force_authenticate(self.buyer)
+        self._order()
+        with self.assertMaxQueries(3):
+            self.assertEqual(self.client.get('/api/orders/mine/').status_code, 200)
+        self.assertQueryCountConstant(self.client.get, '/api/orders/mine/', setup=self._order)
+
+    def test_admin_pending_payments(self):
+        self.client.force_authenticate(self.admin)
+        self._order()
+        with self.assertMaxQueries(3):
+            self.assertEqual(self.client.get('/api/admin/payments/pending').status_code, 200)
+        self.assertQueryCountConstant(self.client.get, '/api/admin/payments/pending', setup=self._order)
+
+    def test_cart(self):
+        self.client.force_authenticate(self.buyer)
+        self._cart_item()
+        with self.assertMaxQueries(2):
+            self.assertEqual(self.client.get('/api/cart').status_code, 200)
+        self.assertQueryCountConstant(self.client.get, '/api/cart', setup=self._cart_item)
+
+    def test_product_list(self):
+        self._product()
+
+        def uncached_get():
+            # sin la cache por version del catalogo, para medir la consulta real
+            cache.clear()
+            return self.client.get('/api/products')
+
+        with self.assertMaxQueries(2):
+            self.assertEqual(uncached_get().status_code, 200)
+        self.assertQueryCountConstant(uncached_get, setup=self._product)
+
+
+class ProductSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Televisores')
+        cls.top = Brand.objects.create(name='Principal')
+        cls.other = Brand.objects.create(name='Secundaria')
+        # la marca Principal aparece primero en el ranking (el termino esta en el nombre)
+        for i in range(6):
+            Product.objects.create(name=f'Televisor {i}', brand=cls.top, category=cls.category, price=Decimal('100.00'))
+        for i in range(3):
+            Product.objects.create(
+                name=f'Pantalla {i}', description='televisor', brand=cls.other, category=cls.category,
+                price=Decimal(f'{50 + i}.00'),
+            )
+        Product.objects.create(name='Televisor inactivo', brand=cls.top, category=cls.category, price=Decimal('1.00'), is_active=False)
+
+    def setUp(self):
+        cache.clear()
+
+    def _get(self, params):
+        response = self.client.get('/api/products', {'q': 'televisor', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_count_does_not_depend_on_sort(self):
+        with mock.patch('sales.search.SEARCH_MAX_RESULTS', 4):
+            ranked = self._get({})
+            cache.clear()
+            by_price = self._get({'sort': 'price_asc'})
+        self.assertEqual(ranked['count'], 9)
+        self.assertEqual(by_price['count'], 9)
+        # los 4 mejor rankeados primero y el resto despues, por nombre
+        names = [p['name'] for p in ranked['results']]
+        self.assertTrue(all(name.startswith('Televisor') for name in names[:4]))
+        self.assertEqual(names[4:7], ['Pantalla 0', 'Pantalla 1', 'Pantalla 2'])
+
+    def test_filters_apply_before_the_ranking_cap(self):
+        with mock.patch('sales.search.SEARCH_MAX_RESULTS', 4):
+            data = self._get({'brand': 'Secundaria'})
+        self.assertEqual(data['count'], 3)
+        self.assertEqual({p['name'] for p in data['results']}, {'Pantalla 0', 'Pantalla 1', 'Pantalla 2'})
+
+
+class ReportFilterValidationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@example.com', 'clave123')
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def test_csv_export_rejects_invalid_dates(self):
+        for data in ({'date_from': '2024-13-45'}, {'date_to': 'garbage'}):
+            response = self.client.post('/api/admin/reports/sales/export-csv', data, format='json')
+            self.assertEqual(response.status_code, 400, data)
+            self.assertNotIsInstance(response, StreamingHttpResponse)
+
+    def test_csv_export_streams_valid_dates(self):
+        response = self.client.post('/api/admin/reports/sales/export-csv', {'date_from': '2024-01-01'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Reporte de Ventas', b''.join(response.streaming_content))
+
+    def test_report_generation_rejects_invalid_dates(self):
+        for url in ('/api/admin/reports/sales/generate', '/api/admin/reports/audit/generate'):
+            for extra in ({}, {'async': '1'}):
+                response = self.client.post(url, {'date_from': 'garbage', **extra}, format='json')
+                self.assertEqual(response.status_code, 400, (url, extra))
+        response = self.client.post(
+            '/api/admin/reports/jobs', {'kind': 'audit', 'params': {'date_to': '2024-02-30'}}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ReportJob.objects.exists())
+
+
+@unittest.skipUnless(columnar.columnar_available(), 'requiere pyarrow')
+class ColumnarExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        buyer = User.objects.create_user('comprador', 'c@example.com', 'clave123')
+        category = Category.objects.create(name='Categoria')
+        order = Order.objects.create(
+            user=buyer, status='PAID', transaction_number='TX-COL',
+            subtotal=Decimal('0'), grand_total=Decimal('0'),
+        )
+        for n in range(4):
+            product = Product.objects.create(
+                name=f'Producto {n}', brand=Brand.objects.create(name=f'Marca {n}'), category=category,
+                price=Decimal('10.00'),
+            )
+            OrderItem.objects.create(
+                order=order, product=product, name_snapshot=product.name,
+                qty=1, unit_price=product.price, line_total=product.price,
+            )
+
+    def _export(self, fmt):
+        original = columnar._dictionaries
+
+        def stale(lines):
+            # como si las otras marcas aparecieran despues de la lectura previa del diccionario
+            values = original(lines)
+            values['brand'] = values['brand'][:1]
+            return values
+
+        with mock.patch.object(columnar, '_dictionaries', stale):
+            return b''.join(columnar.iter_sales_columnar({}, fmt, batch_rows=1))
+
+    def test_new_values_during_export(self):
+        import pyarrow.feather as feather  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+        expected = ['Marca 0', 'Marca 1', 'Marca 2', 'Marca 3']
+        parquet = pq.read_table(io.BytesIO(self._export('parquet')))
+        self.assertEqual(parquet.column('brand').to_pylist(), expected)
+        table = feather.read_table(io.BytesIO(self._export('feather')))
+        self.assertEqual(table.column('brand').to_pylist(), expected)
+
+
+@unittest.skipUnless(services.pd is not None and services.RandomForestRegressor is not None, 'requiere pandas/scikit-learn')
+class ForecastIntervalTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _batch(self, rows):
+        from .ml import fit_forecast_model, registry
+        from .services import predict_rf_batch
+        model, features = fit_forecast_model(rows, 'total')
+        registry.save('total', model, {'features': features})
+        return predict_rf_batch('total', horizons=[1, 2], memoize=False)['results'][0]['forecast']
+
+    def test_seasonal_naive_fallback_has_no_interval(self):
+        from django.utils.timezone import now
+        month = now().date().replace(day=1).isoformat()
+        forecast = self._batch([{'period': month, 'category_id': None, 'total': 1200.0}])
+        for point in forecast:
+            self.assertEqual(point['predicted_total'], 1200.0)
+            self.assertEqual((point['lower'], point['upper'], point['std']), (None, None, None))
+
+    def test_forest_interval_contains_prediction(self):
+        rows = [{'period': f'2024-{m:02d}-01', 'category_id': None, 'total': 100.0 * m} for m in range(1, 13)]
+        for point in self._batch(rows):
+            self.assertLessEqual(point['lower'], point['predicted_total'])
+            self.assertGreaterEqual(point['upper'], point['predicted_total'])
+
+
+class StockReservationTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@example.com', 'clave123')
+        cls.buyer = User.objects.create_user('comprador', 'c@example.com', 'clave123')
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Producto {n}', price=Decimal('10.00'), stock=stock)
+            for n, stock in enumerate((5, 3, 1))
+        ]
+
+    def _stock(self):
+        return [p.stock for p in Product.objects.filter(pk__in=[p.pk for p in self.products]).order_by('pk')]
+
+    def test_reserves_every_line(self):
+        a, b, c = self.products
+        services.reserve_stock({a.pk: 2, b.pk: 3, c.pk: 1})
+        self.assertEqual(self._stock(), [3, 0, 0])
+
+    def test_shortage_leaves_every_row_unchanged(self):
+        a, b, c = self.products
+        # bloques de 1 fila: el faltante en el ultimo bloque revierte los anteriores
+        with mock.patch.object(services, 'STOCK_UPDATE_CHUNK', 1):
+            with self.assertRaises(services.InsufficientStock) as ctx:
+                services.reserve_stock({a.pk: 2, b.pk: 4, c.pk: 2})
+        self.assertEqual(self._stock(), [5, 3, 1])
+        self.assertEqual(
+            sorted(ctx.exception.shortages, key=lambda s: s['product_id']),
+            [
+                {'product_id': b.pk, 'name': b.name, 'requested': 4, 'available': 3},
+                {'product_id': c.pk, 'name': c.name, 'requested': 2, 'available': 1},
+            ],
+        )
+
+    def test_mark_paid_reports_shortages(self):
+        a, b, _c = self.products
+        order = Order.objects.create(
+            user=self.buyer, status='PENDING', transaction_number='TX-STOCK',
+            subtotal=Decimal('0'), grand_total=Decimal('0'),
+        )
+        for product, qty in ((a, 1), (b, 4)):
+            OrderItem.objects.create(
+                order=order, product=product, name_snapshot=product.name,
+                qty=qty, unit_price=product.price, line_total=product.price * qty,
+            )
+        self.client.force_authenticate(self.admin)
+        response = self.client.post(f'/api/orders/{order.pk}/mark-paid/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['shortages'], [
+            {'product_id': b.pk, 'name': b.name, 'requested': 4, 'available': 3},
+        ])
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'PENDING')
+        self.assertEqual(self._stock(), [5, 3, 1])
+
+
+class PaymentWebhookTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('comprador', 'c@example.com', 'clave123')
+
+    def _order(self, tx, qty=2, stock=5):
+        product = Product.objects.create(name=f'Producto {tx}', price=Decimal('10.00'), stock=stock)
+        order = Order.objects.create(
+            user=self.buyer, status='PENDING', transaction_number=tx,
+            subtotal=Decimal('0'), grand_total=product.price * qty,
+        )
+        OrderItem.objects.create(
+            order=order, product=product, name_snapshot=product.name,
+            qty=qty, unit_price=product.price, line_total=product.price * qty,
+        )
+        PaymentTransaction.objects.create(order=order, provider='mp', amount=order.grand_total, status='PENDING')
+        return order, product
+
+    def _post(self, body):
+        response = self.client.post('/api/payments/mp/webhook', json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['event_id']
+
+    def test_duplicate_deliveries_are_recorded_once(self):
+        body = {'id': 'pay-1', 'status': 'approved', 'external_reference': 'TX-1'}
+        self.assertEqual(self._post(body), self._post(body))
+        # sin id del proveedor, un reintento identico se deduplica por el hash del cuerpo
+        anonymous = {'status': 'approved', 'external_reference': 'TX-1'}
+        self.assertEqual(self._post(anonymous), self._post(anonymous))
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 2)
+        # un cambio de estado del mismo pago es otro evento
+        self._post({'id': 'pay-1', 'status': 'pending', 'external_reference': 'TX-1'})
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 3)
+
+    def test_paid_event_confirms_pending_order(self):
+        order, product = self._order('TX-PAID')
+        body = {'id': 'pay-2', 'status': 'approved', 'external_reference': 'TX-PAID'}
+        self._post(body)
+        self.assertEqual(payments.process_webhook_events(), 1)
+        order.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual(order.status, 'PAID')
+        self.assertIsNotNone(order.paid_at)
+        self.assertEqual(product.stock, 3)
+        self.assertEqual(PaymentWebhookEvent.objects.get().status, 'DONE')
+        self.assertEqual(PaymentTransaction.objects.get(order=order).status, 'SUCCEEDED')
+        # el reintento del proveedor no vuelve a descontar stock
+        self._post(body)
+        self.assertEqual(payments.process_webhook_events(), 0)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 3)
+
+    def test_unpaid_or_unknown_events_are_ignored(self):
+        order, _product = self._order('TX-WAIT')
+        self._post({'id': 'pay-3', 'status': 'pending', 'external_reference': 'TX-WAIT'})
+        self._post({'id': 'pay-4', 'status': 'approved', 'external_reference': 'TX-NOPE'})
+        self.assertEqual(payments.process_webhook_events(), 2)
+        self.assertEqual(set(PaymentWebhookEvent.objects.values_list('status', flat=True)), {'IGNORED'})
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'PENDING')
+
+    def test_failing_event_does_not_stop_the_batch(self):
+        poison, _ = self._order('TX-POISON')
+        short, _ = self._order('TX-SHORT', qty=9, stock=1)
+        good, _ = self._order('TX-GOOD')
+        for n, tx in enumerate(('TX-POISON', 'TX-SHORT', 'TX-GOOD')):
+            self._post({'id': f'pay-{n}', 'status': 'approved', 'external_reference': tx})
+        real = payments.adjust_stock_on_paid
+
+        def adjust(order, *args, **kwargs):
+            if order.pk == poison.pk:
+                raise RuntimeError('fallo inesperado')
+            return real(order, *args, **kwargs)
+
+        with mock.patch.object(payments, 'adjust_stock_on_paid', side_effect=adjust), \
+                self.assertLogs('sales.payments', level='ERROR'):
+            self.assertEqual(payments.process_webhook_events(), 3)
+        events = {ev.external_reference: ev for ev in PaymentWebhookEvent.objects.all()}
+        self.assertEqual(events['TX-POISON'].status, 'FAILED')
+        self.assertEqual(events['TX-POISON'].error, 'RuntimeError: fallo inesperado')
+        self.assertEqual(events['TX-SHORT'].status, 'FAILED')
+        self.assertIn('Stock insuficiente', events['TX-SHORT'].error)
+        self.assertEqual(events['TX-GOOD'].status, 'DONE')
+        self.assertEqual(
+            dict(Order.objects.values_list('transaction_number', 'status')),
+            {'TX-POISON': 'PENDING', 'TX-SHORT': 'PENDING', 'TX-GOOD': 'PAID'},
+        )
+
+    def test_abandoned_claims_are_retaken_up_to_the_cap(self):
+        self._post({'id': 'pay-5', 'status': 'approved', 'external_reference': 'TX-X'})
+        event = PaymentWebhookEvent.objects.get()
+        for attempt in range(1, payments.WEBHOOK_MAX_ATTEMPTS + 1):
+            self.assertEqual([ev.pk for ev in payments.claim_webhook_events()], [event.pk])
+            # en curso (claim reciente): otro worker no lo toma
+            self.assertEqual(payments.claim_webhook_events(), [])
+            event.refresh_from_db()
+            self.assertEqual(event.attempts, attempt)
+            # el worker murio: el claim queda viejo
+            PaymentWebhookEvent.objects.filter(pk=event.pk).update(
+                claimed_at=now() - payments.WEBHOOK_CLAIM_TIMEOUT - timedelta(seconds=1),
+            )
+        self.assertEqual(payments.claim_webhook_events(), [])
+        event.refresh_from_db()
+        self.assertEqual(event.status, 'FAILED')
+
+
+class KeysetPaginationTests(APITestCase):
+    URL = '/api/admin/audit/logs'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'a@example.com', 'clave123')
+        base = now().replace(microsecond=0)
+        # 11 entradas en 3 instantes: muchas filas comparten created_at y se desempatan por id
+        AdminAuditLog.objects.bulk_create([
+            AdminAuditLog(action='UPDATE', model_name='Product', object_id=str(n), created_at=base - timedelta(minutes=n % 3))
+            for n in range(11)
+        ])
+        cls.expected = list(AdminAuditLog.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def _page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['id'] for row in data['results']], data
+
+    def test_forward_and_backward_walks_cover_every_row_once(self):
+        pages, url = [], f'{self.URL}?page_size=3'
+        while url:
+            # un predicado de keyset roto repite paginas: cortar en vez de colgarse
+            self.assertLessEqual(len(pages), len(self.expected), 'la paginacion no termina')
+            ids, data = self._page(url)
+            pages.append(ids)
+            url = data['next']
+        self.assertEqual([pid for page in pages for pid in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertIsNone(data['next'])
+
+        back, url = [pages[-1]], data['previous']
+        while url:
+            self.assertLessEqual(len(back), len(self.expected), 'la paginacion no termina')
+            ids, data = self._page(url)
+            back.append(ids)
+            url = data['previous']
+        self.assertEqual(list(reversed(back)), pages)
+
+    def test_previous_page_then_next_returns_the_same_rows(self):
+        first_ids, first = self._page(f'{self.URL}?page_size=4')
+        second_ids, second = self._page(first['next'])
+        again_ids, again = self._page(second['previous'])
+        self.assertEqual(again_ids, first_ids)
+        self.assertIsNone(again['previous'])
+        self.assertEqual(self._page(again['next'])[0], second_ids)
+
+    def test_count_is_opt_in(self):
+        self.assertNotIn('count', self._page(f'{self.URL}?page_size=3')[1])
+        self.assertEqual(self._page(f'{self.URL}?page_size=3&count=1')[1]['count'], 11)
+
+    def test_tampered_cursors_are_not_found(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+        for cursor in (
+            'no-es-base64!',
+            encode({'v': [None, 5]}),
+            encode({'v': ['no-es-fecha', 5]}),
+            encode({'v': ['2024-01-01T00:00:00+00:00']}),
+            encode({'x': 1}),
+        ):
+            response = self.client.get(self.URL, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+    def test_ascending_ordering(self):
+        class View:
+            cursor_ordering = ('created_at', 'id')
+
+        expected = list(AdminAuditLog.objects.order_by('created_at', 'id').values_list('id', flat=True))
+        factory, seen, query = APIRequestFactory(), [], {'paginate': 'cursor', 'page_size': 4}
+        while True:
+            self.assertLessEqual(len(seen), len(expected), 'la paginacion no termina')
+            paginator = AdminPagination()
+            request = Request(factory.get('/', query))
+            seen += [row.id for row in paginator.paginate_queryset(AdminAuditLog.objects.all(), request, View())]
+            if not paginator.next_link:
+                break
+            query = {'page_size': 4, 'cursor': paginator.next_link.split('cursor=')[1].split('&')[0]}
+        self.assertEqual(seen, expected)
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from rest_framework.views import APIView
 from django.core.cache import cache
 from django.core.mail import send_mail
@@ -14,9 +14,10 @@ from django.core.files.storage import default_storage
 from django.utils.text import get_valid_filename
 from django.shortcuts import get_object_or_404
 from django.utils.timezone import now, localtime
-from django.http import FileResponse, JsonResponse
-from io import BytesIO
-from io import StringIO
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 import csv
 import os
 import json
@@ -29,17 +30,34 @@ from .serializers import (
     CartSerializer, CartItemSerializer,
     CheckoutSerializer, OrderSerializer,
     BrandSerializer, CategorySerializer, ProductAdminWriteSerializer,
+    ForecastTrainingJobSerializer, AdminAuditLogSerializer,
 )
 from .models import (
     UserProfile, UserAddress, Product, Cart, CartItem, Order, OrderItem,
-    PaymentTransaction, Brand, Category, SalesReport, AuditReport, AdminAuditLog
+    PaymentTransaction, Brand, Category, SalesReport, AuditReport, AdminAuditLog, ReportJob,
+    ForecastTrainingJob,
 )
 from .services import (
-    adjust_stock_on_paid, revert_stock_on_void, log_admin_action,
-    parse_prompt_to_spec, build_sales_queryset, aggregate_sales,
-    export_to_pdf, export_to_excel, train_rf, predict_rf,
+    adjust_stock_on_paid, revert_stock_on_void, log_admin_action, InsufficientStock,
+    build_order_items,
+    parse_prompt_to_spec, sales_aggregate,
+    train_rf, predict_rf, predict_rf_batch,
     answer_product_question, fallback_aggregate_rows,
+    build_sales_report_filters, validate_sales_report_filters, sales_report_summary, iter_sales_report_detail,
 )
+from .catalog import catalog_cache_key, CATALOG_CACHE_TTL
+from .ml import ModelNotTrained, enqueue_training_job, registry as model_registry
+from .audit import snapshot as audit_snapshot
+from .pagination import AdminPagination
+from .payments import record_webhook_event
+from .search import apply_product_search
+from .reports import (
+    create_sales_report, create_audit_report, build_audit_report_filters,
+    build_prompt_report, open_prompt_report, PROMPT_REPORT_FILES, audit_log_queryset,
+    enqueue_report_job, report_job_file,
+)
+from .columnar import COLUMNAR_FORMATS, columnar_available, iter_sales_columnar
+from .receipts import get_or_render_receipt, iter_receipts_zip, receipt_export_queryset, receipt_version
 
 
 # AUTH
@@ -242,14 +260,6 @@ class ProductListView(generics.ListAPIView):
         featured = self.request.query_params.get('featured')
         on_sale = self.request.query_params.get('on_sale')
 
-        if q:
-            qs = qs.filter(
-                Q(name__icontains=q) |
-                Q(description__icontains=q) |
-                Q(color__icontains=q) |
-                Q(size__icontains=q)
-            )
-
         if brand:
             qs = qs.filter(brand__name__iexact=brand)
         if brand_id:
@@ -279,21 +289,36 @@ class ProductListView(generics.ListAPIView):
         if on_sale and str(on_sale).lower() in truthy:
             qs = qs.filter(Q(sale_price__isnull=False) | Q(discount_percent__gt=0))
 
+        if q:
+            # despues de los filtros: el tope de relevancia se toma sobre lo que se lista;
+            # sin sort explicito, se ordena por relevancia (bm25 / ts_rank)
+            qs = apply_product_search(qs, q, ranked=not sort)
+
         if sort == 'price_asc':
             qs = qs.order_by('price', 'name')
         elif sort == 'price_desc':
             qs = qs.order_by('-price', 'name')
         elif sort == 'newest':
             qs = qs.order_by('-created_at')
-        else:
+        elif sort or not q:
             qs = qs.order_by('name')
 
         return qs
 
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, headers={'X-Catalog-Cache': 'HIT'})
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, CATALOG_CACHE_TTL)
+        response['X-Catalog-Cache'] = 'MISS'
+        return response
+
 class ProductDetailView(generics.RetrieveAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = ProductSerializer
-    queryset = Product.objects.filter(is_active=True)
+    queryset = Product.objects.filter(is_active=True).select_related('brand', 'category')
 
 
 # Cat\u00e1logos adjuntos
@@ -313,16 +338,18 @@ class CategoryListView(generics.ListAPIView):
 class AdminProductListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = ProductAdminWriteSerializer
+    pagination_class = AdminPagination
+    cursor_ordering = ('-updated_at', '-id')
 
     def get_queryset(self):
-        qs = Product.objects.all()
+        qs = Product.objects.select_related('brand', 'category')
         q = self.request.query_params.get('q')
         brand = self.request.query_params.get('brand')
         category = self.request.query_params.get('category')
         active = self.request.query_params.get('active')
 
         if q:
-            qs = qs.filter(Q(name__icontains=q) | Q(description__icontains=q))
+            qs = apply_product_search(qs, q, ranked=False)
         if brand:
             qs = qs.filter(brand__name__iexact=brand)
         if category:
@@ -351,7 +378,7 @@ class AdminProductListCreateView(generics.ListCreateAPIView):
 class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = ProductAdminWriteSerializer
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('brand', 'category')
 
     def get_serializer_context(self):
         ctx = super().get_serializer_context()
@@ -359,7 +386,7 @@ class AdminProductDetailView(generics.RetrieveUpdateDestroyAPIView):
         return ctx
 
     def perform_update(self, serializer):
-        before = self.get_object()
+        before = audit_snapshot(serializer.instance)
         obj = serializer.save()
         try:
             log_admin_action(self.request.user, 'UPDATE', 'Product', obj.id, before, obj)
@@ -388,19 +415,23 @@ class AdminProductAdjustStockView(APIView):
         new_stock = (product.stock or 0) + delta
         if new_stock < 0:
             return Response({'detail': 'Stock no puede ser negativo'}, status=400)
-        before = Product.objects.get(pk=product.pk)
+        before = {'stock': product.stock}
         product.stock = new_stock
         product.save(update_fields=['stock'])
         try:
-            log_admin_action(request.user, 'ADJUST_STOCK', 'Product', product.id, before, product)
+            log_admin_action(request.user, 'ADJUST_STOCK', 'Product', product.id, before, {'stock': product.stock})
         except Exception:
             pass
         return Response({'id': product.id, 'stock': product.stock})
 
 
 # CARRITO (UC5)
-def _get_or_create_active_cart(user):
-    cart, _ = Cart.objects.get_or_create(user=user, status='ACTIVE')
+def _get_or_create_active_cart(user, with_items=False):
+    qs = Cart.objects.all()
+    if with_items:
+        # lo que lee CartSerializer: items + product.name/image_url
+        qs = qs.prefetch_related(Prefetch('items', queryset=CartItem.objects.select_related('product').order_by('id')))
+    cart, _ = qs.get_or_create(user=user, status='ACTIVE')
     return cart
 
 
@@ -409,7 +440,7 @@ class CartView(generics.RetrieveAPIView):
     serializer_class = CartSerializer
 
     def get_object(self):
-        return _get_or_create_active_cart(self.request.user)
+        return _get_or_create_active_cart(self.request.user, with_items=True)
 
 
 class CartAddItemView(generics.CreateAPIView):
@@ -444,7 +475,7 @@ class CartAddItemView(generics.CreateAPIView):
             item.price_snapshot = product.price
             item.save()
 
-        return Response(CartSerializer(cart).data)
+        return Response(CartSerializer(_get_or_create_active_cart(request.user, with_items=True)).data)
 
 
 class CartItemUpdateView(generics.UpdateAPIView, generics.DestroyAPIView):
@@ -454,28 +485,26 @@ class CartItemUpdateView(generics.UpdateAPIView, generics.DestroyAPIView):
 
     def get_queryset(self):
         cart = _get_or_create_active_cart(self.request.user)
-        return CartItem.objects.filter(cart=cart)
+        return CartItem.objects.filter(cart=cart).select_related('product')
 
     @transaction.atomic
     def put(self, request, *args, **kwargs):
         item = self.get_object()
         qty = int(request.data.get('qty', 1))
         if qty <= 0:
-            cart = item.cart
             item.delete()
-            return Response(CartSerializer(cart).data)
+            return Response(CartSerializer(_get_or_create_active_cart(request.user, with_items=True)).data)
         if qty > item.product.stock:
             raise exceptions.ValidationError("Stock insuficiente.")
         item.qty = qty
         item.price_snapshot = item.product.price
         item.save()
-        return Response(CartSerializer(item.cart).data)
+        return Response(CartSerializer(_get_or_create_active_cart(request.user, with_items=True)).data)
 
     def delete(self, request, *args, **kwargs):
         item = self.get_object()
-        cart = item.cart
         item.delete()
-        return Response(CartSerializer(cart).data)
+        return Response(CartSerializer(_get_or_create_active_cart(request.user, with_items=True)).data)
 
 
 # CHECKOUT (UC6)
@@ -494,9 +523,10 @@ class CheckoutView(generics.CreateAPIView):
 class OrderMineList(generics.ListAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AdminPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return Order.objects.filter(user=self.request.user).prefetch_related('items').order_by('-created_at')
 
 
 # UC9: Buscar por transaction_number (admin)
@@ -504,7 +534,7 @@ class OrderByTransaction(generics.RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAdminUser]
     lookup_field = 'transaction_number'
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related('items')
 
 
 # UC7a: Marcar como pagado
@@ -521,6 +551,8 @@ class OrderMarkPaid(APIView):
 
         try:
             adjust_stock_on_paid(order)
+        except InsufficientStock as e:
+            return Response({"detail": str(e), "shortages": e.shortages}, status=400)
         except ValueError as e:
             return Response({"detail": str(e)}, status=400)
 
@@ -557,54 +589,64 @@ class OrderReceiptPDF(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
-        order = get_object_or_404(Order, pk=pk)
+        order = get_object_or_404(Order.objects.select_related('user'), pk=pk)
         if (order.user_id != request.user.id) and (not request.user.is_staff):
             return Response({"detail":"No autorizado."}, status=403)
+        return _receipt_response(request, order)
+
+
+def _receipt_headers(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    # privado (depende del usuario) y siempre revalidado: el cliente reusa su copia con un 304
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _receipt_response(request, order):
+    """Comprobante desde storage (ver sales/receipts.py) con ETag fuerte y Last-Modified."""
+    version = receipt_version(order)
+    etag = f'"{version}"'
+    if request.META.get('HTTP_IF_NONE_MATCH'):
+        # la version sale de la fila de la orden: el 304 no toca storage ni renderiza
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return _receipt_headers(not_modified, etag)
+    path, _created = get_or_render_receipt(order, version)
+    try:
+        last_modified = int(default_storage.get_modified_time(path).timestamp())
+    except NotImplementedError:
+        last_modified = None
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _receipt_headers(not_modified, etag, last_modified)
+    response = FileResponse(default_storage.open(path, 'rb'), as_attachment=False, filename=f'receipt_{order.transaction_number}.pdf', content_type='application/pdf')
+    return _receipt_headers(response, etag, last_modified)
+
+
+
+class AdminOrderReceiptsZip(APIView):
+    """
+    ZIP con los comprobantes de `ids` o de las ordenes pagadas entre date_from y date_to
+    (ver receipts.iter_receipts_zip). Con include_report agrega el PDF del reporte de
+    ventas del mismo rango, reutilizando el SalesReport cacheado si existe.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-
-        buf = BytesIO()
-        c = canvas.Canvas(buf, pagesize=A4)
-        W, H = A4
-
-        y = H - 20*mm
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(20*mm, y, "PercyStore - Comprobante de Compra"); y -= 10*mm
-
-        c.setFont("Helvetica", 10)
-        c.drawString(20*mm, y, f"TransacciÃ³n: {order.transaction_number}"); y -= 6*mm
-        c.drawString(20*mm, y, f"Fecha: {order.created_at.strftime('%Y-%m-%d %H:%M')}"); y -= 6*mm
-        c.drawString(20*mm, y, f"Cliente: {order.user.get_full_name() or order.user.username}"); y -= 10*mm
-
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Items"); y -= 6*mm
-        c.setFont("Helvetica", 10)
-
-        for it in order.items.all():
-            line = f"{it.qty}x {it.name_snapshot}  @ {it.unit_price}  = {it.line_total}"
-            c.drawString(22*mm, y, line); y -= 6*mm
-        if it.warranty_expires_at:
-            c.drawString(24*mm, y, f"Garantia hasta: {it.warranty_expires_at}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-
-        y -= 5*mm
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(20*mm, y, f"Subtotal: {order.subtotal}"); y -= 6*mm
-        c.drawString(20*mm, y, f"EnvÃ­o: {order.shipping_total}  Descuento: {order.discount_total}  Impuestos: {order.tax_total}"); y -= 6*mm
-        c.drawString(20*mm, y, f"TOTAL: {order.grand_total}"); y -= 10*mm
-
-        c.setFont("Helvetica", 9)
-        c.drawString(20*mm, y, f"Estado: {order.status}  | TransacciÃ³n: {order.transaction_status}"); y -= 6*mm
-        c.drawString(20*mm, y, "Gracias por su compra. Conserve este comprobante para garantÃ­as.")
-
-        c.showPage()
-        c.save()
-        buf.seek(0)
-        return FileResponse(buf, as_attachment=False, filename=f"receipt_{order.transaction_number}.pdf", content_type='application/pdf')
-
+    def post(self, request):
+        try:
+            orders = receipt_export_queryset(request.data)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        extra = []
+        if str(request.data.get('include_report') or '').lower() in ('1', 'true', 'yes', 'si'):
+            f = build_sales_report_filters({'date_from': request.data.get('date_from'), 'date_to': request.data.get('date_to')})
+            rep, _hit = create_sales_report(request.user, f)
+            extra.append(('reporte_ventas.pdf', rep.pdf_file.name, rep.created_at))
+        resp = StreamingHttpResponse(iter_receipts_zip(orders, extra_files=extra), content_type='application/zip')
+        resp['Content-Disposition'] = f'attachment; filename="comprobantes_{localtime():%Y%m%d_%H%M%S}.zip"'
+        return resp
 
 # Upload avatar (dev)
 class UploadAvatarView(APIView):
@@ -627,7 +669,9 @@ class UploadAvatarView(APIView):
 class AdminUserListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = __import__('sales.serializers', fromlist=['AdminUserSerializer']).AdminUserSerializer  # lazy to avoid circular import hints
-    queryset = User.objects.all().order_by('username')
+    queryset = User.objects.select_related('profile').order_by('username')
+    pagination_class = AdminPagination
+    cursor_ordering = ('username', 'id')
 
     def perform_create(self, serializer):
         obj = serializer.save()
@@ -640,10 +684,10 @@ class AdminUserListCreateView(generics.ListCreateAPIView):
 class AdminUserDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = __import__('sales.serializers', fromlist=['AdminUserSerializer']).AdminUserSerializer
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('profile')
 
     def perform_update(self, serializer):
-        before = self.get_object()
+        before = audit_snapshot(serializer.instance)
         obj = serializer.save()
         try:
             log_admin_action(self.request.user, 'UPDATE_USER', 'User', obj.id, before, obj)
@@ -672,11 +716,11 @@ class ChangeEmailView(APIView):
         cached = cache.get(f"verify:email:{email}")
         if not cached or str(cached) != str(code):
             return Response({'detail':'CÃ³digo invÃ¡lido'}, status=400)
-        before = User.objects.get(pk=request.user.pk)
+        before = {'email': request.user.email}
         request.user.email = email
         request.user.save(update_fields=['email'])
         try:
-            log_admin_action(request.user, 'CHANGE_EMAIL', 'User', request.user.id, before, request.user)
+            log_admin_action(request.user, 'CHANGE_EMAIL', 'User', request.user.id, before, {'email': email})
         except Exception:
             pass
         return Response({'ok': True})
@@ -693,12 +737,12 @@ class ChangePhoneView(APIView):
         cached = cache.get(f"verify:tel:{phone}")
         if not cached or str(cached) != str(code):
             return Response({'detail':'CÃ³digo invÃ¡lido'}, status=400)
-        before = request.user.profile
         prof = request.user.profile
+        before = {'phone': prof.phone}
         prof.phone = phone
         prof.save(update_fields=['phone'])
         try:
-            log_admin_action(request.user, 'CHANGE_PHONE', 'UserProfile', prof.user_id, before, prof)
+            log_admin_action(request.user, 'CHANGE_PHONE', 'UserProfile', prof.user_id, before, {'phone': phone})
         except Exception:
             pass
         return Response({'ok': True})
@@ -709,139 +753,24 @@ class AdminSalesReportList(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = __import__('sales.serializers', fromlist=['SalesReportSerializer']).SalesReportSerializer
     queryset = __import__('sales.models', fromlist=['SalesReport']).SalesReport.objects.all()
+    pagination_class = AdminPagination
 
 
 class AdminSalesReportCreate(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from django.core.files.base import ContentFile
-        import datetime
-        SalesReport = __import__('sales.models', fromlist=['SalesReport']).SalesReport
         SalesReportSerializer = __import__('sales.serializers', fromlist=['SalesReportSerializer']).SalesReportSerializer
-
-        f = {
-            'date_from': request.data.get('date_from'),
-            'date_to': request.data.get('date_to'),
-            'brand': request.data.get('brand') or '',
-            'category': request.data.get('category') or '',
-            'min_price': request.data.get('min_price') or '',
-            'max_price': request.data.get('max_price') or '',
-        }
-
-        qs_orders = Order.objects.filter(status='PAID').prefetch_related('items__product__brand', 'items__product__category')
-        if f['date_from']:
-            qs_orders = qs_orders.filter(created_at__date__gte=f['date_from'])
-        if f['date_to']:
-            qs_orders = qs_orders.filter(created_at__date__lte=f['date_to'])
-
-        filtered_lines = []
-        orders_set = set()
-        for o in qs_orders:
-            for it in o.items.all():
-                p = it.product
-                if f['brand'] and (not p.brand or p.brand.name.lower() != f['brand'].lower()):
-                    continue
-                if f['category'] and (not p.category or p.category.name.lower() != f['category'].lower()):
-                    continue
-                try:
-                    if f['min_price'] and float(it.unit_price) < float(f['min_price']):
-                        continue
-                    if f['max_price'] and float(it.unit_price) > float(f['max_price']):
-                        continue
-                except Exception:
-                    pass
-                filtered_lines.append(it)
-                orders_set.add(it.order_id)
-
-        total = sum([float(l.line_total) for l in filtered_lines])
-        cnt = len(filtered_lines)
-        orders_count = len(orders_set) or 1
-        avg_ticket = total / orders_count
-
-        # Acumulados por marca y categorÃ­a y top productos
-        brand_totals = {}
-        category_totals = {}
-        product_totals_qty = {}
-        product_totals_amt = {}
-        for it in filtered_lines:
-            p = it.product
-            b = (p.brand.name if p.brand else 'Sin marca')
-            c = (p.category.name if p.category else 'Sin categorÃ­a')
-            brand_totals[b] = brand_totals.get(b, 0.0) + float(it.line_total)
-            category_totals[c] = category_totals.get(c, 0.0) + float(it.line_total)
-            key = it.name_snapshot
-            product_totals_qty[key] = product_totals_qty.get(key, 0) + int(it.qty)
-            product_totals_amt[key] = product_totals_amt.get(key, 0.0) + float(it.line_total)
-        top5_qty = sorted(product_totals_qty.items(), key=lambda x: x[1], reverse=True)[:5]
-        top5_amt = sorted(product_totals_amt.items(), key=lambda x: x[1], reverse=True)[:5]
-
-        buf = BytesIO(); c = canvas.Canvas(buf, pagesize=A4); W, H = A4
-        y = H - 20*mm
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(20*mm, y, "PercyStore - Reporte de Ventas"); y -= 10*mm
-        c.setFont("Helvetica", 10)
-        c.drawString(20*mm, y, f"Intervalo: {f['date_from'] or '-'} a {f['date_to'] or '-'}"); y -= 6*mm
-        c.drawString(20*mm, y, f"Filtros: brand={f['brand'] or '-'} category={f['category'] or '-'} min={f['min_price'] or '-'} max={f['max_price'] or '-'}"); y -= 8*mm
-        c.drawString(20*mm, y, f"Ã“rdenes: {orders_count}  |  Ticket promedio: {avg_ticket:.2f}"); y -= 6*mm
-        c.drawString(20*mm, y, f"LÃ­neas vendidas: {cnt}"); y -= 6*mm
-        c.drawString(20*mm, y, f"Total vendido: {total:.2f}"); y -= 10*mm
-
-        # Totales por marca
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Totales por Marca"); y -= 6*mm
-        c.setFont("Helvetica", 9)
-        for name, amt in sorted(brand_totals.items(), key=lambda x: x[1], reverse=True):
-            c.drawString(22*mm, y, f"{name}: {amt:.2f}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        y -= 4*mm
-
-        # Totales por categorÃ­a
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Totales por CategorÃ­a"); y -= 6*mm
-        c.setFont("Helvetica", 9)
-        for name, amt in sorted(category_totals.items(), key=lambda x: x[1], reverse=True):
-            c.drawString(22*mm, y, f"{name}: {amt:.2f}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        y -= 4*mm
-
-        # Top productos
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Top 5 productos por Unidades"); y -= 6*mm
-        c.setFont("Helvetica", 9)
-        for name, q in top5_qty:
-            c.drawString(22*mm, y, f"{name}: {q} u."); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        y -= 4*mm
-
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Top 5 productos por Importe"); y -= 6*mm
-        c.setFont("Helvetica", 9)
-        for name, amt in top5_amt:
-            c.drawString(22*mm, y, f"{name}: {amt:.2f}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        y -= 6*mm
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(20*mm, y, "Detalle"); y -= 6*mm
-        c.setFont("Helvetica", 9)
-        for it in filtered_lines[:200]:
-            c.drawString(22*mm, y, f"{it.order_id} | {it.qty}x {it.name_snapshot} @ {it.unit_price} = {it.line_total}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        c.showPage(); c.save(); buf.seek(0)
-
-        filename = f"sales_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        rep = SalesReport(created_by=request.user, filters=f)
-        rep.pdf_file.save(filename, ContentFile(buf.read()))
-        rep.save()
-        return Response(SalesReportSerializer(rep).data)
+        try:
+            f = validate_sales_report_filters(build_sales_report_filters(request.data))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        if _wants_async(request):
+            return _enqueue_job_response(request, 'sales', f)
+        rep, hit = create_sales_report(request.user, f, refresh=_wants_refresh(request))
+        resp = Response(SalesReportSerializer(rep).data)
+        resp['X-Report-Cache'] = 'HIT' if hit else 'MISS'
+        return resp
 
 
 class AdminSalesReportDownload(APIView):
@@ -856,56 +785,59 @@ class AdminAuditReportList(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = __import__('sales.serializers', fromlist=['AuditReportSerializer']).AuditReportSerializer
     queryset = __import__('sales.models', fromlist=['AuditReport']).AuditReport.objects.all()
+    pagination_class = AdminPagination
 
 
 class AdminAuditReportCreate(APIView):
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        from reportlab.lib.pagesizes import A4
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.units import mm
-        from django.core.files.base import ContentFile
-        import datetime
-        AuditReport = __import__('sales.models', fromlist=['AuditReport']).AuditReport
         AuditReportSerializer = __import__('sales.serializers', fromlist=['AuditReportSerializer']).AuditReportSerializer
+        try:
+            f = validate_sales_report_filters(build_audit_report_filters(request.data))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        if _wants_async(request):
+            return _enqueue_job_response(request, 'audit', f)
+        rep, hit = create_audit_report(request.user, f, refresh=_wants_refresh(request))
+        resp = Response(AuditReportSerializer(rep).data)
+        resp['X-Report-Cache'] = 'HIT' if hit else 'MISS'
+        return resp
 
-        f = {
-            'date_from': request.data.get('date_from'),
-            'date_to': request.data.get('date_to'),
-            'action': request.data.get('action') or '',
-            'model': request.data.get('model') or '',
-        }
-        qs = AdminAuditLog.objects.all().select_related('user')
-        if f['date_from']:
-            qs = qs.filter(created_at__date__gte=f['date_from'])
-        if f['date_to']:
-            qs = qs.filter(created_at__date__lte=f['date_to'])
-        if f['action']:
-            qs = qs.filter(action=f['action'])
-        if f['model']:
-            qs = qs.filter(model_name__iexact=f['model'])
-        logs = list(qs.order_by('-created_at')[:1000])
-
-        buf = BytesIO(); c = canvas.Canvas(buf, pagesize=A4); W, H = A4
-        y = H - 20*mm
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(20*mm, y, "PercyStore - AuditorÃ­a de Admin"); y -= 10*mm
-        c.setFont("Helvetica", 10)
-        c.drawString(20*mm, y, f"Intervalo: {f['date_from'] or '-'} a {f['date_to'] or '-'} | action={f['action'] or '-'} | model={f['model'] or '-'}"); y -= 8*mm
-        c.setFont("Helvetica", 9)
-        for log in logs:
-            who = (log.user.get_username() if log.user else 'N/A')
-            c.drawString(20*mm, y, f"{log.created_at.strftime('%Y-%m-%d %H:%M:%S')} | {who} | {log.action} {log.model_name}#{log.object_id}"); y -= 5*mm
-            if y < 30*mm:
-                c.showPage(); y = H - 20*mm
-        c.showPage(); c.save(); buf.seek(0)
-
-        filename = f"audit_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        rep = AuditReport(created_by=request.user, filters=f)
-        rep.pdf_file.save(filename, ContentFile(buf.read()))
-        rep.save()
-        return Response(AuditReportSerializer(rep).data)
+
+def _query_date(value):
+    """date de un parametro AAAA-MM-DD, o None si no es una fecha valida."""
+    try:
+        return parse_date(str(value).strip())
+    except ValueError:
+        return None
+
+
+class AdminAuditLogList(generics.ListAPIView):
+    """
+    Bitacora de admin en JSON, sin generar PDF. Filtros: date_from, date_to, action, model
+    (los mismos del reporte), user, object_id. Pagina por cursor (created_at, id) por defecto.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = AdminAuditLogSerializer
+    pagination_class = AdminPagination
+    pagination_mode = 'cursor'
+
+    def get_queryset(self):
+        params = self.request.query_params
+        f = build_audit_report_filters(params)
+        for key in ('date_from', 'date_to'):
+            if f[key] and _query_date(f[key]) is None:
+                raise exceptions.ValidationError({key: 'Fecha invalida: use el formato AAAA-MM-DD'})
+        qs = audit_log_queryset(f)
+        if params.get('user'):
+            try:
+                qs = qs.filter(user_id=int(params.get('user')))
+            except ValueError:
+                raise exceptions.ValidationError({'user': 'Debe ser el id numerico del usuario'})
+        if params.get('object_id'):
+            qs = qs.filter(object_id=params.get('object_id'))
+        return qs.order_by('-created_at', '-id')
 
 
 class AdminAuditReportDownload(APIView):
@@ -916,116 +848,201 @@ class AdminAuditReportDownload(APIView):
         return FileResponse(rep.pdf_file.open('rb'), as_attachment=False, filename=os.path.basename(rep.pdf_file.name), content_type='application/pdf')
 
 
-# --- Export CSV de ventas (no persistente) ---
+# --- Cola de reportes (ReportJob) ---
+def _wants_async(request):
+    flag = str(request.data.get('async') or request.query_params.get('async') or '').lower()
+    return flag in ('1', 'true', 'yes', 'si')
+
+
+def _wants_refresh(request):
+    flag = str(request.data.get('refresh') or request.query_params.get('refresh') or '').lower()
+    return flag in ('1', 'true', 'yes', 'si')
+
+
+def _enqueue_job_response(request, kind, params):
+    ReportJobSerializer = __import__('sales.serializers', fromlist=['ReportJobSerializer']).ReportJobSerializer
+    try:
+        job = enqueue_report_job(request.user, kind, params)
+    except ValueError as exc:
+        return Response({'detail': str(exc)}, status=400)
+    return Response(ReportJobSerializer(job).data, status=202)
+
+
+class AdminReportJobListCreate(generics.ListAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = __import__('sales.serializers', fromlist=['ReportJobSerializer']).ReportJobSerializer
+    pagination_class = AdminPagination
+
+    def get_queryset(self):
+        qs = ReportJob.objects.all()
+        status = self.request.query_params.get('status')
+        if status:
+            qs = qs.filter(status=status.upper())
+        return qs
+
+    def post(self, request):
+        kind = (request.data.get('kind') or '').lower()
+        params = request.data.get('params')
+        if not isinstance(params, dict):
+            params = request.data
+        return _enqueue_job_response(request, kind, params)
+
+
+class AdminReportJobDetail(generics.RetrieveAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = __import__('sales.serializers', fromlist=['ReportJobSerializer']).ReportJobSerializer
+    queryset = ReportJob.objects.all()
+
+
+class AdminReportJobDownload(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob.objects.select_related('sales_report', 'audit_report'), pk=pk)
+        if job.status != 'DONE':
+            return Response({'detail': f'El reporte aun no esta listo ({job.status}).', 'status': job.status, 'progress': job.progress}, status=409)
+        fobj, content_type = report_job_file(job)
+        if not fobj:
+            return Response({'detail': 'El trabajo no tiene archivo asociado.'}, status=404)
+        return FileResponse(fobj.open('rb'), as_attachment=False, filename=os.path.basename(fobj.name), content_type=content_type)
+
+
+# --- Export CSV de ventas (no persistente, en streaming) ---
+CSV_STREAM_CHUNK_ROWS = 500
+
+
+class _Echo:
+    """Pseudo-buffer para csv.writer: devuelve la linea en vez de guardarla."""
+    def write(self, value):
+        return value
+
+
+def _gzip_chunks(chunks):
+    import zlib
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> contenedor gzip
+    for chunk in chunks:
+        data = gz.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield gz.flush()
+
+
+class CSVStreamRenderer(renderers.BaseRenderer):
+    """Permite negociar Accept: text/csv; el cuerpo real lo arma StreamingHttpResponse."""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, str)):
+            return data
+        return json.dumps(data, ensure_ascii=False)
+
+
+def _wants_gzip(request):
+    flag = str(request.data.get('gzip') or request.query_params.get('gzip') or '').lower()
+    accepts = 'gzip' in (request.META.get('HTTP_ACCEPT_ENCODING') or '').lower()
+    return accepts and flag in ('1', 'true', 'yes', 'si')
+
+
 class AdminSalesReportExportCSV(APIView):
     permission_classes = [permissions.IsAdminUser]
+    renderer_classes = [renderers.JSONRenderer, CSVStreamRenderer]
+
+    def _rows(self, f):
+        yield ['Reporte de Ventas']
+        yield ['Intervalo', f"{f['date_from'] or '-'} a {f['date_to'] or '-'}"]
+        yield ['Filtros', f"brand={f['brand'] or '-'} category={f['category'] or '-'} min={f['min_price'] or '-'} max={f['max_price'] or '-'}"]
+        yield []
+
+        # el resumen se calcula despues del encabezado para que el primer byte salga de inmediato
+        summary = sales_report_summary(f)
+        yield ['Ã“rdenes', summary['orders_count']]
+        yield ['Ticket promedio', f"{summary['avg_ticket']:.2f}"]
+        yield ['LÃ­neas vendidas', summary['lines_count']]
+        yield ['Total vendido', f"{summary['total']:.2f}"]
+        yield []
+
+        yield ['Totales por Marca']
+        yield ['Marca','Importe']
+        for name, amt in summary['by_brand']:
+            yield [name or 'Sin marca', f"{amt:.2f}"]
+        yield []
+
+        yield ['Totales por CategorÃ­a']
+        yield ['CategorÃ­a','Importe']
+        for name, amt in summary['by_category']:
+            yield [name or 'Sin categorÃ­a', f"{amt:.2f}"]
+        yield []
+
+        yield ['Top 5 por Unidades']
+        yield ['Producto','Unidades']
+        for name, q in summary['top_qty']:
+            yield [name, q]
+        yield []
+
+        yield ['Top 5 por Importe']
+        yield ['Producto','Importe']
+        for name, amt in summary['top_amount']:
+            yield [name, f"{amt:.2f}"]
+        yield []
+
+        # detalle lÃ­neas (cursor del lado del servidor)
+        yield ['Detalle de lÃ­neas']
+        yield ['Orden','Producto','Qty','UnitPrice','LineTotal','Marca','CategorÃ­a','Fecha']
+        for order_id, name, qty, unit_price, line_total, b, c, created_at in iter_sales_report_detail(f, chunk_size=2000):
+            yield [order_id, name, qty, f"{unit_price:.2f}", f"{line_total:.2f}", b or '', c or '', created_at.strftime('%Y-%m-%d %H:%M:%S')]
+
+    def _stream(self, f):
+        w = csv.writer(_Echo())
+        batch = []
+        for row in self._rows(f):
+            batch.append(w.writerow(row))
+            if len(batch) >= CSV_STREAM_CHUNK_ROWS:
+                yield ''.join(batch)
+                batch = []
+        if batch:
+            yield ''.join(batch)
 
     def post(self, request):
         import datetime
-        f = {
-            'date_from': request.data.get('date_from'),
-            'date_to': request.data.get('date_to'),
-            'brand': request.data.get('brand') or '',
-            'category': request.data.get('category') or '',
-            'min_price': request.data.get('min_price') or '',
-            'max_price': request.data.get('max_price') or '',
-        }
-
-        qs_orders = Order.objects.filter(status='PAID').prefetch_related('items__product__brand', 'items__product__category')
-        if f['date_from']:
-            qs_orders = qs_orders.filter(created_at__date__gte=f['date_from'])
-        if f['date_to']:
-            qs_orders = qs_orders.filter(created_at__date__lte=f['date_to'])
-
-        filtered_lines = []
-        orders_set = set()
-        for o in qs_orders:
-            for it in o.items.all():
-                p = it.product
-                if f['brand'] and (not p.brand or p.brand.name.lower() != f['brand'].lower()):
-                    continue
-                if f['category'] and (not p.category or p.category.name.lower() != f['category'].lower()):
-                    continue
-                try:
-                    if f['min_price'] and float(it.unit_price) < float(f['min_price']):
-                        continue
-                    if f['max_price'] and float(it.unit_price) > float(f['max_price']):
-                        continue
-                except Exception:
-                    pass
-                filtered_lines.append(it)
-                orders_set.add(it.order_id)
-
-        total = sum([float(l.line_total) for l in filtered_lines])
-        orders_count = len(orders_set) or 1
-        avg_ticket = total / orders_count
-
-        brand_totals = {}
-        category_totals = {}
-        product_totals_qty = {}
-        product_totals_amt = {}
-        for it in filtered_lines:
-            p = it.product
-            b = (p.brand.name if p.brand else 'Sin marca')
-            c = (p.category.name if p.category else 'Sin categorÃ­a')
-            brand_totals[b] = brand_totals.get(b, 0.0) + float(it.line_total)
-            category_totals[c] = category_totals.get(c, 0.0) + float(it.line_total)
-            key = it.name_snapshot
-            product_totals_qty[key] = product_totals_qty.get(key, 0) + int(it.qty)
-            product_totals_amt[key] = product_totals_amt.get(key, 0.0) + float(it.line_total)
-        top5_qty = sorted(product_totals_qty.items(), key=lambda x: x[1], reverse=True)[:5]
-        top5_amt = sorted(product_totals_amt.items(), key=lambda x: x[1], reverse=True)[:5]
-
-        # armar CSV (mÃºltiples secciones)
-        sio = StringIO()
-        w = csv.writer(sio)
-        w.writerow(['Reporte de Ventas'])
-        w.writerow(['Intervalo', f"{f['date_from'] or '-'} a {f['date_to'] or '-'}"])
-        w.writerow(['Filtros', f"brand={f['brand'] or '-'} category={f['category'] or '-'} min={f['min_price'] or '-'} max={f['max_price'] or '-'}"])
-        w.writerow([])
-        w.writerow(['Ã“rdenes', orders_count])
-        w.writerow(['Ticket promedio', f"{avg_ticket:.2f}"])
-        w.writerow(['LÃ­neas vendidas', len(filtered_lines)])
-        w.writerow(['Total vendido', f"{total:.2f}"])
-        w.writerow([])
-
-        w.writerow(['Totales por Marca'])
-        w.writerow(['Marca','Importe'])
-        for name, amt in sorted(brand_totals.items(), key=lambda x: x[1], reverse=True):
-            w.writerow([name, f"{amt:.2f}"])
-        w.writerow([])
-
-        w.writerow(['Totales por CategorÃ­a'])
-        w.writerow(['CategorÃ­a','Importe'])
-        for name, amt in sorted(category_totals.items(), key=lambda x: x[1], reverse=True):
-            w.writerow([name, f"{amt:.2f}"])
-        w.writerow([])
-
-        w.writerow(['Top 5 por Unidades'])
-        w.writerow(['Producto','Unidades'])
-        for name, q in top5_qty:
-            w.writerow([name, q])
-        w.writerow([])
-
-        w.writerow(['Top 5 por Importe'])
-        w.writerow(['Producto','Importe'])
-        for name, amt in top5_amt:
-            w.writerow([name, f"{amt:.2f}"])
-        w.writerow([])
-
-        # detalle lÃ­neas
-        w.writerow(['Detalle de lÃ­neas'])
-        w.writerow(['Orden','Producto','Qty','UnitPrice','LineTotal','Marca','CategorÃ­a','Fecha'])
-        for it in filtered_lines:
-            p = it.product
-            b = (p.brand.name if p.brand else '')
-            c = (p.category.name if p.category else '')
-            w.writerow([it.order_id, it.name_snapshot, it.qty, f"{float(it.unit_price):.2f}", f"{float(it.line_total):.2f}", b, c, it.order.created_at.strftime('%Y-%m-%d %H:%M:%S')])
-
+        try:
+            f = validate_sales_report_filters(build_sales_report_filters(request.data))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        chunks = self._stream(f)
         filename = f"sales_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        sio.seek(0)
-        resp = Response(sio.getvalue(), content_type='text/csv; charset=utf-8')
+        if _wants_gzip(request):
+            resp = StreamingHttpResponse(_gzip_chunks(chunks), content_type='text/csv; charset=utf-8')
+            resp['Content-Encoding'] = 'gzip'
+        else:
+            resp = StreamingHttpResponse(chunks, content_type='text/csv; charset=utf-8')
         resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+        resp['Vary'] = 'Accept-Encoding'
+        return resp
+
+
+class AdminSalesReportExportColumnar(APIView):
+    """
+    Detalle de ventas en Parquet (file_format=parquet, default) o Feather (file_format=feather)
+    con los filtros del reporte; se escribe por lotes mientras se envia (ver sales/columnar.py).
+    El parametro no se llama `format` porque DRF lo reserva en la URL para elegir renderer.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        fmt = str(request.data.get('file_format') or request.query_params.get('file_format') or 'parquet').lower()
+        if fmt not in COLUMNAR_FORMATS:
+            return Response({'detail': f"Formato no soportado: {fmt} (opciones: {', '.join(COLUMNAR_FORMATS)})"}, status=400)
+        if not columnar_available():
+            return Response({'detail': 'Export columnar no disponible: falta instalar pyarrow'}, status=501)
+        try:
+            f = validate_sales_report_filters(build_sales_report_filters(request.data))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        extension, content_type = COLUMNAR_FORMATS[fmt]
+        resp = StreamingHttpResponse(iter_sales_columnar(f, fmt), content_type=content_type)
+        resp['Content-Disposition'] = f'attachment; filename="sales_lines_{localtime():%Y%m%d_%H%M%S}.{extension}"'
         return resp
 
 
@@ -1127,123 +1144,56 @@ class PaymentStartQRView(APIView):
         return Response(result)
 
 
-class StripeWebhookView(APIView):
+class PaymentWebhookView(APIView):
+    """
+    Recibe el webhook, lo deja en PaymentWebhookEvent y responde de inmediato.
+    La confirmacion de la orden la hace `manage.py process_payment_webhooks`.
+    """
     permission_classes = [permissions.AllowAny]
+    authentication_classes = []
     renderer_classes = [renderers.JSONRenderer]
+    provider = None
 
     def post(self, request):
-        try:
-            payload = json.loads(request.body.decode('utf-8') or '{}')
-        except Exception:
-            payload = {}
-        ext = payload.get('external_reference') or payload.get('metadata', {}).get('order_id')
-        status = (payload.get('status') or '').lower()
-        success = status in ('paid', 'approved', 'succeeded', 'success')
-        if ext and success:
-            order = Order.objects.filter(transaction_number=ext).first()
-            if order and order.status == 'PENDING':
-                order.status = 'PAID'
-                order.paid_at = now()
-                order.save(update_fields=['status', 'paid_at'])
-                try:
-                    adjust_stock_on_paid(order)
-                except Exception:
-                    pass
-        return Response({'ok': True})
+        event_id = record_webhook_event(self.provider, request.body)
+        return Response({'ok': True, 'event_id': event_id})
 
 
-class MercadoPagoWebhookView(APIView):
-    permission_classes = [permissions.AllowAny]
-    renderer_classes = [renderers.JSONRenderer]
-
-    def post(self, request):
-        try:
-            payload = json.loads(request.body.decode('utf-8') or '{}')
-        except Exception:
-            payload = {}
-        ext = payload.get('external_reference') or payload.get('order_id')
-        status = (payload.get('status') or payload.get('type') or '').lower()
-        success = status in ('paid', 'approved', 'success')
-        if ext and success:
-            order = Order.objects.filter(transaction_number=ext).first()
-            if order and order.status == 'PENDING':
-                order.status = 'PAID'
-                order.paid_at = now()
-                order.save(update_fields=['status', 'paid_at'])
-                try:
-                    adjust_stock_on_paid(order)
-                except Exception:
-                    pass
-        return Response({'ok': True})
+class StripeWebhookView(PaymentWebhookView):
+    provider = 'stripe'
 
 
-class CucuWebhookView(APIView):
-    permission_classes = [permissions.AllowAny]
-    renderer_classes = [renderers.JSONRenderer]
+class MercadoPagoWebhookView(PaymentWebhookView):
+    provider = 'mp'
 
-    def post(self, request):
-        try:
-            payload = json.loads(request.body.decode('utf-8') or '{}')
-        except Exception:
-            payload = {}
-        ext = payload.get('external_reference') or payload.get('order_id')
-        status = (payload.get('status') or '').lower()
-        paid_flag = bool(payload.get('paid') or payload.get('success') or (status in ('paid', 'approved', 'success')))
-        if ext and paid_flag:
-            order = Order.objects.filter(transaction_number=ext).first()
-            if order and order.status == 'PENDING':
-                order.status = 'PAID'
-                order.paid_at = now()
-                order.save(update_fields=['status', 'paid_at'])
-                try:
-                    adjust_stock_on_paid(order)
-                except Exception:
-                    pass
-        return Response({'ok': True})
 
+class CucuWebhookView(PaymentWebhookView):
+    provider = 'cucu'
 
-class BNBWebhookView(APIView):
-    permission_classes = [permissions.AllowAny]
 
-    def post(self, request):
-        try:
-            payload = json.loads(request.body.decode('utf-8') or '{}')
-        except Exception:
-            payload = {}
-        ext = payload.get('external_reference') or payload.get('externalRef') or payload.get('order_code') or payload.get('order_id')
-        state = (payload.get('state') or payload.get('status') or '').lower()
-        paid = state in ('paid', 'approved', 'success', 'completed') or bool(payload.get('paid'))
-        if ext and paid:
-            order = Order.objects.filter(transaction_number=ext).first()
-            if order and order.status == 'PENDING':
-                order.status = 'PAID'
-                order.paid_at = now()
-                order.save(update_fields=['status', 'paid_at'])
-                try:
-                    adjust_stock_on_paid(order)
-                except Exception:
-                    pass
-        return Response({'ok': True})
+class BNBWebhookView(PaymentWebhookView):
+    provider = 'bnb'
 
 
 class AdminPendingPaymentsList(generics.ListAPIView):
     permission_classes = [permissions.IsAdminUser]
     serializer_class = OrderSerializer
+    pagination_class = AdminPagination
 
     def get_queryset(self):
-        return Order.objects.filter(status='PENDING').order_by('-created_at')
+        return Order.objects.filter(status='PENDING').prefetch_related('items').order_by('-created_at')
 
 
 class AdminCreateLocalSale(APIView):
     permission_classes = [permissions.IsAdminUser]
 
+    @transaction.atomic
     def post(self, request):
         items = request.data.get('items') or []
         method = (request.data.get('payment_method') or 'CASH').upper()
         if not items or not isinstance(items, list):
             return Response({'detail': 'items requerido (lista de {product_id, qty})'}, status=400)
-        subtotal = Decimal('0')
-        order_items = []
+        wanted = []
         for it in items:
             try:
                 pid = int(it.get('product_id'))
@@ -1252,7 +1202,15 @@ class AdminCreateLocalSale(APIView):
                 return Response({'detail': 'items invalidos'}, status=400)
             if qty <= 0:
                 return Response({'detail': 'qty > 0'}, status=400)
-            prod = get_object_or_404(Product, pk=pid, is_active=True)
+            wanted.append((pid, qty))
+        products = Product.objects.filter(is_active=True).in_bulk({pid for pid, _ in wanted})
+        missing = sorted({pid for pid, _ in wanted if pid not in products})
+        if missing:
+            return Response({'detail': f'Producto no encontrado: {missing}'}, status=404)
+        subtotal = Decimal('0')
+        order_items = []
+        for pid, qty in wanted:
+            prod = products[pid]
             price = Decimal(str(prod.final_price))
             subtotal += price * qty
             order_items.append((prod, qty, price))
@@ -1261,6 +1219,7 @@ class AdminCreateLocalSale(APIView):
         shipping_total = Decimal('0')
         grand_total = subtotal - discount_total + tax_total + shipping_total
         user = request.user
+        from datetime import timedelta
         order = Order.objects.create(
             user=user,
             status='PAID' if method == 'CASH' else 'PENDING',
@@ -1268,26 +1227,10 @@ class AdminCreateLocalSale(APIView):
             transaction_status='VALID',
             subtotal=subtotal, discount_total=discount_total, tax_total=tax_total,
             shipping_total=shipping_total, grand_total=grand_total, payment_method=method,
+            paid_at=now() if method == 'CASH' else None,
+            payment_due_at=None if method == 'CASH' else now() + timedelta(days=7),
         )
-        from datetime import date, timedelta
-        from dateutil.relativedelta import relativedelta
-        if method != 'CASH':
-            order.payment_due_at = now() + timedelta(days=7)
-            order.save(update_fields=['payment_due_at'])
-        else:
-            order.paid_at = now()
-            order.save(update_fields=['paid_at'])
-        today = date.today()
-        for prod, qty, price in order_items:
-            wmonths = prod.warranty_months or 0
-            wexp = (today + relativedelta(months=wmonths)) if wmonths > 0 else None
-            OrderItem.objects.create(
-                order=order, product=prod,
-                name_snapshot=prod.name,
-                color_snapshot=prod.color, size_snapshot=prod.size,
-                warranty_months_snapshot=wmonths, warranty_expires_at=wexp,
-                qty=qty, unit_price=price, tax_rate=0, discount=0, line_total=price * qty
-            )
+        OrderItem.objects.bulk_create(build_order_items(order, order_items))
         if method == 'CASH':
             try:
                 adjust_stock_on_paid(order)
@@ -1302,6 +1245,7 @@ class AdminOrderCustomerInfoView(APIView):
     def post(self, request, pk):
         order = get_object_or_404(Order, pk=pk)
         fields = ['customer_name', 'customer_document', 'customer_phone', 'customer_warranty_note']
+        before = {field: getattr(order, field) for field in fields}
         updated = []
         for field in fields:
             if field in request.data:
@@ -1317,7 +1261,7 @@ class AdminOrderCustomerInfoView(APIView):
         if updated:
             order.save(update_fields=updated)
             try:
-                log_admin_action(request.user, 'UPDATE_ORDER_CUSTOMER', 'Order', order.pk, None, order)
+                log_admin_action(request.user, 'UPDATE_ORDER_CUSTOMER', 'Order', order.pk, before, {field: getattr(order, field) for field in fields})
             except Exception:
                 pass
         return Response(OrderSerializer(order).data)
@@ -1326,10 +1270,10 @@ class AdminOrderCustomerInfoView(APIView):
 class OrderDetailOwnerView(generics.RetrieveAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = OrderSerializer
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related('items')
 
     def get(self, request, pk):
-        obj = get_object_or_404(Order, pk=pk)
+        obj = get_object_or_404(self.get_queryset(), pk=pk)
         if (obj.user_id != request.user.id) and (not request.user.is_staff):
             return Response({'detail': 'No autorizado'}, status=403)
         return Response(OrderSerializer(obj).data)
@@ -1337,17 +1281,47 @@ class OrderDetailOwnerView(generics.RetrieveAPIView):
 
 # --------- ADMIN: ML & REPORTES (Prompt) ---------
 class AdminMLTrain(APIView):
+    """
+    Con async=1 encola un ForecastTrainingJob (lo procesa `train_forecast`) y responde 202;
+    solo entrena aqui si el scope aun no tiene modelo, para que predict pueda responder.
+    """
     permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
         scope = (request.data.get('scope') or 'total').lower()
+        full = str(request.data.get('full') or '').lower() in ('1', 'true', 'yes', 'si')
         try:
-            info = train_rf(scope=scope)
+            if _wants_async(request) and model_registry.has_model(scope):
+                job = enqueue_training_job(request.user, scope, full=full)
+                return Response({'ok': True, 'job': ForecastTrainingJobSerializer(job).data}, status=202)
+            info = train_rf(scope=scope, full=full)
             return Response({'ok': True, 'info': info})
         except Exception as exc:
             return Response({'ok': False, 'detail': str(exc)}, status=400)
 
 
+class AdminMLTrainJobList(generics.ListAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = ForecastTrainingJobSerializer
+    pagination_class = AdminPagination
+
+    def get_queryset(self):
+        qs = ForecastTrainingJob.objects.all()
+        status = self.request.query_params.get('status')
+        if status:
+            qs = qs.filter(status=status.upper())
+        scope = self.request.query_params.get('scope')
+        if scope:
+            qs = qs.filter(scope=scope.lower())
+        return qs
+
+
+class AdminMLTrainJobDetail(generics.RetrieveAPIView):
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = ForecastTrainingJobSerializer
+    queryset = ForecastTrainingJob.objects.all()
+
+
 class AdminMLPredict(generics.GenericAPIView):
     permission_classes = [permissions.IsAdminUser]
 
@@ -1357,7 +1331,36 @@ class AdminMLPredict(generics.GenericAPIView):
         category_id = request.query_params.get('category_id')
         try:
             rows = predict_rf(months=months, scope=scope, category_id=category_id)
-            return Response({'results': rows})
+            return Response({'results': rows, 'model': model_registry.metadata(scope)})
+        except ModelNotTrained as exc:
+            return Response({'detail': str(exc)}, status=409)
+        except Exception as exc:
+            return Response({'detail': str(exc)}, status=400)
+
+
+class AdminMLPredictBatch(APIView):
+    """
+    POST {"scope": "category", "category_ids": [1, 2], "horizons": [1, 3, 6]} (o "months": 6)
+    Un solo predict para todos los pares (categoria, mes), con intervalo por dispersion de arboles.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        data = request.data
+        scope = (data.get('scope') or 'total').lower()
+        memoize = str(data.get('memoize', True)).lower() not in ('0', 'false', 'no')
+        try:
+            out = predict_rf_batch(
+                scope=scope,
+                category_ids=data.get('category_ids'),
+                horizons=data.get('horizons'),
+                months=int(data.get('months') or 6),
+                interval=float(data.get('interval') or 0.8),
+                memoize=memoize,
+            )
+            return Response(out)
+        except ModelNotTrained as exc:
+            return Response({'detail': str(exc)}, status=409)
         except Exception as exc:
             return Response({'detail': str(exc)}, status=400)
 
@@ -1379,13 +1382,13 @@ class AdminHistoricalSales(generics.GenericAPIView):
                 e = _dt.strptime(end, '%d/%m/%Y').date()
         except Exception:
             s = e = None
-        qs = build_sales_queryset(start=s, end=e)
+        category_ids = None
         if category_id:
             try:
-                qs = qs.filter(product__category_id=int(category_id))
+                category_ids = [int(category_id)]
             except Exception:
                 pass
-        rows = aggregate_sales(qs, group_by=group)
+        rows = sales_aggregate(group, start=s, end=e, category_ids=category_ids)
         if not rows:
             rows = fallback_aggregate_rows(group, category_id=category_id)
         for row in rows:
@@ -1401,24 +1404,16 @@ class AdminPromptReportView(APIView):
         prompt = request.data.get('prompt') or ''
         if not prompt.strip():
             return Response({'detail': 'prompt requerido'}, status=400)
-        spec = parse_prompt_to_spec(prompt)
         force_format = request.data.get('format') or request.data.get('force_format')
-        if force_format and force_format.lower() in ('pdf', 'excel', 'screen'):
-            spec['format'] = force_format.lower()
-        qs = build_sales_queryset(start=spec.get('start'), end=spec.get('end'), category_ids=spec.get('category_ids'), keyword_key=spec.get('keyword_key'))
-        rows = aggregate_sales(qs, group_by=spec.get('group_by'))
-        if not rows and not spec.get('explicit_range'):
-            cat_id = (spec.get('category_ids') or [None])[0]
-            rows = fallback_aggregate_rows(spec.get('group_by'), category_id=cat_id)
+        if _wants_async(request):
+            fmt = (force_format or '').lower() or parse_prompt_to_spec(prompt).get('format')
+            if fmt in ('pdf', 'excel'):
+                return _enqueue_job_response(request, 'prompt', {'prompt': prompt, 'format': fmt})
+        spec, rows = build_prompt_report(prompt, force_format)
         fmt = spec.get('format')
-        if fmt == 'pdf':
-            pdf_bytes = export_to_pdf(rows, title='Reporte de Ventas')
-            buf = BytesIO(pdf_bytes)
-            return FileResponse(buf, as_attachment=True, filename='reporte.pdf', content_type='application/pdf')
-        if fmt == 'excel':
-            x_bytes = export_to_excel(rows, title='Reporte de Ventas')
-            buf = BytesIO(x_bytes)
-            return FileResponse(buf, as_attachment=True, filename='reporte.xlsx', content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        if fmt in PROMPT_REPORT_FILES:
+            filename, content_type = PROMPT_REPORT_FILES[fmt]
+            return FileResponse(open_prompt_report(rows, fmt), as_attachment=True, filename=filename, content_type=content_type)
         return Response({'results': rows})
 
 
@@ -1471,93 +1466,7 @@ def order_receipt_pdf2(request, pk):
         else:
             return JsonResponse({'detail': 'No autorizado.'}, status=401)
 
-    order = get_object_or_404(Order, pk=pk)
+    order = get_object_or_404(Order.objects.select_related('user'), pk=pk)
     if (order.user_id != request.user.id) and (not request.user.is_staff):
         return JsonResponse({'detail': 'No autorizado.'}, status=403)
-
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.units import mm
-    from reportlab.lib.colors import HexColor, white, black
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
-
-    buf = BytesIO()
-    c = canvas.Canvas(buf, pagesize=A4)
-    W, H = A4
-
-    font = 'Helvetica'; font_bold = 'Helvetica-Bold'
-    try:
-        pdfmetrics.registerFont(TTFont('Arial', 'C\\\Windows\\\Fonts\\\arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'C\\\Windows\\\Fonts\\\arialbd.ttf'))
-        font = 'Arial'; font_bold = 'Arial-Bold'
-    except Exception:
-        try:
-            pdfmetrics.registerFont(TTFont('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'))
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'))
-            font = 'DejaVuSans'; font_bold = 'DejaVuSans-Bold'
-        except Exception:
-            pass
-
-    c.setFillColor(HexColor('#0B6E4F'))
-    c.rect(0, H-30*mm, W, 30*mm, fill=1, stroke=0)
-    c.setFillColor(white)
-    c.setFont(font_bold, 16)
-    c.drawString(20*mm, H-15*mm, 'SmartSales365')
-    c.setFont(font, 10)
-    c.drawRightString(W-20*mm, H-12*mm, 'Comprobante de Compra')
-
-    y = H - 35*mm
-    c.setFillColor(black)
-    c.setFont(font, 10)
-    full_name = order.customer_name or (order.user.get_full_name() or order.user.username)
-    doc = order.customer_document or ''
-    phone = order.customer_phone or ''
-    warranty_note = order.customer_warranty_note or ''
-    c.drawString(20*mm, y, f'Transaccion: {order.transaction_number}'); y -= 6*mm
-    c.drawString(20*mm, y, f'Fecha: {order.created_at.strftime("%Y-%m-%d %H:%M")}'); y -= 6*mm
-    c.drawString(20*mm, y, f'Cliente: {full_name}'); y -= 6*mm
-    if doc:
-        c.drawString(20*mm, y, f'Documento: {doc}'); y -= 6*mm
-    if phone:
-        c.drawString(20*mm, y, f'Telefono: {phone}'); y -= 6*mm
-    y -= 4*mm
-
-    c.setFont(font_bold, 10)
-    c.drawString(20*mm, y, 'Items'); y -= 6*mm
-    c.setFont(font, 10)
-    for it in order.items.all():
-        line = f'{it.qty}x {it.name_snapshot}  @ Bs. {float(it.unit_price):.2f}  = Bs. {float(it.line_total):.2f}'
-        c.drawString(22*mm, y, line); y -= 6*mm
-        if it.warranty_expires_at:
-            c.drawString(24*mm, y, f'Garantia hasta: {it.warranty_expires_at}'); y -= 5*mm
-        if y < 30*mm:
-            c.showPage()
-            c.setFillColor(HexColor('#0B6E4F'))
-            c.rect(0, H-15*mm, W, 15*mm, fill=1, stroke=0)
-            c.setFillColor(white)
-            c.setFont(font_bold, 12)
-            c.drawString(20*mm, H-10*mm, 'SmartSales365 - Comprobante de Compra')
-            c.setFillColor(black)
-            c.setFont(font, 10)
-            y = H - 25*mm
-
-    y -= 5*mm
-    c.setFont(font_bold, 11)
-    c.drawString(20*mm, y, f'Subtotal: Bs. {float(order.subtotal):.2f}'); y -= 6*mm
-    c.drawString(20*mm, y, f'Envio: Bs. {float(order.shipping_total):.2f}  Descuento: Bs. {float(order.discount_total):.2f}  Impuestos: Bs. {float(order.tax_total):.2f}'); y -= 6*mm
-    c.setFillColor(HexColor('#0B6E4F'))
-    c.rect(18*mm, y-2*mm, 60*mm, 8*mm, fill=1, stroke=0)
-    c.setFillColor(white)
-    c.drawString(20*mm, y, f'TOTAL: Bs. {float(order.grand_total):.2f}'); y -= 12*mm
-    c.setFillColor(black)
-    c.setFont(font, 9)
-    c.drawString(20*mm, y, f'Estado: {order.status}  | Transaccion: {order.transaction_status}'); y -= 6*mm
-    if warranty_note:
-        c.drawString(20*mm, y, f'Garantia declarada: {warranty_note}'); y -= 6*mm
-    c.drawString(20*mm, y, 'Gracias por su compra. Conserve este comprobante para garantias.')
-
-    c.showPage()
-    c.save()
-    buf.seek(0)
-    return FileResponse(buf, as_attachment=False, filename=f'receipt_{order.transaction_number}.pdf', content_type='application/pdf')
+    return _receipt_response(request, order)
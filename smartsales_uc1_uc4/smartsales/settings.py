@@ -45,8 +45,33 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sales.middleware.QueryCountMiddleware',
 ]
 
+# Consultas SQL por request a partir de las cuales se loguea un warning (0 = nunca)
+QUERY_COUNT_WARN = int(os.environ.get('QUERY_COUNT_WARN', '30') or 0)
+
+# Segundos que vive una pagina cacheada del catalogo (ProductListView); se invalida antes por version
+CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', '300') or 0)
+# Segundos maximos entre refrescos del indice en memoria del asesor (sales.catalog_index)
+CATALOG_INDEX_MAX_AGE = int(os.environ.get('CATALOG_INDEX_MAX_AGE', '60') or 0)
+# Precargar los modelos de prediccion (MEDIA_ROOT/ml) al iniciar el servidor web (wsgi/asgi)
+ML_WARM_ON_STARTUP = os.environ.get('ML_WARM_ON_STARTUP', '1') == '1'
+# Procesos/hilos para ajustar el modelo (0 = todos los nucleos)
+ML_N_JOBS = int(os.environ.get('ML_N_JOBS', '0') or 0)
+# Estimador de sales.forecasting para el pronostico del asesor (ver `backtest_forecast`)
+ML_SUMMARY_ESTIMATOR = os.environ.get('ML_SUMMARY_ESTIMATOR', 'seasonal_naive')
+# Procesos para renderizar comprobantes del ZIP de admin. 1 (default) = en el proceso web.
+# Con N > 1 cada proceso web crea su propio pool de N procesos Django (spawn) que viven
+# hasta que ese proceso termina: usar un numero chico y contar workers web x N.
+RECEIPT_RENDER_WORKERS = max(1, int(os.environ.get('RECEIPT_RENDER_WORKERS', '1') or 1))
+
+# Bitacora de admin (sales.audit): lote en memoria que se escribe al terminar el request,
+# al llegar a AUDIT_BUFFER_SIZE entradas o cada AUDIT_FLUSH_INTERVAL segundos
+AUDIT_LOG_ASYNC = os.environ.get('AUDIT_LOG_ASYNC', '1') == '1'
+AUDIT_BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', '200') or 1)
+AUDIT_FLUSH_INTERVAL = int(os.environ.get('AUDIT_FLUSH_INTERVAL', '5') or 0)
+
 ROOT_URLCONF = 'smartsales.urls'
 
 TEMPLATES = [
@@ -1,4 +1,8 @@
 import os
 from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'smartsales.settings')
-application = get_wsgi_application()
\ No newline at end of file
+application = get_wsgi_application()
+
+# solo el servidor web precarga los modelos de prediccion (no los comandos de manage.py)
+from sales.ml import warm_on_startup  # noqa: E402
+warm_on_startup()